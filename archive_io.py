@@ -0,0 +1,212 @@
+import argparse
+import io
+import os
+import posixpath
+import shutil
+import tarfile
+import tempfile
+import time
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from batch import IMAGE_EXTENSIONS, list_images, output_path_for, run_job
+from encoders import capture_outputs
+
+# Batches can read their images straight out of a zip or tar archive and write their outputs
+# straight into one, without extracting anything to disk. Members are read one at a time (tar
+# archives as a stream, so compressed tars are never seeked) and handed to the workers as bytes;
+# the outputs come back as bytes and are appended to the output archive in input order.
+
+# Archive formats by extension, and the mode each tar variant is written with
+ARCHIVE_EXTENSIONS = ('.zip', '.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tar.xz', '.txz')
+TAR_WRITE_MODES = {'.tar': 'w|', '.tar.gz': 'w|gz', '.tgz': 'w|gz', '.tar.bz2': 'w|bz2', '.tbz2': 'w|bz2',
+                   '.tar.xz': 'w|xz', '.txz': 'w|xz'}
+
+# Files in flight per worker: submitted, being processed, or done and waiting for their turn to
+# be written. This bounds the memory a batch holds in members and outputs.
+IN_FLIGHT_PER_WORKER = 2
+
+# Whether a batch input or output is an archive rather than a directory
+def is_archive(path):
+    return isinstance(path, str) and path.lower().endswith(ARCHIVE_EXTENSIONS)
+
+# Whether an archive member is an image a batch would pick up from a directory. Hidden files are
+# left out, such as the ._ resource forks macOS adds to zips.
+def is_image_member(name):
+    base_name = posixpath.basename(name)
+    return base_name.endswith(IMAGE_EXTENSIONS) and not base_name.startswith('.')
+
+# The images in an archive, in archive order, as (member name, bytes). Only one member is read
+# at a time; tars (compressed or not) are read as a stream.
+def iter_members(archive_path):
+    if zipfile.is_zipfile(archive_path):
+        with zipfile.ZipFile(archive_path) as archive:
+            for info in archive.infolist():
+                if not info.is_dir() and is_image_member(info.filename):
+                    yield info.filename, archive.read(info)
+        return
+    with tarfile.open(archive_path, 'r|*') as archive:
+        for member in archive:
+            if member.isfile() and is_image_member(member.name):
+                yield member.name, archive.extractfile(member).read()
+
+# Add one file to an open output archive
+def add_member(archive, name, data):
+    if isinstance(archive, zipfile.ZipFile):
+        archive.writestr(name, data)
+        return
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    info.mtime = int(time.time())
+    info.mode = 0o644
+    archive.addfile(info, io.BytesIO(data))
+
+# Open an archive for writing. Yields a function that adds (name, bytes) to it. The archive is
+# written under a hidden name and renamed into place once complete, so a failed batch never leaves
+# half an archive. Images are stored as they are in zips, as they are already compressed.
+@contextmanager
+def output_archive(archive_path):
+    directory, file_name = os.path.split(os.path.abspath(archive_path))
+    os.makedirs(directory, exist_ok=True)
+    partial_path = os.path.join(directory, '.' + file_name)
+    if archive_path.lower().endswith('.zip'):
+        archive = zipfile.ZipFile(partial_path, 'w', zipfile.ZIP_STORED)
+    else:
+        extension = max((ext for ext in TAR_WRITE_MODES if archive_path.lower().endswith(ext)), key=len)
+        archive = tarfile.open(partial_path, TAR_WRITE_MODES[extension])
+    try:
+        with archive:
+            yield lambda name, data: add_member(archive, name, data)
+    except BaseException:
+        os.remove(partial_path)
+        raise
+    os.replace(partial_path, archive_path)
+
+# Output directory for batches that write files as usual. Yields None, as outputs go straight to disk.
+@contextmanager
+def output_directory(output_dir):
+    for directory in (output_dir.values() if isinstance(output_dir, dict) else [output_dir]):
+        os.makedirs(directory, exist_ok=True)
+    yield None
+
+# Run one job in a worker. An archive member arrives as bytes and is opened from memory, under
+# its member name; with capture, the outputs are collected instead of written.
+# Returns the job's result and its outputs (output path -> bytes).
+def run_archive_job(job, capture=False):
+    work_fn, file_name, source, output_path = job
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+        source.name = file_name
+    if not capture:
+        return run_job((work_fn, file_name, source, output_path)), {}
+    outputs = {}
+    with capture_outputs(outputs):
+        result = run_job((work_fn, file_name, source, output_path))
+    return result, outputs
+
+# run_untraced_batch for archives: input_dir and output_dir may each be an archive or a directory.
+# Outputs in an archive are named as they would be inside output_dir, e.g. the member's own path,
+# or <name>_<rendition><ext> for renditions. At most `in_flight` files (IN_FLIGHT_PER_WORKER per
+# worker by default) are held at once. Returns one result dict per file, in input order.
+def run_archive_batch(input_dir, output_dir, work_fn, workers=None, in_flight=None):
+    capture = is_archive(output_dir)
+    if isinstance(output_dir, dict) and any(is_archive(directory) for directory in output_dir.values()):
+        raise ValueError("Outputs of several methods cannot be written to archives; use one archive per method")
+
+    if is_archive(input_dir):
+        sources = iter_members(input_dir)
+    else:
+        sources = ((file_name, os.path.join(input_dir, file_name)) for file_name in list_images(input_dir))
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    in_flight = in_flight or IN_FLIGHT_PER_WORKER * workers
+
+    results = []
+    with (output_archive(output_dir) if capture else output_directory(output_dir)) as add:
+        # Make the job for a file; members in subfolders get the same subfolders in an output directory
+        def make_job(file_name, source):
+            output_path = output_path_for('' if capture else output_dir, file_name)
+            if not capture:
+                for path in (output_path.values() if isinstance(output_path, dict) else [output_path]):
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+            return work_fn, file_name, source, output_path
+
+        # Write a finished file's outputs into the archive
+        def finish(result, outputs):
+            for name, data in outputs.items():
+                add(name, data)
+            results.append(result)
+
+        if workers <= 1:
+            for file_name, source in sources:
+                finish(*run_archive_job(make_job(file_name, source), capture))
+            return results
+
+        # Files are written in the order they were read, so the oldest is waited on first
+        pending = deque()
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for file_name, source in sources:
+                if len(pending) >= in_flight:
+                    finish(*pending.popleft().result())
+                pending.append(executor.submit(run_archive_job, make_job(file_name, source), capture))
+            while pending:
+                finish(*pending.popleft().result())
+    return results
+
+# Pack every file under a directory into an archive, named by their paths relative to it
+def pack_directory(directory, archive_path):
+    with output_archive(archive_path) as add:
+        for root, _, file_names in sorted(os.walk(directory)):
+            for file_name in sorted(file_names):
+                path = os.path.join(root, file_name)
+                with open(path, 'rb') as f:
+                    add(os.path.relpath(path, directory).replace(os.sep, '/'), f.read())
+
+# Throughput of a batch function on an archive, processed directly and by the extract-then-process
+# flow it replaces (extract everything, process the folder, archive the results). Each flow runs
+# `repeats` times and the fastest is kept. Returns seconds and images per second for both.
+def benchmark_archive(archive_path, process, output_path, repeats=3):
+    images = sum(1 for _ in iter_members(archive_path))
+    timings = {'Direct': [], 'Extract Then Process': []}
+    for _ in range(repeats):
+        start = time.perf_counter()
+        process(archive_path, output_path)
+        timings['Direct'].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        work_dir = tempfile.mkdtemp()
+        try:
+            if zipfile.is_zipfile(archive_path):
+                with zipfile.ZipFile(archive_path) as archive:
+                    archive.extractall(os.path.join(work_dir, 'input'))
+            else:
+                with tarfile.open(archive_path) as archive:
+                    archive.extractall(os.path.join(work_dir, 'input'), filter='data')
+            # The extracted folder may hold the images in subfolders; process the one that has them
+            input_dir = next(root for root, _, file_names in sorted(os.walk(os.path.join(work_dir, 'input')))
+                             if any(name.endswith(IMAGE_EXTENSIONS) for name in file_names))
+            process(input_dir, os.path.join(work_dir, 'output'))
+            pack_directory(os.path.join(work_dir, 'output'), output_path)
+        finally:
+            shutil.rmtree(work_dir)
+        timings['Extract Then Process'].append(time.perf_counter() - start)
+
+    return {flow: {'Images': images, 'Seconds': min(seconds), 'Images/s': images / min(seconds)}
+            for flow, seconds in timings.items()}
+
+if __name__ == "__main__":
+    from functools import partial
+    from resize import process_images
+
+    parser = argparse.ArgumentParser(description="Benchmark resizing an archive directly against extracting it first")
+    parser.add_argument('archive')
+    parser.add_argument('output', help="output archive (.zip or .tar[.gz|.bz2|.xz])")
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args()
+
+    timings = benchmark_archive(args.archive, partial(process_images, workers=args.workers), args.output, args.repeats)
+    for flow, timing in timings.items():
+        print(f"{flow}: {timing['Images']} images in {timing['Seconds']:.2f}s ({timing['Images/s']:.2f} images/s)")
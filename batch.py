@@ -0,0 +1,147 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from manifest import load_manifest, save_manifest, split_jobs, record_results
+from tracing import enable_tracing, tracing_enabled, record_traces
+
+# File extensions picked up by every batch loop
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+# List the image files in a directory, in a stable order
+def list_images(input_dir):
+    return sorted(file_name for file_name in os.listdir(input_dir) if file_name.endswith(IMAGE_EXTENSIONS))
+
+# Run one work unit and turn any failure into a result row instead of an exception
+def run_job(job):
+    work_fn, file_name, img_path, output_path = job
+    try:
+        # Work units may return extra result fields, e.g. the encoder's choices or a 'Trace' record
+        extra = work_fn(img_path, output_path)
+        result = {'File': file_name, 'Output': output_path, 'Success': True, 'Error': None}
+        result.update(extra or {})
+        return result
+    except Exception as e:
+        return {'File': file_name, 'Output': output_path, 'Success': False, 'Error': f"{type(e).__name__}: {e}"}
+
+# Output path for a file; when output_dir is a dict of named directories, a dict of paths
+def output_path_for(output_dir, file_name):
+    if isinstance(output_dir, dict):
+        return {name: os.path.join(directory, file_name) for name, directory in output_dir.items()}
+    return os.path.join(output_dir, file_name)
+
+# Apply work_fn(img_path, output_path) to every image in input_dir, using a process pool
+# when more than one worker is requested. Returns one result dict per file.
+# With a manifest_path the run is incremental: files whose content hash and params are already
+# recorded there (and whose outputs exist) are skipped and reported with 'Skipped': True. Outputs
+# recorded for sources that are gone or were redone under other parameters are deleted.
+# With a trace_path, the 'Trace' records returned by the work units are appended there as JSONL.
+# With a memory_budget (MB), jobs are admitted by their estimated peak memory (see scheduler.py);
+# estimate(img_path) overrides the default header-based estimate, and a stats dict is filled with
+# the batch's peak resident memory.
+# With dedupe ('reuse' or 'report'), near-duplicates of an earlier file (by perceptual hash, see
+# phash.py) are not processed: they get a copy of that file's outputs, or are only reported.
+def run_batch(input_dir, output_dir, work_fn, workers=None, manifest_path=None, params=None, trace_path=None,
+              memory_budget=None, estimate=None, stats=None, dedupe=None):
+    budget = (memory_budget, estimate, stats)
+    if trace_path is None:
+        return run_untraced_batch(input_dir, output_dir, work_fn, workers, manifest_path, params, budget, dedupe)
+
+    was_enabled = tracing_enabled()
+    enable_tracing()
+    try:
+        results = run_untraced_batch(input_dir, output_dir, work_fn, workers, manifest_path, params, budget, dedupe)
+    finally:
+        enable_tracing(was_enabled)
+    record_traces([result['Trace'] for result in results if result.get('Trace') is not None], trace_path)
+    return results
+
+# run_batch without the trace file handling; budget is (memory_budget, estimate, stats)
+# input_dir and output_dir may also be zip or tar archives, which are read and written directly
+# (see archive_io.py)
+def run_untraced_batch(input_dir, output_dir, work_fn, workers=None, manifest_path=None, params=None,
+                       budget=(None, None, None), dedupe=None):
+    from archive_io import is_archive, run_archive_batch
+    if dedupe is not None:
+        from phash import check_dedupe
+        check_dedupe(dedupe)
+    output_dirs = output_dir.values() if isinstance(output_dir, dict) else [output_dir]
+    if is_archive(input_dir) or any(is_archive(directory) for directory in output_dirs):
+        if manifest_path is not None or budget[0] is not None or dedupe is not None:
+            raise ValueError("Incremental runs, memory budgets and dedupe need folders, not archives")
+        return run_archive_batch(input_dir, output_dir, work_fn, workers)
+
+    for directory in output_dirs:
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+    jobs = [(work_fn, file_name, os.path.join(input_dir, file_name), output_path_for(output_dir, file_name))
+            for file_name in list_images(input_dir)]
+
+    duplicates = []
+    if dedupe is not None:
+        from phash import split_duplicates
+        jobs, duplicates = split_duplicates(jobs)
+
+    if manifest_path is None:
+        results = run_jobs(jobs, workers, *budget)
+    else:
+        manifest = load_manifest(manifest_path)
+        jobs, skipped, entries = split_jobs(manifest, jobs, params or {})
+        results = run_jobs(jobs, workers, *budget)
+        for result in results:
+            result['Skipped'] = False
+        manifest, removed = record_results(manifest, skipped + results, entries)
+        save_manifest(manifest_path, manifest)
+        if removed:
+            print(f"Removed {len(removed)} outdated output{'' if len(removed) == 1 else 's'} from {os.path.dirname(manifest_path)}")
+        results = skipped + results
+
+    if duplicates:
+        from phash import duplicate_results
+        results += duplicate_results(duplicates, results, dedupe)
+    return results
+
+# Run a list of jobs inline or on a process pool, or under a memory budget (see scheduler.run_budgeted)
+def run_jobs(jobs, workers=None, memory_budget=None, estimate=None, stats=None):
+    if memory_budget is not None and jobs:
+        from scheduler import run_budgeted, estimate_memory
+        return run_budgeted(jobs, memory_budget, workers, estimate or estimate_memory, stats)
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = min(workers, len(jobs))
+
+    if workers <= 1:
+        return [run_job(job) for job in jobs]
+
+    # Hand out several files per task so IPC overhead stays small next to the image work
+    chunksize = max(1, len(jobs) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(run_job, jobs, chunksize=chunksize))
+
+# Whether a result has an output that missed its byte budget ('Within Budget' is a dict for
+# batches writing several outputs per file)
+def over_budget(result):
+    within = result.get('Within Budget')
+    return False in (within.values() if isinstance(within, dict) else [within])
+
+# Print a one-line summary plus any failures and outputs over their byte budget for a list of
+# batch results
+def report_results(results, label="Batch"):
+    failures = [r for r in results if not r['Success']]
+    skipped = [r for r in results if r.get('Skipped')]
+    duplicates = [r for r in results if r.get('Duplicate Of') and r['Success']]
+    over = [r for r in results if r['Success'] and over_budget(r)]
+    summary = f"{label}: {len(results) - len(failures) - len(skipped) - len(duplicates)} processed, {len(skipped)} unchanged, "
+    if duplicates:
+        summary += f"{len(duplicates)} near-duplicates, "
+    if over:
+        summary += f"{len(over)} over budget, "
+    print(summary + f"{len(failures)} failed")
+    for r in failures:
+        print(f"  Failed {r['File']}: {r['Error']}")
+    for r in over:
+        if isinstance(r['Within Budget'], dict):
+            names = [name for name, within in r['Within Budget'].items() if within is False]
+            print(f"  Over budget {r['File']}: " + ', '.join(f"{name} {r['Bytes'][name]} bytes" for name in names))
+        else:
+            print(f"  Over budget {r['File']}: {r['Bytes']} bytes at quality {r['Quality']}")
@@ -0,0 +1,225 @@
+import argparse
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from multiprocessing import get_context
+import numpy as np
+from PIL import Image, ImageOps
+from batch import list_images
+
+# Stages reported for every method, in pipeline order
+STAGES = ['decode', 'dominant_color', 'resample', 'pad', 'encode', 'metrics']
+
+# Default regression threshold when comparing two result files (10% slower)
+REGRESSION_THRESHOLD = 0.10
+
+# Stages faster than this in both runs are too noisy to flag (seconds)
+NOISE_FLOOR = 0.01
+
+# Add the time spent inside the block to timings[stage]
+@contextmanager
+def timed(timings, stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - start
+
+# Encode to memory in the format the file would be saved as, so disk speed stays out of the numbers
+def encode_pil(img, file_name):
+    buffer = io.BytesIO()
+    img.save(buffer, format='PNG' if file_name.endswith('.png') else 'JPEG')
+    return buffer.getvalue()
+
+# resize.py: reduced decode, dominant color fill, LANCZOS and padding to 1080x1350
+def bench_resize_with_padding(img_path, timings):
+    from resize import decode_for_target, get_dominant_color, pad_to_target
+    with timed(timings, 'decode'):
+        img, new_size = decode_for_target(img_path)
+    with timed(timings, 'dominant_color'):
+        dominant_color = get_dominant_color(img)
+    with timed(timings, 'resample'):
+        img_resized = img.resize(new_size, Image.Resampling.LANCZOS)
+    with timed(timings, 'pad'):
+        new_img = pad_to_target(img_resized, 1080, 1350, dominant_color)
+    with timed(timings, 'encode'):
+        encode_pil(new_img, img_path)
+    return new_img
+
+# process_images.py: Simple Resize
+def bench_simple(img_path, timings):
+    from process_images import decode_image, simple_resize
+    with timed(timings, 'decode'):
+        img, _ = decode_image(img_path, need_array=False)
+    with timed(timings, 'resample'):
+        img_resized = simple_resize(img)
+    with timed(timings, 'encode'):
+        encode_pil(img_resized, img_path)
+    return img_resized
+
+# process_images.py: Padding Resize
+def bench_padding(img_path, timings):
+    from process_images import decode_image, padding_resize
+    with timed(timings, 'decode'):
+        img, _ = decode_image(img_path, need_array=False)
+    with timed(timings, 'pad'):
+        new_img = padding_resize(img)
+    with timed(timings, 'encode'):
+        encode_pil(new_img, img_path)
+    return new_img
+
+# process_images.py: Content-Aware Resize
+def bench_content_aware(img_path, timings):
+    import cv2
+    from process_images import decode_image, content_aware_resize
+    with timed(timings, 'decode'):
+        _, pixels = decode_image(img_path)
+    with timed(timings, 'resample'):
+        resized = content_aware_resize(pixels)
+    with timed(timings, 'encode'):
+        cv2.imencode('.png' if img_path.endswith('.png') else '.jpg', cv2.cvtColor(resized, cv2.COLOR_RGB2BGR))
+    return Image.fromarray(resized)
+
+# Methods covered by the suite
+BENCHMARKS = {
+    'Resize With Padding': bench_resize_with_padding,
+    'Simple Resize': bench_simple,
+    'Padding Resize': bench_padding,
+    'Content-Aware Resize': bench_content_aware,
+}
+
+# Write a deterministic synthetic set of `megapixels`-sized images with corpus.py: photo-like content
+# in the corpus's mix of aspect ratios, JPEG/PNG, RGB/RGBA/palette modes and EXIF orientations
+def generate_synthetic_set(output_dir, count=20, megapixels=12, seed=0, workers=None):
+    from corpus import generate_corpus
+    generate_corpus(output_dir, count, seed, workers, megapixels=[(megapixels, 1.0)])
+    return output_dir
+
+# Time one method over a set of images: warmup passes first, then `repeats` timed passes.
+# Runs in its own process so the peak RSS belongs to this method alone.
+def run_method(method, input_dir, warmup=1, repeats=3):
+    from test_image_quality import compute_metrics
+    bench = BENCHMARKS[method]
+    img_paths = [os.path.join(input_dir, file_name) for file_name in list_images(input_dir)]
+
+    megapixels = 0.0
+    for img_path in img_paths:
+        with Image.open(img_path) as img:
+            megapixels += img.size[0] * img.size[1] / 1e6
+
+    iterations = []
+    for i in range(warmup + repeats):
+        timings = dict.fromkeys(STAGES, 0.0)
+        start = time.perf_counter()
+        for img_path in img_paths:
+            output = bench(img_path, timings)
+            with timed(timings, 'metrics'):
+                compute_metrics(np.array(ImageOps.grayscale(Image.open(img_path))), output)
+        if i >= warmup:
+            timings['total'] = time.perf_counter() - start
+            iterations.append(timings)
+
+    # Median over the timed passes, stage by stage
+    stages = {stage: float(np.median([t[stage] for t in iterations])) for stage in STAGES + ['total']}
+    total = stages['total']
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {
+        'images': len(img_paths),
+        'megapixels': megapixels,
+        'stages': stages,
+        'images_per_s': len(img_paths) / total if total else 0.0,
+        'megapixels_per_s': megapixels / total if total else 0.0,
+        # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+        'peak_rss_mb': peak_rss / (1 << 20) if sys.platform == 'darwin' else peak_rss / 1024,
+    }
+
+# Run every method on every input set, each method in a fresh process
+def run_suite(input_sets, methods=None, warmup=1, repeats=3):
+    results = {}
+    context = get_context('spawn')
+    for set_name, input_dir in input_sets.items():
+        results[set_name] = {}
+        for method in methods or BENCHMARKS:
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                results[set_name][method] = executor.submit(run_method, method, input_dir, warmup, repeats).result()
+            summary = results[set_name][method]
+            print(f"{set_name} / {method}: {summary['images_per_s']:.2f} images/s, "
+                  f"{summary['megapixels_per_s']:.1f} MP/s, peak RSS {summary['peak_rss_mb']:.0f} MB")
+    return results
+
+# Current commit, so saved results can be matched to the code that produced them
+def current_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+# Save suite results as JSON
+def save_results(results, output_path):
+    with open(output_path, 'w') as f:
+        json.dump({'commit': current_commit(), 'timestamp': time.time(), 'results': results}, f, indent=2)
+
+# Compare two saved result files and flag every stage or total that got slower than the threshold
+def compare_results(baseline_path, current_path, threshold=REGRESSION_THRESHOLD):
+    with open(baseline_path) as f:
+        baseline = json.load(f)['results']
+    with open(current_path) as f:
+        current = json.load(f)['results']
+
+    rows = []
+    for set_name, methods in current.items():
+        for method, summary in methods.items():
+            base_summary = baseline.get(set_name, {}).get(method)
+            if base_summary is None:
+                continue
+            for stage, seconds in summary['stages'].items():
+                base_seconds = base_summary['stages'].get(stage, 0.0)
+                if base_seconds < NOISE_FLOOR and seconds < NOISE_FLOOR:
+                    continue
+                change = (seconds - base_seconds) / base_seconds if base_seconds else float('inf')
+                rows.append({
+                    'Set': set_name,
+                    'Method': method,
+                    'Stage': stage,
+                    'Baseline (s)': base_seconds,
+                    'Current (s)': seconds,
+                    'Change': change,
+                    'Regression': change > threshold
+                })
+    return rows
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stage-level benchmark of the resize methods")
+    parser.add_argument('--frozen-dir', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'frozen_test_images'))
+    parser.add_argument('--synthetic-dir', default='benchmark_images')
+    parser.add_argument('--synthetic-count', type=int, default=10)
+    parser.add_argument('--synthetic-megapixels', type=float, default=12)
+    parser.add_argument('--warmup', type=int, default=1)
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--baseline', help="earlier results file to check for regressions")
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD)
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.synthetic_dir) or not list_images(args.synthetic_dir):
+        generate_synthetic_set(args.synthetic_dir, args.synthetic_count, args.synthetic_megapixels)
+
+    suite = run_suite({'frozen_test_images': args.frozen_dir, 'synthetic': args.synthetic_dir},
+                      warmup=args.warmup, repeats=args.repeats)
+    save_results(suite, args.output)
+    print(f"Benchmark results saved to {args.output}")
+
+    if args.baseline:
+        regressions = [row for row in compare_results(args.baseline, args.output, args.threshold) if row['Regression']]
+        for row in regressions:
+            print(f"REGRESSION {row['Set']} / {row['Method']} / {row['Stage']}: "
+                  f"{row['Baseline (s)']:.3f}s -> {row['Current (s)']:.3f}s ({row['Change']:+.0%})")
+        if regressions:
+            sys.exit(1)
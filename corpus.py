@@ -0,0 +1,202 @@
+import argparse
+import hashlib
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from statistics import NormalDist
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+# Size distribution: (megapixels, weight). Mostly phone photos, with some large and small outliers.
+MEGAPIXELS = [(12, 0.55), (24, 0.15), (48, 0.1), (3, 0.1), (0.5, 0.1)]
+
+# Aspect ratio (width / height) distribution: (aspect, weight)
+ASPECTS = [(4 / 3, 0.3), (3 / 4, 0.3), (16 / 9, 0.1), (9 / 16, 0.1), (1.0, 0.1), (3.0, 0.05), (2 / 3, 0.05)]
+
+# Output variants: (format, mode, weight)
+VARIANTS = [('JPEG', 'RGB', 0.7), ('PNG', 'RGB', 0.1), ('PNG', 'RGBA', 0.1), ('PNG', 'P', 0.1)]
+
+# Share of JPEGs given an EXIF orientation tag (2-8; 1 is the plain orientation)
+ORIENTATION_RATE = 0.3
+
+# EXIF tag number of Orientation
+ORIENTATION_TAG = 0x0112
+
+# Rows of the image noise is added to at a time, to keep large images within memory
+NOISE_STRIP = 512
+
+# Detail below this scale comes from the text and noise, so the gradient and texture are built
+# at 1/BASE_SCALE of the image size and scaled up
+BASE_SCALE = 4
+
+# Characters the text-like detail is drawn from
+TEXT_CHARACTERS = 'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789 .,-'
+
+# Random generator for one image of a corpus. Each index has its own stream spawned from the
+# corpus seed, so an image never depends on which worker draws it or in what order.
+def image_rng(seed, index):
+    return np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(index,)))
+
+# Random stream for an image's content: a child of the image's seed sequence, so it shares no
+# state with the draws image_spec makes
+def content_rng(seed, index):
+    return np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(index,)).spawn(1)[0])
+
+# Pick one value from a [(value, weight), ...] distribution
+def weighted_choice(rng, distribution):
+    weights = np.array([entry[-1] for entry in distribution], dtype=np.float64)
+    return distribution[rng.choice(len(distribution), p=weights / weights.sum())]
+
+# Everything about one image that is drawn before rendering: size, format, mode, orientation
+def image_spec(seed, index, megapixels=MEGAPIXELS, aspects=ASPECTS, variants=VARIANTS,
+               orientation_rate=ORIENTATION_RATE):
+    rng = image_rng(seed, index)
+    pixels = weighted_choice(rng, megapixels)[0] * 1e6 * rng.uniform(0.9, 1.1)
+    aspect = weighted_choice(rng, aspects)[0]
+    image_format, mode, _ = weighted_choice(rng, variants)
+    orientation = 1
+    if image_format == 'JPEG' and rng.random() < orientation_rate:
+        orientation = int(rng.integers(2, 9))
+    height = max(16, int(np.sqrt(pixels / aspect)))
+    width = max(16, int(height * aspect))
+    extension = '.jpg' if image_format == 'JPEG' else '.png'
+    return {'Index': index, 'File': f"corpus_{index:06d}{extension}", 'Width': width, 'Height': height,
+            'Format': image_format, 'Mode': mode, 'Orientation': orientation,
+            'Quality': int(rng.integers(80, 96)), 'Seed': seed}
+
+# Smooth random field in [0, 1): octaves of random grids, each twice as fine as the last and
+# `persistence` times as strong, scaled up to the given size
+def smooth_field(rng, width, height, octaves=4, base_cells=4, persistence=0.5):
+    field = np.zeros((height, width), dtype=np.float32)
+    total = 0.0
+    for octave in range(octaves):
+        cells = base_cells * 2 ** octave
+        grid = rng.integers(0, 256, size=(cells, max(2, round(cells * width / height))), dtype=np.uint8)
+        weight = persistence ** octave
+        field += weight * np.asarray(Image.fromarray(grid).resize((width, height), Image.Resampling.BICUBIC), dtype=np.float32)
+        total += weight
+    return field / (256 * total)
+
+# Photo-like RGB content: a colored gradient with shapes (edges) and texture from coarse to a few
+# pixels fine, text-like detail, then sensor-like noise
+def render_content(rng, width, height):
+    # Gradient between two colors along a random direction, at reduced size
+    base_width, base_height = max(2, width // BASE_SCALE), max(2, height // BASE_SCALE)
+    angle = rng.uniform(0, 2 * np.pi)
+    ramp = (np.cos(angle) * np.linspace(-1, 1, base_width, dtype=np.float32)[None, :]
+            + np.sin(angle) * np.linspace(-1, 1, base_height, dtype=np.float32)[:, None])
+    ramp = (ramp - ramp.min()) / max(float(np.ptp(ramp)), 1e-6)
+    start, end = rng.uniform(0, 255, size=3), rng.uniform(0, 255, size=3)
+    base = np.stack([start[c] + (end[c] - start[c]) * ramp for c in range(3)], axis=-1)
+    base_img = Image.fromarray(np.clip(base, 0, 255).astype(np.uint8))
+
+    # Shapes give the scene objects and hard edges
+    draw = ImageDraw.Draw(base_img)
+    for _ in range(int(rng.integers(5, 30))):
+        x, y = rng.uniform(0, base_width), rng.uniform(0, base_height)
+        radius = rng.uniform(0.02, 0.3) * min(base_width, base_height)
+        fill = tuple(int(v) for v in rng.integers(0, 256, size=3))
+        kind = rng.integers(3)
+        if kind == 0:
+            draw.ellipse([x - radius, y - radius * rng.uniform(0.3, 1), x + radius, y + radius], fill=fill)
+        elif kind == 1:
+            draw.rectangle([x - radius, y - radius * rng.uniform(0.3, 1), x + radius, y + radius], fill=fill)
+        else:
+            angles = np.sort(rng.uniform(0, 2 * np.pi, size=int(rng.integers(3, 8))))
+            draw.polygon([(x + radius * np.cos(a), y + radius * np.sin(a)) for a in angles], fill=fill)
+
+    # Texture from coarse down to a few pixels of the base, shading everything
+    octaves = max(1, int(np.log2(min(base_width, base_height) / 16)))
+    texture = smooth_field(rng, base_width, base_height, octaves=octaves, persistence=0.7)
+    strength = rng.uniform(60, 140)
+    base = np.asarray(base_img, dtype=np.float32) + (strength * (texture - 0.5))[:, :, None]
+    img = Image.fromarray(np.clip(base, 0, 255).astype(np.uint8)).resize((width, height), Image.Resampling.BICUBIC)
+    del base, texture
+
+    # Text-like detail: lines of random characters in a few sizes and colors
+    draw = ImageDraw.Draw(img)
+    for _ in range(int(rng.integers(3, 12))):
+        size = int(max(8, min(width, height) * rng.uniform(0.01, 0.06)))
+        font = ImageFont.load_default(size)
+        text = ''.join(rng.choice(list(TEXT_CHARACTERS), size=int(rng.integers(8, 40))))
+        position = (int(rng.integers(0, width)), int(rng.integers(0, height)))
+        draw.text(position, text, fill=tuple(int(v) for v in rng.integers(0, 256, size=3)), font=font)
+
+    # Gaussian noise, a strip at a time: a random byte per sample looked up in a table of the
+    # normal distribution's 256 quantiles, which is several times faster than drawing normals
+    pixels = np.array(img)
+    img.close()
+    sigma = rng.uniform(2, 10)
+    normal = NormalDist(0, sigma)
+    offsets = np.array([round(normal.inv_cdf((i + 0.5) / 256)) for i in range(256)], dtype=np.int16)
+    for top in range(0, height, NOISE_STRIP):
+        strip = pixels[top:top + NOISE_STRIP]
+        noisy = offsets[rng.integers(0, 256, size=strip.shape, dtype=np.uint8)]
+        noisy += strip
+        np.clip(noisy, 0, 255, out=noisy)
+        strip[:] = noisy
+    return Image.fromarray(pixels)
+
+# Render one image from its spec and write it into output_dir (under a hidden name, then renamed,
+# so a partly written corpus never holds half a file). Returns the spec with the file's size.
+def write_image(spec, output_dir):
+    rng = content_rng(spec['Seed'], spec['Index'])
+    img = render_content(rng, spec['Width'], spec['Height'])
+
+    if spec['Mode'] == 'RGBA':
+        alpha = smooth_field(rng, max(2, spec['Width'] // BASE_SCALE), max(2, spec['Height'] // BASE_SCALE), octaves=2)
+        img.putalpha(Image.fromarray((alpha * 255).astype(np.uint8)).resize(img.size, Image.Resampling.BICUBIC))
+    elif spec['Mode'] == 'P':
+        img = img.quantize(colors=int(rng.integers(16, 257)))
+
+    path = os.path.join(output_dir, spec['File'])
+    partial_path = os.path.join(output_dir, '.' + spec['File'])
+    if spec['Format'] == 'JPEG':
+        exif = Image.Exif()
+        if spec['Orientation'] != 1:
+            exif[ORIENTATION_TAG] = spec['Orientation']
+        img.save(partial_path, 'JPEG', quality=spec['Quality'], exif=exif)
+    else:
+        img.save(partial_path, 'PNG', compress_level=1)
+    img.close()
+    os.replace(partial_path, path)
+    return dict(spec, Bytes=os.path.getsize(path))
+
+# Generate `count` images into output_dir across worker processes. The corpus depends only on the
+# seed and the distributions, not on the number of workers: same seed, same bytes.
+# Returns the spec of every image, in index order.
+def generate_corpus(output_dir, count=100, seed=0, workers=None, megapixels=MEGAPIXELS, aspects=ASPECTS,
+                    variants=VARIANTS, orientation_rate=ORIENTATION_RATE, start=0):
+    os.makedirs(output_dir, exist_ok=True)
+    specs = [image_spec(seed, index, megapixels, aspects, variants, orientation_rate)
+             for index in range(start, start + count)]
+    write = partial(write_image, output_dir=output_dir)
+    if workers == 1:
+        return [write(spec) for spec in specs]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(write, specs, chunksize=max(1, min(16, count // (4 * (workers or os.cpu_count() or 1))))))
+
+# SHA-256 over every file in a corpus, in name order, to check two generations are identical
+def corpus_digest(output_dir):
+    digest = hashlib.sha256()
+    for file_name in sorted(os.listdir(output_dir)):
+        if file_name.startswith('.'):
+            continue
+        digest.update(file_name.encode())
+        with open(os.path.join(output_dir, file_name), 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+    return digest.hexdigest()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a reproducible synthetic photo corpus")
+    parser.add_argument('output_dir')
+    parser.add_argument('--count', type=int, default=100)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--start', type=int, default=0, help="first image index, to extend an existing corpus")
+    args = parser.parse_args()
+
+    specs = generate_corpus(args.output_dir, args.count, args.seed, args.workers, start=args.start)
+    print(f"Generated {len(specs)} images ({sum(spec['Bytes'] for spec in specs) / 1e6:.0f} MB) in {args.output_dir}")
+    print(f"Digest: {corpus_digest(args.output_dir)}")
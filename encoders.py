@@ -0,0 +1,152 @@
+import io
+import math
+import os
+from contextlib import contextmanager
+from PIL import Image
+
+# Encoder profiles for saved outputs. 'default' keeps the old behaviour: Pillow's defaults
+# for the format implied by the output file name.
+ENCODER_PROFILES = {
+    'default': None,
+    'jpeg': {'format': 'JPEG', 'quality': 85, 'subsampling': '4:2:0', 'progressive': True, 'optimize': True},
+    'jpeg-high': {'format': 'JPEG', 'quality': 92, 'subsampling': '4:4:4', 'progressive': True, 'optimize': True},
+    'webp': {'format': 'WEBP', 'quality': 80, 'method': 4},
+    'avif': {'format': 'AVIF', 'quality': 60, 'speed': 6},
+    'png': {'format': 'PNG', 'optimize': True},
+}
+
+# File extension written for each format
+EXTENSIONS = {'JPEG': '.jpg', 'WEBP': '.webp', 'AVIF': '.avif', 'PNG': '.png'}
+
+# Lowest quality the target-size search will go down to
+MIN_QUALITY = 20
+
+# Profiles whose format the installed Pillow can write (AVIF needs a Pillow built with libavif)
+def available_profiles():
+    Image.init()
+    return [name for name, profile in ENCODER_PROFILES.items() if profile is None or profile['format'] in Image.SAVE]
+
+# Look up a profile by name, failing early when Pillow cannot write its format
+def get_profile(name):
+    if name not in ENCODER_PROFILES:
+        raise ValueError(f"Unknown encoder profile {name!r}; choose from {', '.join(ENCODER_PROFILES)}")
+    if name not in available_profiles():
+        raise ValueError(f"Encoder profile {name!r} is not supported by the installed Pillow")
+    return ENCODER_PROFILES[name]
+
+# When set to a dict, outputs are collected there (output path -> encoded bytes) instead of being
+# written to disk, so a batch can write them straight into an archive (see archive_io.py)
+captured_outputs = None
+
+# Collect every output this process writes into `outputs` while the block runs
+@contextmanager
+def capture_outputs(outputs):
+    global captured_outputs
+    previous, captured_outputs = captured_outputs, outputs
+    try:
+        yield outputs
+    finally:
+        captured_outputs = previous
+
+# Whether outputs are being captured
+def capturing():
+    return captured_outputs is not None
+
+# Write encoded bytes to output_path, or into the captured outputs. Returns the number of bytes.
+def write_output(data, output_path):
+    if captured_outputs is not None:
+        captured_outputs[output_path] = data
+    else:
+        with open(output_path, 'wb') as f:
+            f.write(data)
+    return len(data)
+
+# Save with Pillow's defaults for the format implied by the file name. Returns the number of bytes.
+def save_default(img, output_path):
+    if captured_outputs is None:
+        img.save(output_path)
+        return os.path.getsize(output_path)
+    buffer = io.BytesIO()
+    img.save(buffer, format=Image.registered_extensions()[os.path.splitext(output_path)[1].lower()])
+    return write_output(buffer.getvalue(), output_path)
+
+# Encode to memory with a profile, optionally overriding its quality
+def encode_image(img, profile, quality=None):
+    options = dict(profile)
+    image_format = options.pop('format')
+    if quality is not None:
+        options['quality'] = quality
+    if image_format == 'JPEG' and img.mode not in ('RGB', 'L'):
+        img = img.convert('RGB')
+    buffer = io.BytesIO()
+    img.save(buffer, format=image_format, **options)
+    return buffer.getvalue()
+
+# Encode within max_bytes using as few trial encodes as possible: the profile's own quality
+# is kept if it already fits, otherwise the highest fitting quality is searched for. Guesses
+# interpolate log size against quality between the closest encodes that fit and overshoot.
+# A guess is only taken if bisection could still finish from either side of it within the
+# encodes bisection needs from the start; otherwise it bisects. So the search never takes more
+# encodes than bisection (8 for the jpeg profile, counting the first), and about 5 when the jpeg
+# profile has to search. A range with no spare encodes, like webp's, is simply bisected.
+# Returns the encoded bytes, the quality used and the number of trial encodes. If nothing down
+# to MIN_QUALITY fits, the smallest encode tried is returned.
+def encode_to_size(img, profile, max_bytes):
+    if 'quality' not in profile:
+        return encode_image(img, profile), None, 1
+
+    data = encode_image(img, profile)
+    trials = 1
+    if len(data) <= max_bytes:
+        return data, profile['quality'], trials
+
+    # Best fitting encode so far, or the smallest one while nothing fits
+    best = (data, profile['quality'])
+    fits, over = None, (profile['quality'], len(data))
+    low, high = MIN_QUALITY, profile['quality'] - 1
+    # Encodes left: what bisection needs for the whole range
+    remaining = (high - low + 1).bit_length()
+    while low <= high:
+        if fits is None:
+            guess = int(over[0] * max_bytes / over[1])
+        else:
+            # Size grows roughly exponentially with quality, so interpolate on log size
+            guess = int(fits[0] + (math.log(max_bytes) - math.log(fits[1])) * (over[0] - fits[0])
+                        / (math.log(over[1]) - math.log(fits[1])))
+        quality = min(max(guess, low), high)
+        if 1 + max(quality - low, high - quality).bit_length() > remaining:
+            quality = (low + high) // 2
+
+        candidate = encode_image(img, profile, quality)
+        trials += 1
+        remaining -= 1
+        if len(candidate) <= max_bytes:
+            best, fits = (candidate, quality), (quality, len(candidate))
+            low = quality + 1
+        else:
+            if fits is None and len(candidate) < len(best[0]):
+                best = (candidate, quality)
+            over = (quality, len(candidate))
+            high = quality - 1
+    return best[0], best[1], trials
+
+# Encode and write an image with a profile, optionally within a byte budget.
+# The extension of output_path follows the profile's format. Returns what was chosen for the image;
+# 'Within Budget' is False when not even MIN_QUALITY fit max_bytes (None without a budget).
+def save_encoded(img, output_path, profile_name='default', max_bytes=None):
+    profile = get_profile(profile_name)
+    if profile is None:
+        if max_bytes is not None:
+            raise ValueError("A byte budget needs an encoder profile with a quality setting")
+        return {'Output': output_path, 'Quality': None, 'Bytes': save_default(img, output_path), 'Trials': 1,
+                'Within Budget': None}
+
+    if max_bytes is None:
+        data, quality, trials = encode_image(img, profile), profile.get('quality'), 1
+    else:
+        data, quality, trials = encode_to_size(img, profile, max_bytes)
+
+    output_path = os.path.splitext(output_path)[0] + EXTENSIONS[profile['format']]
+    write_output(data, output_path)
+    return {'Output': output_path, 'Quality': quality, 'Bytes': len(data), 'Trials': trials,
+            'Within Budget': None if max_bytes is None else len(data) <= max_bytes}
@@ -1,104 +1,212 @@
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
-from scipy.stats import ttest_ind, f_oneway
+import matplotlib
+matplotlib.use('Agg')
+from matplotlib.figure import Figure
+from scipy.stats import f as f_distribution, ttest_ind_from_stats
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
 import os
+import time
 
-# Load Results from CSV
-def load_results(csv_file):
-    return pd.read_csv(csv_file)
+# Columns the analysis uses
+ANALYSIS_COLUMNS = ['Method', 'SSIM', 'MSE']
+
+# Metrics analysed per method
+METRICS = ['SSIM', 'MSE']
+
+# Bins per method for the distribution plots, and per axis for the SSIM vs. MSE plot
+HISTOGRAM_BINS = 50
+SCATTER_BINS = 100
+
+# Points further than this many IQRs outside the quartiles are outliers
+IQR_FACTOR = 1.5
+
+# ANOVA result with the same fields (and text) as scipy's f_oneway
+AnovaResult = namedtuple('F_onewayResult', ['statistic', 'pvalue'])
+
+# Load Results from a results store folder (see results_store.py) or a CSV
+# Only the given columns are read; methods and sessions (store only) limit which results are loaded.
+def load_results(results_path, columns=ANALYSIS_COLUMNS, methods=None, sessions=None):
+    if os.path.isdir(results_path):
+        from results_store import read_results
+        return read_results(results_path, columns=columns, methods=methods, sessions=sessions)
+    df = pd.read_csv(results_path, usecols=columns)
+    return df[df['Method'].isin(methods)] if methods is not None else df
+
+# Bin of each value, for equal-width bins with the given edges (the last bin includes its right edge)
+def bin_values(values, edges):
+    bins = len(edges) - 1
+    span = (edges[-1] - edges[0]) or 1.0
+    return np.clip(((values - edges[0]) * (bins / span)).astype(np.intp), 0, bins - 1)
+
+# Everything the analysis needs, per method, from one grouping of the rows: count, mean, variance,
+# quartiles, whiskers, IQR outlier counts and histograms for each metric, plus a 2D SSIM/MSE histogram.
+# Methods keep the order they first appear in; rows without a method are left out.
+def group_aggregates(df, bins=HISTOGRAM_BINS, scatter_bins=SCATTER_BINS):
+    codes, methods = pd.factorize(df['Method'])
+    if (codes < 0).any():
+        df, codes = df[codes >= 0], codes[codes >= 0]
+    n_methods = len(methods)
+    counts = np.bincount(codes, minlength=n_methods)
+
+    # Rows ordered by method (a radix sort on the small codes), so each method's values are one slice
+    order = np.argsort(codes.astype(np.int16 if n_methods < 2 ** 15 else np.intp), kind='stable')
+    bounds = np.concatenate([[0], np.cumsum(counts)])
+
+    aggregates = {'Methods': list(methods)}
+    metric_values = {}
+    for metric in METRICS:
+        values = metric_values[metric] = df[metric].to_numpy(dtype=np.float64)
+        means = np.bincount(codes, weights=values, minlength=n_methods) / counts
+        variances = np.bincount(codes, weights=np.square(values - means[codes]), minlength=n_methods) / (counts - 1)
+
+        # Quartiles, whiskers (the most extreme values inside the fences) and outliers per slice
+        by_method = values[order]
+        stats = np.empty((n_methods, 6))
+        for i in range(n_methods):
+            group = by_method[bounds[i]:bounds[i + 1]]
+            q1, median, q3 = np.quantile(group, [0.25, 0.5, 0.75])
+            lower, upper = q1 - IQR_FACTOR * (q3 - q1), q3 + IQR_FACTOR * (q3 - q1)
+            inside = group[(group >= lower) & (group <= upper)]
+            stats[i] = q1, median, q3, inside.min(), inside.max(), len(group) - len(inside)
+
+        # One set of edges shared by all methods, so the histograms overlay
+        edges = np.linspace(values.min(), values.max(), bins + 1)
+        histogram = np.bincount(codes * bins + bin_values(values, edges),
+                                minlength=n_methods * bins).reshape(n_methods, bins)
+
+        aggregates[metric] = {
+            'Count': counts, 'Mean': means, 'Var': variances,
+            'Q1': stats[:, 0], 'Median': stats[:, 1], 'Q3': stats[:, 2],
+            'Whisker Low': stats[:, 3], 'Whisker High': stats[:, 4], 'Outliers': stats[:, 5].astype(int),
+            'Edges': edges, 'Histogram': histogram,
+        }
+
+    # SSIM vs. MSE on a scatter_bins x scatter_bins grid over the same ranges
+    scatter = {f'{metric} Edges': np.linspace(aggregates[metric]['Edges'][0], aggregates[metric]['Edges'][-1], scatter_bins + 1)
+               for metric in ('SSIM', 'MSE')}
+    cells = ((codes * scatter_bins + bin_values(metric_values['SSIM'], scatter['SSIM Edges'])) * scatter_bins
+             + bin_values(metric_values['MSE'], scatter['MSE Edges']))
+    scatter['Histogram'] = np.bincount(cells, minlength=n_methods * scatter_bins ** 2).reshape(
+        n_methods, scatter_bins, scatter_bins)
+    aggregates['Scatter'] = scatter
+    return aggregates
 
 # Compute Summary Statistics for Each Method
-def summary_stats(df):
-    methods = df['Method'].unique()
-    stats = []
-
-    for method in methods:
-        method_data = df[df['Method'] == method]
-        mean_ssim = method_data['SSIM'].mean()
-        std_ssim = method_data['SSIM'].std()
-        mean_mse = method_data['MSE'].mean()
-        std_mse = method_data['MSE'].std()
-        stats.append({'Method': method, 'Mean SSIM': mean_ssim, 'Std SSIM': std_ssim, 
-                      'Mean MSE': mean_mse, 'Std MSE': std_mse})
-    
-    summary_df = pd.DataFrame(stats)
-    return summary_df
-
-# Conduct Statistical Tests (ANOVA and Pairwise t-tests)
-def statistical_tests(df):
-    methods = df['Method'].unique()
-    ssim_data = [df[df['Method'] == method]['SSIM'] for method in methods]
-    mse_data = [df[df['Method'] == method]['MSE'] for method in methods]
+def summary_stats(aggregates):
+    return pd.DataFrame({
+        'Method': aggregates['Methods'],
+        'Mean SSIM': aggregates['SSIM']['Mean'], 'Std SSIM': np.sqrt(aggregates['SSIM']['Var']),
+        'Mean MSE': aggregates['MSE']['Mean'], 'Std MSE': np.sqrt(aggregates['MSE']['Var']),
+    })
+
+# One-way ANOVA from per-group counts, means and variances
+def anova_from_stats(counts, means, variances):
+    total = counts.sum()
+    grand_mean = np.sum(counts * means) / total
+    between = np.sum(counts * (means - grand_mean) ** 2) / (len(counts) - 1)
+    within = np.sum((counts - 1) * variances) / (total - len(counts))
+    statistic = between / within
+    return AnovaResult(float(statistic), float(f_distribution.sf(statistic, len(counts) - 1, total - len(counts))))
+
+# Conduct Statistical Tests (ANOVA and Pairwise t-tests), all from the group aggregates
+def statistical_tests(aggregates):
+    ssim_stats, mse_stats = aggregates['SSIM'], aggregates['MSE']
 
     # ANOVA Test
-    anova_ssim = f_oneway(*ssim_data)
-    anova_mse = f_oneway(*mse_data)
+    anova_ssim = anova_from_stats(ssim_stats['Count'], ssim_stats['Mean'], ssim_stats['Var'])
+    anova_mse = anova_from_stats(mse_stats['Count'], mse_stats['Mean'], mse_stats['Var'])
 
-    # Pairwise t-tests for SSIM
+    # Pairwise t-tests (equal variances, as ttest_ind)
     ttest_results = []
+    methods = aggregates['Methods']
     for i, method1 in enumerate(methods):
         for j, method2 in enumerate(methods):
             if i < j:
-                ttest_ssim = ttest_ind(ssim_data[i], ssim_data[j])
-                ttest_mse = ttest_ind(mse_data[i], mse_data[j])
+                pvalues = {}
+                for metric, stats in (('SSIM', ssim_stats), ('MSE', mse_stats)):
+                    pvalues[metric] = ttest_ind_from_stats(
+                        stats['Mean'][i], np.sqrt(stats['Var'][i]), stats['Count'][i],
+                        stats['Mean'][j], np.sqrt(stats['Var'][j]), stats['Count'][j]).pvalue
                 ttest_results.append({
                     'Method 1': method1,
                     'Method 2': method2,
-                    'SSIM p-value': ttest_ssim.pvalue,
-                    'MSE p-value': ttest_mse.pvalue
+                    'SSIM p-value': pvalues['SSIM'],
+                    'MSE p-value': pvalues['MSE']
                 })
-    
+
     ttest_df = pd.DataFrame(ttest_results)
     return {'anova_ssim': anova_ssim, 'anova_mse': anova_mse, 'pairwise_ttests': ttest_df}
 
+# Boxplot of one metric, drawn from the quartiles and whiskers (outliers are counted, not drawn)
+def draw_boxplot(methods, stats, metric, path):
+    boxes = [{'label': method, 'q1': stats['Q1'][i], 'med': stats['Median'][i], 'q3': stats['Q3'][i],
+              'whislo': stats['Whisker Low'][i], 'whishi': stats['Whisker High'][i]}
+             for i, method in enumerate(methods)]
+    fig = Figure(figsize=(12, 6))
+    ax = fig.add_subplot()
+    ax.bxp(boxes, showfliers=False)
+    ax.set_xlabel('Method')
+    ax.set_ylabel(metric)
+    ax.set_title(f'{metric} Comparison Across Methods')
+    fig.savefig(path)
+
+# Step histograms of one metric, one per method, from the binned counts
+def draw_histograms(methods, stats, metric, path):
+    fig = Figure(figsize=(12, 6))
+    ax = fig.add_subplot()
+    for i, method in enumerate(methods):
+        ax.stairs(stats['Histogram'][i], stats['Edges'], label=method)
+    ax.set_xlabel(metric)
+    ax.set_ylabel('Count')
+    ax.set_title(f'{metric} Distribution Across Methods')
+    ax.legend()
+    fig.savefig(path)
+
+# SSIM vs. MSE: one point per occupied cell of the 2D histogram, sized by how many results it holds
+def draw_scatter(methods, scatter, path):
+    ssim_centers = (scatter['SSIM Edges'][:-1] + scatter['SSIM Edges'][1:]) / 2
+    mse_centers = (scatter['MSE Edges'][:-1] + scatter['MSE Edges'][1:]) / 2
+    fig = Figure(figsize=(12, 6))
+    ax = fig.add_subplot()
+    for i, method in enumerate(methods):
+        ssim_cells, mse_cells = np.nonzero(scatter['Histogram'][i])
+        counts = scatter['Histogram'][i][ssim_cells, mse_cells]
+        ax.scatter(ssim_centers[ssim_cells], mse_centers[mse_cells], s=10 * (1 + np.log10(counts)), alpha=0.6, label=method)
+    ax.set_xlabel('SSIM')
+    ax.set_ylabel('MSE')
+    ax.set_title('SSIM vs. MSE Across Methods')
+    ax.legend(title='Method')
+    fig.savefig(path)
+
+# Run one plot job, (draw function, arguments)
+def render_plot(job):
+    draw, args = job
+    draw(*args)
+
 # Visualization: Boxplots, Histograms, and Scatter Plots
-def plot_distributions(df, output_dir):
-    plt.figure(figsize=(12, 6))
-    sns.boxplot(x='Method', y='SSIM', data=df)
-    plt.title('SSIM Comparison Across Methods')
-    plt.savefig(os.path.join(output_dir, 'ssim_boxplot.png'))
-    plt.clf()
-    
-    sns.boxplot(x='Method', y='MSE', data=df)
-    plt.title('MSE Comparison Across Methods')
-    plt.savefig(os.path.join(output_dir, 'mse_boxplot.png'))
-    plt.clf()
-    
-    for method in df['Method'].unique():
-        sns.histplot(df[df['Method'] == method]['SSIM'], label=method, kde=True, element="step")
-    plt.title('SSIM Distribution Across Methods')
-    plt.legend()
-    plt.savefig(os.path.join(output_dir, 'ssim_distribution.png'))
-    plt.clf()
-
-    for method in df['Method'].unique():
-        sns.histplot(df[df['Method'] == method]['MSE'], label=method, kde=True, element="step")
-    plt.title('MSE Distribution Across Methods')
-    plt.legend()
-    plt.savefig(os.path.join(output_dir, 'mse_distribution.png'))
-    plt.clf()
-    
-    sns.scatterplot(x='SSIM', y='MSE', hue='Method', data=df)
-    plt.title('SSIM vs. MSE Across Methods')
-    plt.savefig(os.path.join(output_dir, 'ssim_vs_mse.png'))
-    plt.clf()
-
-# Detect Outliers Using IQR Method
-def detect_outliers(df):
-    outlier_summary = []
-    for method in df['Method'].unique():
-        method_data = df[df['Method'] == method]
-        q1_ssim = method_data['SSIM'].quantile(0.25)
-        q3_ssim = method_data['SSIM'].quantile(0.75)
-        iqr_ssim = q3_ssim - q1_ssim
-        lower_bound_ssim = q1_ssim - 1.5 * iqr_ssim
-        upper_bound_ssim = q3_ssim + 1.5 * iqr_ssim
-        outliers_ssim = method_data[(method_data['SSIM'] < lower_bound_ssim) | (method_data['SSIM'] > upper_bound_ssim)]
-        
-        outlier_summary.append({'Method': method, 'SSIM Outliers': len(outliers_ssim)})
-    return pd.DataFrame(outlier_summary)
+# Every figure is drawn from the aggregates alone, in parallel worker processes (Agg backend).
+def plot_distributions(aggregates, output_dir, workers=None):
+    methods = aggregates['Methods']
+    jobs = [
+        (draw_boxplot, (methods, aggregates['SSIM'], 'SSIM', os.path.join(output_dir, 'ssim_boxplot.png'))),
+        (draw_boxplot, (methods, aggregates['MSE'], 'MSE', os.path.join(output_dir, 'mse_boxplot.png'))),
+        (draw_histograms, (methods, aggregates['SSIM'], 'SSIM', os.path.join(output_dir, 'ssim_distribution.png'))),
+        (draw_histograms, (methods, aggregates['MSE'], 'MSE', os.path.join(output_dir, 'mse_distribution.png'))),
+        (draw_scatter, (methods, aggregates['Scatter'], os.path.join(output_dir, 'ssim_vs_mse.png'))),
+    ]
+    workers = min(len(jobs), workers or os.cpu_count() or 1)
+    if workers == 1:
+        for job in jobs:
+            render_plot(job)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(render_plot, jobs))
+
+# Detect Outliers Using IQR Method (counted in group_aggregates)
+def detect_outliers(aggregates):
+    return pd.DataFrame({'Method': aggregates['Methods'], 'SSIM Outliers': aggregates['SSIM']['Outliers']})
 
 # Save Analysis Output
 def save_output(summary_df, test_results, outlier_df, output_dir):
@@ -106,38 +214,64 @@ def save_output(summary_df, test_results, outlier_df, output_dir):
     summary_df.to_csv(os.path.join(output_dir, 'summary_statistics.csv'), index=False)
     test_results['pairwise_ttests'].to_csv(os.path.join(output_dir, 'pairwise_ttests.csv'), index=False)
     outlier_df.to_csv(os.path.join(output_dir, 'outlier_summary.csv'), index=False)
-    
+
     # Save ANOVA Results as text files
     with open(os.path.join(output_dir, 'anova_ssim.txt'), 'w') as f:
         f.write(str(test_results['anova_ssim']))
     with open(os.path.join(output_dir, 'anova_mse.txt'), 'w') as f:
         f.write(str(test_results['anova_mse']))
 
-# Main Function to Run All Analysis
-def main():
-    # Load results CSV
-    csv_file = csv_file = '/Users/jameswinslow/Documents/Projects/DataScience/IGPhotoResizer/resizing_comparison_results.csv'
-    output_dir = 'analysis_output'
-    df = load_results(csv_file)
-    
-    # Compute Summary Stats
-    summary_df = summary_stats(df)
-    print("Summary Statistics:\n", summary_df)
-    
-    # Perform Statistical Tests
-    test_results = statistical_tests(df)
-    print("ANOVA Results (SSIM):\n", test_results['anova_ssim'])
-    print("ANOVA Results (MSE):\n", test_results['anova_mse'])
-    
+# Run every analysis step on a results DataFrame, printing and saving as it goes.
+# Returns the time each step took, in seconds.
+def analyze(df, output_dir='analysis_output', workers=None, verbose=True):
+    os.makedirs(output_dir, exist_ok=True)
+    timings = {}
+    start = time.perf_counter()
+
+    # One pass over the rows; every step below works on the per-method aggregates
+    aggregates = group_aggregates(df)
+    timings['Aggregates'] = time.perf_counter() - start
+
+    # Compute Summary Stats, Statistical Tests and Outliers
+    summary_df = summary_stats(aggregates)
+    test_results = statistical_tests(aggregates)
+    outlier_df = detect_outliers(aggregates)
+    timings['Statistics'] = time.perf_counter() - start - timings['Aggregates']
+    if verbose:
+        print("Summary Statistics:\n", summary_df)
+        print("ANOVA Results (SSIM):\n", test_results['anova_ssim'])
+        print("ANOVA Results (MSE):\n", test_results['anova_mse'])
+        print("Outlier Summary:\n", outlier_df)
+
     # Plot and Save Visualizations
-    plot_distributions(df, output_dir)
-    
-    # Detect and Save Outliers
-    outlier_df = detect_outliers(df)
-    print("Outlier Summary:\n", outlier_df)
-    
+    plot_start = time.perf_counter()
+    plot_distributions(aggregates, output_dir, workers)
+    timings['Plots'] = time.perf_counter() - plot_start
+
     # Save All Results
     save_output(summary_df, test_results, outlier_df, output_dir)
+    timings['Total'] = time.perf_counter() - start
+    return timings
+
+# Time the analysis on `rows` synthetic results spread over a few methods
+def benchmark_analysis(rows=10_000_000, output_dir='analysis_benchmark', seed=0):
+    rng = np.random.default_rng(seed)
+    methods = np.array(['Simple Resize', 'Padding Resize', 'Content-Aware Resize', 'Smart Crop'])
+    picks = rng.integers(len(methods), size=rows)
+    df = pd.DataFrame({
+        'Method': pd.Categorical.from_codes(picks, methods),
+        'SSIM': np.clip(rng.normal(0.95 - 0.05 * picks, 0.03), 0, 1),
+        'MSE': rng.gamma(2.0, 5.0 + 10.0 * picks),
+    })
+    timings = analyze(df, output_dir, verbose=False)
+    print(f"Analysis of {rows:,} rows: " + ', '.join(f"{step} {seconds:.2f}s" for step, seconds in timings.items()))
+    return timings
+
+# Main Function to Run All Analysis
+def main(results_path, output_dir='analysis_output', methods=None, sessions=None):
+    # Load results
+    df = load_results(results_path, methods=methods, sessions=sessions)
+    analyze(df, output_dir)
 
 if __name__ == "__main__":
-    main()
+    main('/Users/jameswinslow/Documents/Projects/DataScience/IGPhotoResizer/results_store')
@@ -1,12 +1,15 @@
 from PIL import Image, ImageDraw
 import random
 import os
-from resize import process_images
+import numpy as np
+from resize import process_images, get_dominant_color, DOMINANT_SAMPLE_SIZE
+from batch import report_results
 
 
 # Define the directories
 test_input_dir = "/Users/jameswinslow/Documents/Projects/DataScience/IGPhotoResizer/test_images"
 test_output_dir = "/Users/jameswinslow/Documents/Projects/DataScience/IGPhotoResizer/test_output"
+frozen_test_dir = "/Users/jameswinslow/Documents/Projects/DataScience/IGPhotoResizer/frozen_test_images"
 
 # Ensure the test directories exist
 if not os.path.exists(test_input_dir):
@@ -47,14 +50,43 @@ def generate_random_images(num_images=10, min_size=300, max_size=1080):
         img.save(img_path)
         print(f"Generated {img_path}")
 
+# Compare the built-in dominant color against ColorThief's for every image in a folder
+# Colors match when their RGB distance is within `tolerance`; at the default sample size no image
+# tried was more than 8 levels off (see resize.DOMINANT_SAMPLE_SIZE). Returns one result dict per image.
+def compare_dominant_colors(input_dir, sample_size=DOMINANT_SAMPLE_SIZE, tolerance=16):
+    from colorthief import ColorThief  # Only needed as the reference implementation
+
+    comparisons = []
+    for file_name in sorted(os.listdir(input_dir)):
+        if file_name.endswith(('.jpg', '.jpeg', '.png')):
+            img_path = os.path.join(input_dir, file_name)
+            reference = ColorThief(img_path).get_color(quality=1)
+            color = get_dominant_color(Image.open(img_path), sample_size=sample_size)
+            distance = float(np.linalg.norm(np.subtract(reference, color)))
+            comparisons.append({
+                'File': file_name,
+                'ColorThief': reference,
+                'Dominant Color': color,
+                'Distance': distance,
+                'Match': distance <= tolerance
+            })
+    return comparisons
+
 # Main function to run the tests
 def run_image_tests():
     # Step 1: Generate random images
     generate_random_images()
 
     # Step 2: Apply the resizing algorithm to the random images
-    process_images(test_input_dir, test_output_dir)
+    report_results(process_images(test_input_dir, test_output_dir), "Resize")
     print(f"Test completed. Resized images saved in {test_output_dir}")
 
+    # Step 3: Check the dominant fill colors against ColorThief on the frozen set
+    comparisons = compare_dominant_colors(frozen_test_dir)
+    mismatches = [c for c in comparisons if not c['Match']]
+    print(f"Dominant colors matching ColorThief: {len(comparisons) - len(mismatches)}/{len(comparisons)}")
+    for c in mismatches:
+        print(f"  {c['File']}: {c['Dominant Color']} vs ColorThief {c['ColorThief']} (distance {c['Distance']:.1f})")
+
 if __name__ == "__main__":
     run_image_tests()
@@ -0,0 +1,173 @@
+import argparse
+import os
+from importlib import import_module
+
+# Resize methods by CLI name. Each entry names the module and batch function that implement it,
+# so a method's dependencies (OpenCV, scikit-image, ...) are only imported when it is selected.
+#   options: fixed keyword arguments, sized: takes --width/--height, backend: takes --backend,
+#   budget: takes --memory-budget, incremental: supports --incremental, scored: has one output per file to compare
+METHODS = {
+    'padding': {'label': 'Resize With Padding', 'module': 'resize', 'function': 'process_images',
+                'options': {'method': 'padding'}, 'sized': True, 'backend': True, 'budget': True, 'incremental': True,
+                'scored': True},
+    'crop': {'label': 'Smart Crop', 'module': 'resize', 'function': 'process_images',
+             'options': {'method': 'crop'}, 'sized': True, 'budget': True, 'incremental': True, 'scored': True},
+    'renditions': {'label': 'Renditions', 'module': 'resize', 'function': 'process_images_renditions',
+                   'options': {}, 'sized': False, 'budget': True, 'incremental': True, 'scored': False},
+    'simple': {'label': 'Simple Resize', 'module': 'process_images', 'function': 'process_images_simple',
+               'options': {}, 'sized': False, 'incremental': False, 'scored': True},
+    'padding-white': {'label': 'Padding Resize', 'module': 'process_images', 'function': 'process_images_padding',
+                      'options': {}, 'sized': False, 'incremental': False, 'scored': True},
+    'content-aware': {'label': 'Content-Aware Resize', 'module': 'process_images', 'function': 'process_images_content_aware',
+                      'options': {}, 'sized': False, 'incremental': False, 'scored': True},
+}
+
+# Methods compared and evaluated by default
+SCORED_METHODS = [name for name, entry in METHODS.items() if entry['scored']]
+
+# Import a method's module and return its batch function, fn(input_dir, output_dir, **options)
+def load_method(name):
+    entry = METHODS[name]
+    return getattr(import_module(entry['module']), entry['function'])
+
+# Run one method over a folder with the options given on the command line
+# With --memory-budget, `stats` (if given) receives the batch's memory figures
+def run_method(name, input_dir, output_dir, args, stats=None):
+    entry = METHODS[name]
+    options = dict(entry['options'], workers=args.workers, trace_path=args.trace, profile=args.profile,
+                   max_bytes=args.max_bytes)
+    if entry['sized']:
+        options.update(target_width=args.width, target_height=args.height)
+    if entry.get('backend'):
+        options['backend'] = args.backend
+    if entry.get('budget') and args.memory_budget:
+        options.update(memory_budget=args.memory_budget, stats=stats)
+    if entry['incremental']:
+        options['incremental'] = args.incremental
+    if args.dedupe:
+        options['dedupe'] = args.dedupe
+    return load_method(name)(input_dir, output_dir, **options)
+
+# resize: run one method over a folder
+def resize_command(args):
+    from batch import report_results
+    stats = {}
+    report_results(run_method(args.method, args.input_dir, args.output_dir, args, stats), METHODS[args.method]['label'])
+    if stats:
+        from scheduler import report_memory
+        report_memory(stats)
+
+# compare: run several methods over a folder, each into its own subfolder, and score every
+# output against its original (SSIM and MSE)
+def compare_command(args):
+    import pandas as pd
+    from batch import report_results
+    from test_image_quality import score_images
+
+    rows = []
+    for name in args.methods:
+        label = METHODS[name]['label']
+        results = run_method(name, args.input_dir, os.path.join(args.output_dir, name), args)
+        report_results(results, label)
+        pairs = [(os.path.join(args.input_dir, result['File']), result['Output']) for result in results
+                 if result['Success'] and result['Output']]
+        for file_name, (ssim_value, mse_value) in score_images(pairs):
+            rows.append({'Method': label, 'Image': file_name, 'SSIM': ssim_value, 'MSE': mse_value})
+
+    results_df = pd.DataFrame(rows)
+    print(results_df.groupby('Method')[['SSIM', 'MSE']].mean())
+    csv_path = args.csv or os.path.join(args.output_dir, 'comparison_results.csv')
+    results_df.to_csv(csv_path, index=False)
+    print(f"Results saved to {csv_path}")
+
+# evaluate: repeated timed runs of each method, scored after every run (test_image_quality) and
+# appended to a results store as one new session; --csv also writes this session's results to a CSV
+def evaluate_command(args):
+    from functools import partial
+    from results_store import new_session
+    from test_image_quality import evaluate_images
+
+    store_dir = args.store or os.path.join(args.output_dir, 'results_store')
+    session = new_session()
+    all_results = []
+    for name in args.methods:
+        entry = METHODS[name]
+        process_method = partial(load_method(name), **entry['options'])
+        all_results.extend(evaluate_images(entry['label'], process_method, args.input_dir,
+                                           os.path.join(args.output_dir, name), n_runs=args.runs,
+                                           store_dir=store_dir, session=session, dedupe=args.dedupe))
+    print(f"All results saved to {store_dir} (session {session})")
+
+    if args.csv:
+        import pandas as pd
+        pd.DataFrame(all_results).to_csv(args.csv, index=False)
+        print(f"Session results saved to {args.csv}")
+
+# analyze: summary statistics, tests, plots and outliers for a results store or CSV
+def analyze_command(args):
+    from image_resizer_analysis import main as analyze
+    methods = [METHODS[name]['label'] if name in METHODS else name for name in args.methods] if args.methods else None
+    analyze(args.results, args.output_dir, methods=methods, sessions=args.session)
+
+# Command-line parser: one subcommand per task
+def build_parser():
+    from resampling import BACKENDS, DEFAULT_BACKEND
+    parser = argparse.ArgumentParser(description="Instagram photo resizer")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    # Options shared by the subcommands that run resize methods
+    run_options = argparse.ArgumentParser(add_help=False)
+    run_options.add_argument('input_dir')
+    run_options.add_argument('output_dir')
+    run_options.add_argument('--width', type=int, default=1080, help="target width (padding and crop)")
+    run_options.add_argument('--height', type=int, default=1350, help="target height (padding and crop)")
+    run_options.add_argument('--profile', default='default', help="encoder profile (see encoders.py)")
+    run_options.add_argument('--max-bytes', type=int, help="byte budget per output")
+    run_options.add_argument('--workers', type=int, help="worker processes (all cores by default)")
+    run_options.add_argument('--memory-budget', type=int,
+                             help="MB the workers may use between them; big images are then scheduled by size")
+    run_options.add_argument('--incremental', action='store_true', help="skip files unchanged since the last run")
+    run_options.add_argument('--trace', help="append per-image stage timings to this JSONL file")
+    run_options.add_argument('--backend', choices=list(BACKENDS) + ['auto'], default=DEFAULT_BACKEND,
+                             help="resampler for padding (see resampling.py), or 'auto' for the tuned choice")
+    run_options.add_argument('--dedupe', choices=['reuse', 'report'],
+                             help="near-duplicate photos reuse the first one's output, or are only reported")
+
+    resize = subparsers.add_parser('resize', parents=[run_options], help="resize a folder with one method")
+    resize.add_argument('--method', choices=list(METHODS), default='padding')
+    resize.set_defaults(handler=resize_command)
+
+    compare = subparsers.add_parser('compare', parents=[run_options], help="run and score several methods")
+    compare.add_argument('--methods', nargs='+', choices=SCORED_METHODS, default=SCORED_METHODS)
+    compare.add_argument('--csv', help="results CSV (default: OUTPUT_DIR/comparison_results.csv)")
+    compare.set_defaults(handler=compare_command)
+
+    evaluate = subparsers.add_parser('evaluate', help="repeated timed and scored runs of several methods")
+    evaluate.add_argument('input_dir')
+    evaluate.add_argument('output_dir')
+    evaluate.add_argument('--methods', nargs='+', choices=SCORED_METHODS, default=['simple', 'padding-white', 'content-aware'])
+    evaluate.add_argument('--runs', type=int, default=5)
+    evaluate.add_argument('--store', help="results store to append to (default: OUTPUT_DIR/results_store)")
+    evaluate.add_argument('--csv', help="also write this session's results to a CSV")
+    evaluate.add_argument('--dedupe', choices=['reuse', 'report'],
+                          help="near-duplicate photos reuse the first one's output and score, or are left out")
+    evaluate.set_defaults(handler=evaluate_command)
+
+    analyze = subparsers.add_parser('analyze', help="statistics and plots for a results store or CSV")
+    analyze.add_argument('results', help="results store folder or CSV")
+    analyze.add_argument('--output-dir', default='analysis_output')
+    analyze.add_argument('--methods', nargs='+', help="only these methods (CLI names or labels)")
+    analyze.add_argument('--session', nargs='+', help="only these sessions (results store only)")
+    analyze.set_defaults(handler=analyze_command)
+    return parser
+
+if __name__ == "__main__":
+    args = build_parser().parse_args()
+    # Options only some methods take are rejected for the others rather than dropped
+    for option, key in (('incremental', 'incremental'), ('memory_budget', 'budget')):
+        if getattr(args, option, None):
+            unsupported = [name for name in ([args.method] if args.command == 'resize' else args.methods)
+                           if not METHODS[name].get(key)]
+            if unsupported:
+                build_parser().error(f"--{option.replace('_', '-')} is not supported by {', '.join(unsupported)}")
+    args.handler(args)
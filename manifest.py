@@ -0,0 +1,92 @@
+import hashlib
+import json
+import os
+
+# Default manifest file name, kept next to the outputs it describes
+MANIFEST_NAME = '.resize_manifest.json'
+
+# SHA-256 of a file's contents, read in chunks
+def file_hash(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+# Stable hash of a dict of resize parameters (target size, method, fill color, encoder settings)
+def params_hash(params):
+    return hashlib.sha256(json.dumps(params, sort_keys=True).encode()).hexdigest()
+
+# Load a manifest, or start an empty one
+def load_manifest(manifest_path):
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            return json.load(f)
+    return {'files': {}}
+
+# Write the manifest atomically so an interrupted run never leaves it half written
+def save_manifest(manifest_path, manifest):
+    tmp_path = manifest_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, manifest_path)
+
+# Content hash of a source, reusing the recorded one when its size and mtime are unchanged,
+# so a rerun over an unchanged folder only stats the files
+def source_hash(img_path, entry):
+    stat = os.stat(img_path)
+    if entry and entry['Size'] == stat.st_size and entry['Mtime'] == stat.st_mtime_ns:
+        return entry['Hash'], stat
+    return file_hash(img_path), stat
+
+# Split batch jobs into those that need to run and those already up to date in the manifest.
+# A job is up to date when the source hash and parameters match its entry and its outputs exist.
+# Returns the jobs to run, result dicts for the skipped ones, and the new entry for every file.
+def split_jobs(manifest, jobs, params):
+    key_params = params_hash(params)
+    to_run, skipped, entries = [], [], {}
+
+    for job in jobs:
+        _, file_name, img_path, output_path = job
+        entry = manifest['files'].get(file_name)
+        digest, stat = source_hash(img_path, entry)
+        key = f"{digest}:{key_params}"
+        entries[file_name] = {'Key': key, 'Hash': digest, 'Size': stat.st_size, 'Mtime': stat.st_mtime_ns}
+
+        # Outputs as written last time; an encoder profile may have changed the extension
+        recorded_output = entry.get('Output', output_path) if entry else output_path
+        output_paths = recorded_output.values() if isinstance(recorded_output, dict) else [recorded_output]
+        if entry and entry['Key'] == key and all(os.path.exists(path) for path in output_paths):
+            skipped.append({'File': file_name, 'Output': recorded_output, 'Success': True, 'Error': None, 'Skipped': True})
+        else:
+            to_run.append(job)
+
+    return to_run, skipped, entries
+
+# Output paths recorded in a manifest entry (several for batches writing more than one output)
+def entry_outputs(entry):
+    output = entry.get('Output')
+    if output is None:
+        return []
+    return list(output.values()) if isinstance(output, dict) else [output]
+
+# Record a batch in the manifest: successful files get their new entry, failed files and
+# sources that are gone are dropped so they run again next time. Outputs the dropped or
+# superseded entries recorded, and no new entry does, are deleted: their source is gone or
+# failed, or the parameters changed where they are written (e.g. another encoder's extension).
+# Returns the manifest and the deleted paths.
+def record_results(manifest, results, entries):
+    files = {}
+    for result in results:
+        if result['Success']:
+            files[result['File']] = dict(entries[result['File']], Output=result['Output'])
+
+    kept = {path for entry in files.values() for path in entry_outputs(entry)}
+    removed = []
+    for entry in manifest['files'].values():
+        for path in entry_outputs(entry):
+            if path not in kept and path not in removed and os.path.exists(path):
+                os.remove(path)
+                removed.append(path)
+    manifest['files'] = files
+    return manifest, removed
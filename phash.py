@@ -0,0 +1,279 @@
+import argparse
+import os
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from itertools import combinations
+import numpy as np
+from PIL import Image
+from resize import plan_decode
+
+# Perceptual hashes find near-duplicate photos (burst shots, re-exports, re-encodes) before a
+# batch spends the full resize, encode and scoring cost on each of them. A hash is a 64-bit int;
+# two photos are near-duplicates when their hashes differ in at most DUPLICATE_RADIUS bits.
+
+# Side of the hash grid: HASH_SIZE x HASH_SIZE bits
+HASH_SIZE = 8
+
+# Side of the grayscale image pHash takes its DCT of (4x the hash, as in the usual pHash)
+PHASH_SIZE = 32
+
+# Smallest size a file is decoded at for hashing, so JPEGs decode at 1/8 scale and PNGs are
+# reduced a strip at a time (see resize.plan_decode)
+HASH_DECODE_SIZE = 64
+
+# Bit differences up to which two photos count as near-duplicates
+DUPLICATE_RADIUS = 6
+
+# Chunks the index splits each hash into (16 bits each), which suits indexes of tens of
+# thousands to millions of hashes
+INDEX_CHUNKS = 4
+
+# What a batch does with a near-duplicate: 'reuse' copies the first photo's outputs (and scores),
+# 'report' leaves it out and only reports it
+DEDUPE_MODES = ('reuse', 'report')
+
+# Bit counts of every byte, for counting differences over arrays of hashes
+POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+# Orthonormal DCT-II matrix: dct @ x @ dct.T is the 2D DCT of a square block x
+@lru_cache(maxsize=None)
+def dct_matrix(size):
+    n = np.arange(size)
+    matrix = np.sqrt(2 / size) * np.cos(np.pi * (2 * n[None, :] + 1) * n[:, None] / (2 * size))
+    matrix[0] /= np.sqrt(2)
+    return matrix
+
+# Pack a boolean grid into an int, first bit highest
+def pack_bits(bits):
+    return int.from_bytes(np.packbits(bits.ravel()).tobytes(), 'big')
+
+# Fail early on an unknown dedupe mode
+def check_dedupe(dedupe):
+    if dedupe not in (None,) + DEDUPE_MODES:
+        raise ValueError(f"Unknown dedupe mode {dedupe!r}; choose from {', '.join(DEDUPE_MODES)}")
+
+# Open a file and decode it cheaply for hashing, as a grayscale image
+def hash_decode(img_path):
+    with Image.open(img_path) as img:
+        decoded = plan_decode(img, (HASH_DECODE_SIZE, HASH_DECODE_SIZE))
+        gray = decoded.convert('L')
+        if decoded is not img:
+            decoded.close()
+    return gray
+
+# dHash: whether each pixel is brighter than its right neighbour on a (HASH_SIZE + 1) x HASH_SIZE thumbnail
+def dhash(img):
+    pixels = np.asarray(img.convert('L').resize((HASH_SIZE + 1, HASH_SIZE), Image.Resampling.BOX), dtype=np.int16)
+    return pack_bits(pixels[:, 1:] > pixels[:, :-1])
+
+# pHash: whether each of the lowest HASH_SIZE x HASH_SIZE DCT frequencies of a PHASH_SIZE thumbnail
+# is above their median (the DC term is left out of the median, as it only carries brightness)
+def phash(img):
+    pixels = np.asarray(img.convert('L').resize((PHASH_SIZE, PHASH_SIZE), Image.Resampling.BOX), dtype=np.float64)
+    dct = dct_matrix(PHASH_SIZE)
+    low = (dct @ pixels @ dct.T)[:HASH_SIZE, :HASH_SIZE]
+    return pack_bits(low > np.median(low.ravel()[1:]))
+
+# Hash functions by name
+HASHES = {'phash': phash, 'dhash': dhash}
+
+# Hash of one file, cached by path and modification time so repeated runs decode it once.
+# Returns None for a file that cannot be read, which is then never matched.
+@lru_cache(maxsize=65536)
+def file_hash(img_path, mtime_ns, kind='phash'):
+    try:
+        return HASHES[kind](hash_decode(img_path))
+    except Exception:
+        return None
+
+# Hash files on a thread pool (Pillow releases the GIL while decoding), in order
+def hash_files(img_paths, kind='phash', workers=None):
+    def hash_one(img_path):
+        try:
+            return file_hash(img_path, os.stat(img_path).st_mtime_ns, kind)
+        except OSError:
+            return None
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        return list(executor.map(hash_one, img_paths))
+
+# Hamming distance between two hashes
+def hamming(a, b):
+    return (a ^ b).bit_count()
+
+# Bit ranges (shift, mask) splitting a `bits`-bit hash into `count` nearly equal chunks
+def chunk_ranges(bits, count):
+    ranges = []
+    shift = bits
+    for i in range(count):
+        width = bits // count + (i < bits % count)
+        shift -= width
+        ranges.append((shift, (1 << width) - 1))
+    return ranges
+
+# XOR masks of every value within `radius` bits of a chunk `width` bits wide
+def probe_masks(width, radius):
+    return [sum(1 << bit for bit in flipped) for count in range(radius + 1) for flipped in combinations(range(width), count)]
+
+# A multi-index of hashes for Hamming-radius queries up to `radius`. Each hash is split into
+# `chunks` chunks and filed under every chunk's value. Two hashes within the radius differ in at
+# most radius // chunks bits in at least one chunk (pigeonhole), so a query only looks up the
+# chunk values that close to its own and checks the few hashes filed there, not the whole index.
+def make_index(radius=DUPLICATE_RADIUS, chunks=INDEX_CHUNKS, bits=HASH_SIZE * HASH_SIZE):
+    ranges = chunk_ranges(bits, chunks)
+    return {'Radius': radius, 'Chunks': ranges, 'Tables': [{} for _ in ranges],
+            'Probes': [probe_masks(mask.bit_length(), radius // chunks) for _, mask in ranges],
+            'Hashes': [], 'Keys': []}
+
+# Add a hash to the index under `key` (any value, e.g. a file name)
+def add_hash(index, hash_value, key):
+    position = len(index['Hashes'])
+    index['Hashes'].append(hash_value)
+    index['Keys'].append(key)
+    for (shift, mask), table in zip(index['Chunks'], index['Tables']):
+        table.setdefault((hash_value >> shift) & mask, []).append(position)
+    return position
+
+# Every indexed (distance, key) within `radius` (the index's radius at most) of a hash, closest first
+def query(index, hash_value, radius=None):
+    radius = index['Radius'] if radius is None else min(radius, index['Radius'])
+    hashes = index['Hashes']
+    seen = set()
+    matches = []
+    for (shift, mask), table, probes in zip(index['Chunks'], index['Tables'], index['Probes']):
+        chunk = (hash_value >> shift) & mask
+        for probe in probes:
+            for position in table.get(chunk ^ probe, ()):
+                if position in seen:
+                    continue
+                seen.add(position)
+                distance = (hash_value ^ hashes[position]).bit_count()
+                if distance <= radius:
+                    matches.append((distance, position))
+    return [(distance, index['Keys'][position]) for distance, position in sorted(matches)]
+
+# Closest indexed (distance, key) within the index's radius, or None
+def nearest(index, hash_value):
+    matches = query(index, hash_value)
+    return matches[0] if matches else None
+
+# Near-duplicates among files, in order: every file within `radius` of an earlier file that is not
+# itself a duplicate. Returns position -> (position of that first file, distance).
+def find_duplicates(img_paths, radius=DUPLICATE_RADIUS, kind='phash', workers=None):
+    index = make_index(radius)
+    duplicates = {}
+    for position, hash_value in enumerate(hash_files(img_paths, kind, workers)):
+        if hash_value is None:
+            continue
+        match = nearest(index, hash_value)
+        if match is None:
+            add_hash(index, hash_value, position)
+        else:
+            duplicates[position] = (match[1], match[0])
+    return duplicates
+
+# Split batch jobs (see batch.py) into the jobs to run and the near-duplicates of earlier ones.
+# Returns the jobs and a list of (duplicate job, file name of its original, distance).
+def split_duplicates(jobs, radius=DUPLICATE_RADIUS):
+    found = find_duplicates([job[2] for job in jobs], radius)
+    originals = [job for position, job in enumerate(jobs) if position not in found]
+    duplicates = [(jobs[position], jobs[original][1], distance) for position, (original, distance) in sorted(found.items())]
+    return originals, duplicates
+
+# Copy an original's output file(s) for a duplicate, renamed after it: x.jpg -> y.jpg,
+# x_square.jpg -> y_square.jpg. Output may be a path or a dict of them. Returns the new paths.
+def copy_outputs(output, original_name, file_name):
+    if isinstance(output, dict):
+        return {name: copy_outputs(path, original_name, file_name) for name, path in output.items()}
+    directory, base_name = os.path.split(output)
+    new_path = os.path.join(directory, os.path.splitext(file_name)[0] + base_name[len(os.path.splitext(original_name)[0]):])
+    shutil.copyfile(output, new_path)
+    return new_path
+
+# Result rows for the near-duplicates split_duplicates set aside, from their originals' results.
+# With 'reuse' each gets a copy of its original's outputs and result; with 'report' it has no
+# output. Every row names its original ('Duplicate Of') and the distance between their hashes.
+def duplicate_results(duplicates, results, dedupe):
+    by_file = {result['File']: result for result in results}
+    rows = []
+    for job, original_name, distance in duplicates:
+        file_name = job[1]
+        original = by_file[original_name]
+        if dedupe == 'report':
+            row = {'File': file_name, 'Output': None, 'Success': True, 'Error': None}
+        elif not original['Success']:
+            row = {'File': file_name, 'Output': None, 'Success': False, 'Error': original['Error']}
+        else:
+            row = {key: value for key, value in original.items() if key not in ('Trace', 'Skipped')}
+            row.update(File=file_name, Output=copy_outputs(original['Output'], original_name, file_name))
+        row.update({'Duplicate Of': original_name, 'Hash Distance': distance})
+        rows.append(row)
+    return rows
+
+# Distance from a hash to every hash in a uint64 array, for the brute-force comparison
+def hamming_all(hashes, hash_value):
+    difference = hashes ^ np.uint64(hash_value)
+    return POPCOUNT[difference.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+# Cost of building and querying the index on `size` random hashes, `duplicate_rate` of which are
+# near-duplicates of an earlier hash (a few bits flipped, up to the radius). Queries are timed
+# against a brute-force scan of every hash; recall is the share of planted duplicates found.
+def benchmark_index(size=200_000, radius=DUPLICATE_RADIUS, duplicate_rate=0.2, queries=2000, seed=0):
+    rng = np.random.default_rng(seed)
+    bits = HASH_SIZE * HASH_SIZE
+    hashes = [int(value) for value in rng.integers(0, 2 ** bits, size=size, dtype=np.uint64)]
+    planted = {}
+    # In order, so every original is final before it is copied
+    for position in np.sort(rng.choice(np.arange(1, size), size=int(size * duplicate_rate), replace=False)):
+        original = int(rng.integers(0, position))
+        flips = rng.choice(bits, size=int(rng.integers(0, radius + 1)), replace=False)
+        hashes[position] = hashes[original] ^ sum(1 << int(bit) for bit in flips)
+        planted[int(position)] = original
+
+    start = time.perf_counter()
+    index = make_index(radius)
+    for position, hash_value in enumerate(hashes):
+        add_hash(index, hash_value, position)
+    build = time.perf_counter() - start
+
+    sample = rng.choice(list(planted), size=min(queries, len(planted)), replace=False)
+    start = time.perf_counter()
+    found = sum(planted[position] in {key for _, key in query(index, hashes[position])} for position in sample)
+    indexed = (time.perf_counter() - start) / len(sample)
+
+    array = np.array(hashes, dtype=np.uint64)
+    brute_sample = sample[:max(1, len(sample) // 20)]
+    start = time.perf_counter()
+    for position in brute_sample:
+        np.flatnonzero(hamming_all(array, hashes[position]) <= radius)
+    brute = (time.perf_counter() - start) / len(brute_sample)
+
+    bucket_sizes = [len(bucket) for table in index['Tables'] for bucket in table.values()]
+    return {'Hashes': size, 'Radius': radius, 'Build (s)': build, 'Query (ms)': indexed * 1000,
+            'Brute Force Query (ms)': brute * 1000, 'Speedup': brute / indexed, 'Recall': found / len(sample),
+            'Mean Bucket': float(np.mean(bucket_sizes))}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the perceptual-hash index, or list near-duplicates in a folder")
+    parser.add_argument('input_dir', nargs='?', help="folder to list near-duplicates in")
+    parser.add_argument('--radius', type=int, default=DUPLICATE_RADIUS)
+    parser.add_argument('--hash', choices=list(HASHES), default='phash')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 500_000])
+    args = parser.parse_args()
+
+    if args.input_dir:
+        from batch import list_images
+        file_names = list_images(args.input_dir)
+        paths = [os.path.join(args.input_dir, file_name) for file_name in file_names]
+        start = time.perf_counter()
+        duplicates = find_duplicates(paths, args.radius, args.hash)
+        print(f"{len(duplicates)} near-duplicates among {len(paths)} images ({time.perf_counter() - start:.2f}s)")
+        for position, (original, distance) in sorted(duplicates.items()):
+            print(f"  {file_names[position]} ~ {file_names[original]} (distance {distance})")
+    else:
+        for size in args.sizes:
+            result = benchmark_index(size, args.radius)
+            print(f"{size} hashes: built in {result['Build (s)']:.2f}s, {result['Query (ms)']:.3f}ms per query "
+                  f"({result['Speedup']:.0f}x faster than brute force at {result['Brute Force Query (ms)']:.2f}ms), "
+                  f"recall {result['Recall']:.0%}, mean bucket {result['Mean Bucket']:.1f}")
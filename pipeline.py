@@ -0,0 +1,130 @@
+import os
+import queue
+import threading
+from PIL import Image
+from batch import IMAGE_EXTENSIONS
+
+# Marker passed down a queue once a stage has no more items
+DONE = object()
+
+# Walk a directory lazily, so the pipeline never holds the full listing of a huge folder
+def iter_images(input_dir):
+    with os.scandir(input_dir) as entries:
+        for entry in entries:
+            if entry.is_file() and entry.name.endswith(IMAGE_EXTENSIONS):
+                yield entry.name
+
+# Default read stage: open and fully decode (Pillow releases the GIL while decoding)
+def read_image(img_path):
+    img = Image.open(img_path)
+    img.load()
+    return img
+
+# Default encode stage: write the result with Pillow (which also releases the GIL)
+def save_image(result, output_path):
+    result.save(output_path)
+
+# Put an item on a bounded queue, giving up if the pipeline is being shut down
+def put(q, item, stop):
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return
+        except queue.Full:
+            pass
+
+# Run `workers` threads that apply fn to each item of in_q and pass it on to out_q.
+# An item is (file_name, value, error); once an error is set the item skips the remaining stages.
+# The last thread to finish tells every worker of the next stage that the input is done.
+def start_stage(fn, in_q, out_q, workers, next_workers, stop):
+    remaining = [workers]
+    lock = threading.Lock()
+
+    def work():
+        while not stop.is_set():
+            try:
+                item = in_q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if item is DONE:
+                break
+            file_name, value, error = item
+            if error is None:
+                try:
+                    value = fn(file_name, value)
+                except Exception as e:
+                    value, error = None, f"{type(e).__name__}: {e}"
+            put(out_q, (file_name, value, error), stop)
+
+        with lock:
+            remaining[0] -= 1
+            last = remaining[0] == 0
+        if last:
+            for _ in range(next_workers):
+                put(out_q, DONE, stop)
+
+    threads = [threading.Thread(target=work, daemon=True) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+    return threads
+
+# Streaming pipeline: read, transform and encode run as separate thread stages joined by bounded
+# queues, so disk I/O overlaps with the CPU work and at most a few images per queue are in memory
+# however large the input directory is.
+#   read(img_path) -> decoded image, transform(decoded) -> result, save(result, output_path)
+# save may return a dict of extra fields for the file's result. Yields one result dict per file
+# as it completes.
+def stream_images(input_dir, output_dir, transform, read=read_image, save=save_image,
+                  read_workers=2, transform_workers=None, encode_workers=2, queue_size=4):
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+    if transform_workers is None:
+        transform_workers = os.cpu_count() or 1
+
+    stop = threading.Event()
+    names = queue.Queue(queue_size)
+    decoded = queue.Queue(queue_size)
+    transformed = queue.Queue(queue_size)
+    results = queue.Queue(queue_size)
+
+    def encode(file_name, result):
+        extra = save(result, os.path.join(output_dir, file_name))
+        return extra or {}
+
+    start_stage(lambda file_name, _: read(os.path.join(input_dir, file_name)), names, decoded,
+                read_workers, transform_workers, stop)
+    start_stage(lambda _, img: transform(img), decoded, transformed, transform_workers, encode_workers, stop)
+    start_stage(encode, transformed, results, encode_workers, 1, stop)
+
+    # A failure to list input_dir still ends the stages, and is raised to the caller once the
+    # files listed before it are through
+    feed_errors = []
+
+    def feed():
+        try:
+            for file_name in iter_images(input_dir):
+                put(names, (file_name, None, None), stop)
+        except Exception as e:
+            feed_errors.append(e)
+        finally:
+            for _ in range(read_workers):
+                put(names, DONE, stop)
+
+    threading.Thread(target=feed, daemon=True).start()
+
+    try:
+        while True:
+            item = results.get()
+            if item is DONE:
+                if feed_errors:
+                    raise feed_errors[0]
+                return
+            file_name, extra, error = item
+            result = {'File': file_name, 'Output': os.path.join(output_dir, file_name),
+                      'Success': error is None, 'Error': error}
+            if extra:
+                result.update(extra)
+            yield result
+    finally:
+        # Unblock the stage threads if the caller stops consuming early
+        stop.set()
@@ -1,75 +1,199 @@
-from PIL import Image
+from PIL import ExifTags, Image, ImageOps
+import numpy as np
 import os
-import cv2  # Required for content-aware and feature-based resizing
+from functools import partial
+from batch import run_batch, report_results
+from pipeline import stream_images
+from manifest import MANIFEST_NAME
+from tracing import start_trace, stage
+from encoders import ENCODER_PROFILES, get_profile, save_encoded, capturing, write_output
+from seam_carving import seam_carve_resize
+from resize import fit_size, plan_decode
+from strip_decode import reducible
+
+# Long side of the Padding Resize canvas
+PADDING_MAX_SIZE = 1080
 
 # Ensure the output directory exists
 def ensure_output_dir(output_dir):
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
 
+# Decode a file once: the PIL image for the Pillow methods and, when needed, an RGB NumPy array
+# of the same pixels for the OpenCV methods. The array is turned upright by its EXIF orientation,
+# as cv2.imread did; the PIL image is left as stored, as Image.open did. With load=False the file
+# is only opened, so a method can still decode it at reduced size (see resize.plan_decode).
+def decode_image(img_path, need_array=True, load=True):
+    img = Image.open(img_path)
+    if load or need_array:
+        img.load()
+    pixels = None
+    if need_array:
+        upright = img
+        if img.getexif().get(ExifTags.Base.Orientation, 1) != 1:
+            upright = ImageOps.exif_transpose(img)
+        pixels = np.asarray(upright if upright.mode == 'RGB' else upright.convert('RGB'))
+    return img, pixels
+
+# Save a method's output and return the encoder's choices. With the default profile PIL images
+# are saved through Pillow and RGB arrays through OpenCV, as before; other profiles encode both
+# through encoders.save_encoded.
+def save_result(result, output_path, profile='default', max_bytes=None):
+    if isinstance(result, np.ndarray):
+        if profile == 'default' and max_bytes is None:
+            import cv2  # Only needed to write array results
+            pixels = cv2.cvtColor(result, cv2.COLOR_RGB2BGR)
+            if capturing():
+                ok, data = cv2.imencode(os.path.splitext(output_path)[1], pixels)
+                if not ok:
+                    raise IOError(f"cv2.imencode could not encode {output_path}")
+                size = write_output(data.tobytes(), output_path)
+            else:
+                if not cv2.imwrite(output_path, pixels):
+                    raise IOError(f"cv2.imwrite could not write {output_path}")
+                size = os.path.getsize(output_path)
+            return {'Output': output_path, 'Quality': None, 'Bytes': size, 'Trials': 1, 'Within Budget': None}
+        result = Image.fromarray(result)
+    return save_encoded(result, output_path, profile, max_bytes)
+
+# Simple Resize on a decoded image
+def simple_resize(img):
+    return img.resize((800, 800), Image.Resampling.LANCZOS)  # Updated from Image.ANTIALIAS
+
+# Padding Resize on an opened image: a white square the size of the long side, capped at
+# PADDING_MAX_SIZE. Larger images are scaled down to fit before they are padded, decoding at
+# reduced size when the file has not been loaded yet, so neither the padding nor the decode
+# happens at full resolution.
+def padding_resize(img):
+    max_size = min(max(img.size), PADDING_MAX_SIZE)
+    if max(img.size) > max_size:
+        new_size = fit_size(img.size[0], img.size[1], max_size, max_size)
+        decoded = reducible(plan_decode(img, new_size))
+        resized = decoded.resize(new_size, Image.Resampling.LANCZOS)
+        if decoded is not img:
+            decoded.close()
+        img = resized
+    new_img = Image.new('RGB', (max_size, max_size), (255, 255, 255))  # White background
+    new_img.paste(img, (int((max_size - img.size[0]) / 2), int((max_size - img.size[1]) / 2)))
+    return new_img
+
+# Content-Aware Resize on an RGB array: seam carve to a 4:5 portrait, then scale to 800 wide
+def content_aware_resize(pixels):
+    return seam_carve_resize(pixels, 800, 1000)
+
+# Methods run by the decode-once pass: name -> (resize function, input, output subdirectory)
+# 'image' methods get the decoded PIL image, 'array' methods the shared RGB array, and 'source'
+# methods the PIL image as opened, decoded only if another method needs it
+RESIZE_METHODS = {
+    'Simple Resize': (simple_resize, 'image', 'simple_resize'),
+    'Padding Resize': (padding_resize, 'source', 'padding_resize'),
+    'Content-Aware Resize': (content_aware_resize, 'array', 'content_aware_resize'),
+}
+
+# Work unit that runs one registered method on one file
+# Returns the encoder's choices and, when tracing is on, the file's trace record
+def run_method_file(method, img_path, output_path, profile='default', max_bytes=None):
+    record = start_trace(img_path)
+    resize_function, input_kind, _ = RESIZE_METHODS[method]
+    with stage(record, 'decode'):
+        img, pixels = decode_image(img_path, need_array=input_kind == 'array', load=input_kind != 'source')
+    with stage(record, 'resize'):
+        result = resize_function(pixels if input_kind == 'array' else img)
+    with stage(record, 'encode'):
+        encoded = save_result(result, output_path, profile, max_bytes)
+    return dict(encoded, Trace=record)
+
+# Simple Resize work unit
+def simple_resize_file(img_path, output_path, profile='default', max_bytes=None):
+    return run_method_file('Simple Resize', img_path, output_path, profile, max_bytes)
+
+# Padding Resize work unit
+def padding_resize_file(img_path, output_path, profile='default', max_bytes=None):
+    return run_method_file('Padding Resize', img_path, output_path, profile, max_bytes)
+
+# Content-Aware Resize work unit
+def content_aware_resize_file(img_path, output_path, profile='default', max_bytes=None):
+    return run_method_file('Content-Aware Resize', img_path, output_path, profile, max_bytes)
+
+# Decode-once work unit: output_paths maps method names to output paths, and every method
+# gets the same decoded image and pixel array. The encoder's choices are reported per method.
+def all_methods_file(img_path, output_paths, profile='default', max_bytes=None):
+    record = start_trace(img_path)
+    need_array = any(RESIZE_METHODS[method][1] == 'array' for method in output_paths)
+    load = any(RESIZE_METHODS[method][1] != 'source' for method in output_paths)
+    with stage(record, 'decode'):
+        img, pixels = decode_image(img_path, need_array=need_array, load=load)
+    encoded = {}
+    for method, output_path in output_paths.items():
+        resize_function, input_kind, _ = RESIZE_METHODS[method]
+        with stage(record, f"{method}: resize"):
+            result = resize_function(pixels if input_kind == 'array' else img)
+        with stage(record, f"{method}: encode"):
+            encoded[method] = save_result(result, output_path, profile, max_bytes)
+    fields = {field: {method: info[field] for method, info in encoded.items()}
+              for field in ('Output', 'Quality', 'Bytes', 'Trials', 'Within Budget')}
+    return dict(fields, Trace=record)
+
 # Simple Resize method
-def process_images_simple(input_dir, output_dir):
-    ensure_output_dir(output_dir)
-    for file_name in os.listdir(input_dir):
-        if file_name.endswith(('.jpg', '.jpeg', '.png')):
-            img_path = os.path.join(input_dir, file_name)
-            img = Image.open(img_path)
-            img_resized = img.resize((800, 800), Image.Resampling.LANCZOS)  # Updated from Image.ANTIALIAS
-            output_path = os.path.join(output_dir, file_name)
-            img_resized.save(output_path)
-            print(f"Simple resize completed for: {file_name}")
+# Like every batch function here, it takes dedupe as resize.process_images does (see batch.run_batch)
+def process_images_simple(input_dir, output_dir, workers=None, trace_path=None, profile='default', max_bytes=None,
+                          dedupe=None):
+    get_profile(profile)
+    return run_batch(input_dir, output_dir, partial(simple_resize_file, profile=profile, max_bytes=max_bytes),
+                     workers=workers, trace_path=trace_path, dedupe=dedupe)
 
 # Padding Resize method
-def process_images_padding(input_dir, output_dir):
-    ensure_output_dir(output_dir)
-    for file_name in os.listdir(input_dir):
-        if file_name.endswith(('.jpg', '.jpeg', '.png')):
-            img_path = os.path.join(input_dir, file_name)
-            img = Image.open(img_path)
-            max_size = max(img.size)
-            new_img = Image.new('RGB', (max_size, max_size), (255, 255, 255))  # White background
-            new_img.paste(img, (int((max_size - img.size[0]) / 2), int((max_size - img.size[1]) / 2)))
-            output_path = os.path.join(output_dir, file_name)
-            new_img.save(output_path)
-            print(f"Padding resize completed for: {file_name}")
-
-# Content-Aware Resize (Feature-Based) method using OpenCV
-def process_images_content_aware(input_dir, output_dir):
-    ensure_output_dir(output_dir)
-    for file_name in os.listdir(input_dir):
-        if file_name.endswith(('.jpg', '.jpeg', '.png')):
-            img_path = os.path.join(input_dir, file_name)
-            img = cv2.imread(img_path)
-
-            # Resize to a target size, maintaining aspect ratio (example 800px width)
-            target_width = 800
-            height, width = img.shape[:2]
-            scale = target_width / width
-            new_size = (target_width, int(height * scale))
-            img_resized = cv2.resize(img, new_size, interpolation=cv2.INTER_AREA)
-
-            output_path = os.path.join(output_dir, file_name)
-            cv2.imwrite(output_path, img_resized)
-            print(f"Content-aware resize completed for: {file_name}")
+def process_images_padding(input_dir, output_dir, workers=None, trace_path=None, profile='default', max_bytes=None,
+                           dedupe=None):
+    get_profile(profile)
+    return run_batch(input_dir, output_dir, partial(padding_resize_file, profile=profile, max_bytes=max_bytes),
+                     workers=workers, trace_path=trace_path, dedupe=dedupe)
+
+# Content-Aware Resize method
+def process_images_content_aware(input_dir, output_dir, workers=None, trace_path=None, profile='default', max_bytes=None,
+                                 dedupe=None):
+    get_profile(profile)
+    return run_batch(input_dir, output_dir, partial(content_aware_resize_file, profile=profile, max_bytes=max_bytes),
+                     workers=workers, trace_path=trace_path, dedupe=dedupe)
+
+# All registered methods in a single pass over the input directory
+# output_dirs maps method names to output directories. With a manifest_path, files unchanged
+# since the last run of the same methods are skipped.
+def process_images_all(input_dir, output_dirs, workers=None, manifest_path=None, trace_path=None,
+                       profile='default', max_bytes=None, dedupe=None):
+    get_profile(profile)
+    params = {'methods': sorted(output_dirs),
+              'encoder': {'profile': profile, 'settings': ENCODER_PROFILES[profile], 'max_bytes': max_bytes}}
+    return run_batch(input_dir, output_dirs, partial(all_methods_file, profile=profile, max_bytes=max_bytes),
+                     workers=workers, manifest_path=manifest_path, params=params, trace_path=trace_path,
+                     dedupe=dedupe)
+
+# Streaming version of a single method: decoding, resizing and encoding overlap on separate
+# threads with bounded queues in between. Yields one result dict per file as it completes.
+def stream_method(method, input_dir, output_dir, profile='default', max_bytes=None, **stage_options):
+    get_profile(profile)
+    resize_function, input_kind, _ = RESIZE_METHODS[method]
+    need_array = input_kind == 'array'
+    return stream_images(input_dir, output_dir,
+                         lambda decoded: resize_function(decoded[1] if need_array else decoded[0]),
+                         read=lambda img_path: decode_image(img_path, need_array=need_array,
+                                                           load=input_kind != 'source'),
+                         save=lambda result, output_path: save_result(result, output_path, profile, max_bytes),
+                         **stage_options)
 
 # Main function to run the resizing on different methods
 def main(test_set='frozen_real_images'):
     input_dir = f'/Users/jameswinslow/Documents/Projects/DataScience/IGPhotoResizer/{test_set}'
     
+    output_root = '/Users/jameswinslow/Documents/Projects/DataScience/IGPhotoResizer/output'
+
     # Output directories for different methods
-    output_dir_simple = '/Users/jameswinslow/Documents/Projects/DataScience/IGPhotoResizer/output/simple_resize'
-    output_dir_padding = '/Users/jameswinslow/Documents/Projects/DataScience/IGPhotoResizer/output/padding_resize'
-    output_dir_content_aware = '/Users/jameswinslow/Documents/Projects/DataScience/IGPhotoResizer/output/content_aware_resize'
+    output_dirs = {method: os.path.join(output_root, subdir) for method, (_, _, subdir) in RESIZE_METHODS.items()}
 
-    # Running all methods
-    print("Starting Simple Resize...")
-    process_images_simple(input_dir, output_dir_simple)
-    
-    print("Starting Padding Resize...")
-    process_images_padding(input_dir, output_dir_padding)
-    
-    print("Starting Content-Aware Resize...")
-    process_images_content_aware(input_dir, output_dir_content_aware)
+    # Running all methods, decoding each image once
+    print("Starting Simple, Padding and Content-Aware Resize...")
+    report_results(process_images_all(input_dir, output_dirs, manifest_path=os.path.join(output_root, MANIFEST_NAME)),
+                   "All methods")
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,174 @@
+import importlib.util
+import json
+import os
+import time
+import numpy as np
+import PIL
+from PIL import Image, ImageOps
+from batch import list_images
+
+# Resampling backends: name -> (library, filter). Pillow is always there; OpenCV and pyvips are
+# only imported when one of their backends runs.
+BACKENDS = {
+    'pillow-lanczos': ('pillow', Image.Resampling.LANCZOS),
+    'pillow-lanczos-gap': ('pillow', Image.Resampling.LANCZOS),
+    'pillow-bicubic': ('pillow', Image.Resampling.BICUBIC),
+    'pillow-bilinear': ('pillow', Image.Resampling.BILINEAR),
+    'opencv-area': ('opencv', 'INTER_AREA'),
+    'opencv-lanczos': ('opencv', 'INTER_LANCZOS4'),
+    'opencv-linear': ('opencv', 'INTER_LINEAR'),
+    'pyvips-lanczos3': ('pyvips', 'lanczos3'),
+}
+
+# The resize the rest of the code has always done, used as the quality reference
+DEFAULT_BACKEND = 'pillow-lanczos'
+
+# reducing_gap for 'pillow-lanczos-gap': a box reduce first, then LANCZOS over the last 2x
+REDUCING_GAP = 2.0
+
+# Scale factor ranges (output / input, per side) tuned separately
+SCALE_RANGES = [(0.0, 0.125), (0.125, 0.25), (0.25, 0.5), (0.5, 1.0), (1.0, 4.0)]
+
+# Lowest SSIM against the reference, on the worst sample image, a backend needs to be picked
+SSIM_THRESHOLD = 0.98
+
+# Largest output measured; bigger ones are measured on a central crop of the source at the same scale
+MAX_TUNE_PIXELS = 2_000_000
+
+# Where the tuning is kept between runs
+TUNING_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.resample_tuning.json')
+
+# Tunings already loaded in this process, by path
+tuning_cache = {}
+
+# Backends whose library is installed
+def available_backends():
+    installed = {'pillow': True,
+                 'opencv': importlib.util.find_spec('cv2') is not None,
+                 'pyvips': importlib.util.find_spec('pyvips') is not None}
+    return [name for name, (library, _) in BACKENDS.items() if installed[library]]
+
+# Resize a PIL image to `size` with a backend. OpenCV and pyvips work on L, RGB and RGBA
+# pixels; other modes always go through Pillow.
+def resample(img, size, backend=DEFAULT_BACKEND):
+    if backend == 'auto':
+        backend = choose_backend(size[0] / img.size[0])
+    library, resample_filter = BACKENDS[backend]
+    if library == 'pillow' or img.mode not in ('L', 'RGB', 'RGBA'):
+        if library != 'pillow':
+            resample_filter = Image.Resampling.LANCZOS
+        reducing_gap = REDUCING_GAP if backend == 'pillow-lanczos-gap' else None
+        return img.resize(size, resample_filter, reducing_gap=reducing_gap)
+
+    if library == 'opencv':
+        import cv2
+        return Image.fromarray(cv2.resize(np.asarray(img), size, interpolation=getattr(cv2, resample_filter)), img.mode)
+
+    import pyvips
+    bands = len(img.getbands())
+    vips_img = pyvips.Image.new_from_memory(img.tobytes(), img.size[0], img.size[1], bands, 'uchar')
+    resized = vips_img.resize(size[0] / img.size[0], vscale=size[1] / img.size[1], kernel=resample_filter)
+    # Rounding inside libvips can leave the result a pixel off the requested size
+    resized = resized.crop(0, 0, min(resized.width, size[0]), min(resized.height, size[1]))
+    out = Image.frombytes(img.mode, (resized.width, resized.height), resized.write_to_memory())
+    return out if out.size == tuple(size) else out.resize(size, Image.Resampling.LANCZOS)
+
+# What a tuning depends on: the Pillow version, the backends installed and the quality threshold
+def tuning_key(threshold=SSIM_THRESHOLD):
+    return {'Pillow': PIL.__version__, 'Backends': available_backends(), 'Threshold': threshold}
+
+# Benchmark every installed backend on a sample of the images in input_dir, at one scale per range.
+# Each backend is timed (best of `repeats`) and scored by SSIM against DEFAULT_BACKEND's output;
+# per range, the fastest backend whose worst SSIM reaches the threshold is picked. The tuning is
+# saved to tuning_path and returned.
+def autotune(input_dir, sample_size=8, threshold=SSIM_THRESHOLD, repeats=3, tuning_path=TUNING_PATH):
+    from skimage.metrics import structural_similarity as ssim
+
+    file_names = list_images(input_dir)
+    sample = file_names[::max(1, len(file_names) // sample_size)][:sample_size]
+    backends = available_backends()
+
+    measurements = {}
+    for file_name in sample:
+        img = Image.open(os.path.join(input_dir, file_name))
+        img = img.convert('RGB') if img.mode not in ('L', 'RGB') else img
+        img.load()
+        for low, high in SCALE_RANGES:
+            # Geometric middle of the range (the first range has no lower end)
+            scale = np.sqrt(max(low, high / 4) * high)
+            source = img
+            shrink = np.sqrt(MAX_TUNE_PIXELS / (img.size[0] * img.size[1] * scale * scale))
+            if shrink < 1:
+                width, height = round(img.size[0] * shrink), round(img.size[1] * shrink)
+                left, top = (img.size[0] - width) // 2, (img.size[1] - height) // 2
+                source = img.crop((left, top, left + width, top + height))
+            size = (max(1, round(source.size[0] * scale)), max(1, round(source.size[1] * scale)))
+            reference = np.asarray(ImageOps.grayscale(resample(source, size, DEFAULT_BACKEND)))
+
+            for backend in backends:
+                try:
+                    times = []
+                    for _ in range(repeats):
+                        start = time.perf_counter()
+                        out = resample(source, size, backend)
+                        times.append(time.perf_counter() - start)
+                except (ImportError, OSError):
+                    continue
+                score = ssim(reference, np.asarray(ImageOps.grayscale(out)), data_range=255)
+                entry = measurements.setdefault((low, high), {}).setdefault(backend, {'Time': [], 'SSIM': []})
+                entry['Time'].append(min(times))
+                entry['SSIM'].append(score)
+
+    ranges = []
+    for (low, high), by_backend in measurements.items():
+        summary = {backend: {'Time': float(np.sum(entry['Time'])), 'SSIM': float(np.min(entry['SSIM']))}
+                   for backend, entry in by_backend.items()}
+        passing = [backend for backend, stats in summary.items() if stats['SSIM'] >= threshold]
+        best = min(passing, key=lambda backend: summary[backend]['Time'])
+        ranges.append({'Low': low, 'High': high, 'Backend': best, 'Backends': summary})
+
+    tuning = {'Key': tuning_key(threshold), 'Images': len(sample), 'Ranges': ranges}
+    with open(tuning_path, 'w') as f:
+        json.dump(tuning, f, indent=2)
+    tuning_cache[tuning_path] = tuning
+    return tuning
+
+# The saved tuning, or None if there is none or it was made for different backends or settings
+def load_tuning(tuning_path=TUNING_PATH, threshold=SSIM_THRESHOLD):
+    if tuning_path not in tuning_cache:
+        tuning = None
+        if os.path.exists(tuning_path):
+            with open(tuning_path) as f:
+                tuning = json.load(f)
+            if tuning.get('Key') != tuning_key(threshold):
+                tuning = None
+        tuning_cache[tuning_path] = tuning
+    return tuning_cache[tuning_path]
+
+# Backend the tuning picked for a scale factor; DEFAULT_BACKEND when the scale is untuned
+def choose_backend(scale, tuning_path=TUNING_PATH):
+    tuning = load_tuning(tuning_path)
+    if tuning is not None:
+        for entry in tuning['Ranges']:
+            if entry['Low'] <= scale < entry['High']:
+                return entry['Backend']
+    return DEFAULT_BACKEND
+
+# Print a tuning as one line per scale range
+def report_tuning(tuning):
+    for entry in tuning['Ranges']:
+        timings = ', '.join(f"{backend} {stats['Time'] * 1000:.0f}ms/{stats['SSIM']:.3f}"
+                            for backend, stats in sorted(entry['Backends'].items(), key=lambda item: item[1]['Time']))
+        print(f"scale {entry['Low']:g}-{entry['High']:g}: {entry['Backend']}  ({timings})")
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Pick the fastest resampling backend per scale range")
+    parser.add_argument('input_dir', help="folder of images to sample")
+    parser.add_argument('--sample', type=int, default=8)
+    parser.add_argument('--threshold', type=float, default=SSIM_THRESHOLD)
+    parser.add_argument('--output', default=TUNING_PATH)
+    args = parser.parse_args()
+
+    report_tuning(autotune(args.input_dir, args.sample, args.threshold, tuning_path=args.output))
+    print(f"Tuning saved to {args.output}")
@@ -1,36 +1,175 @@
 from PIL import Image, ImageOps
-from colorthief import ColorThief
+import math
+import numpy as np
 import os
+from functools import partial
+from batch import run_batch, report_results
+from pipeline import stream_images
+from manifest import MANIFEST_NAME
+from tracing import start_trace, stage
+from encoders import ENCODER_PROFILES, get_profile, save_encoded
+from resampling import DEFAULT_BACKEND, resample, load_tuning, autotune
+from scheduler import PEAK_FACTOR, JOB_OVERHEAD, decoded_bytes
+from strip_decode import can_stream, reducible, strip_reduce, strip_memory
 
-# Define the directories
-input_dir = "/Users/jameswinslow/Documents/Projects/DataScience/IGPhotoResizer/Images"
-output_dir = "/Users/jameswinslow/Documents/Projects/DataScience/IGPhotoResizer/output"
+# Dominant color settings, matching ColorThief's MMCQ (5 bits per channel, 5-color palette)
+SIGBITS = 5
+PALETTE_SIZE = 5
+MAX_ITERATIONS = 1000
 
-# Ensure the output directory exists
-if not os.path.exists(output_dir):
-    os.makedirs(output_dir)
+# Long side the image is subsampled to before quantizing. At 400, every image of the frozen set
+# and of 104 corpus.py photos came within 8 RGB levels of ColorThief (200 was up to 59 off).
+DOMINANT_SAMPLE_SIZE = 400
 
-# Function to get the dominant color from the image
-def get_dominant_color(img_path):
-    color_thief = ColorThief(img_path)
-    dominant_color = color_thief.get_color(quality=1)
-    return dominant_color
+# Number of pixels in a color box of the histogram
+def box_count(histo, box):
+    r1, r2, g1, g2, b1, b2 = box
+    return int(histo[r1:r2 + 1, g1:g2 + 1, b1:b2 + 1].sum())
 
-# Proportional resizing with padding
-def resize_with_padding(img, target_width, target_height, dominant_color):
-    width, height = img.size
+# Volume of a color box, in histogram cells (both ends included, as in ColorThief)
+def box_volume(box):
+    r1, r2, g1, g2, b1, b2 = box
+    return (r2 - r1 + 1) * (g2 - g1 + 1) * (b2 - b1 + 1)
+
+# Split a color box in two at the median of its longest axis
+def median_cut(histo, box):
+    r1, r2, g1, g2, b1, b2 = box
+    sub = histo[r1:r2 + 1, g1:g2 + 1, b1:b2 + 1]
+    total = int(sub.sum())
+    if total == 1:
+        return box, None
+
+    widths = (r2 - r1, g2 - g1, b2 - b1)
+    axis = widths.index(max(widths))
+    low, high = box[2 * axis], box[2 * axis + 1]
+    partial = np.cumsum(sub.sum(axis=tuple(a for a in range(3) if a != axis)))
+
+    def partial_at(d):
+        return int(partial[d - low]) if low <= d <= high else 0
+
+    # Cut plane sits halfway between the median and the far edge of the larger side
+    i = low + int(np.argmax(partial > total / 2))
+    left, right = i - low, high - i
+    if left <= right:
+        d2 = min(high - 1, int(i + right / 2))
+    else:
+        d2 = max(low, int(i - 1 - left / 2))
+
+    # Avoid empty boxes on either side of the cut
+    while not partial_at(d2):
+        d2 += 1
+    while partial_at(d2) == total and partial_at(d2 - 1):
+        d2 -= 1
+
+    box1, box2 = list(box), list(box)
+    box1[2 * axis + 1] = d2
+    box2[2 * axis] = d2 + 1
+    return tuple(box1), tuple(box2)
+
+# Keep cutting the highest-priority box until there are `target` colors
+def split_boxes(histo, boxes, target, priority):
+    n_colors = 1
+    for _ in range(MAX_ITERATIONS):
+        boxes.sort(key=priority)
+        box = boxes.pop()
+        if not box_count(histo, box):
+            boxes.append(box)
+            continue
+        box1, box2 = median_cut(histo, box)
+        boxes.append(box1)
+        if box2 is not None:
+            boxes.append(box2)
+            n_colors += 1
+        if n_colors >= target:
+            return
+
+# Function to get the dominant color from an already opened image
+# The image is subsampled to at most `sample_size` pixels on its long side before quantizing:
+# larger values follow ColorThief more closely, smaller values are faster. None uses every pixel,
+# which reproduces ColorThief exactly.
+def get_dominant_color(img, sample_size=DOMINANT_SAMPLE_SIZE):
+    if isinstance(img, str):
+        img = Image.open(img)
+
+    if sample_size and max(img.size) > sample_size:
+        scale = sample_size / max(img.size)
+        img = img.resize((max(1, round(img.size[0] * scale)), max(1, round(img.size[1] * scale))), Image.Resampling.NEAREST)
+
+    # Skip transparent and near-white pixels, as ColorThief does
+    pixels = np.asarray(img.convert('RGBA')).reshape(-1, 4)
+    keep = (pixels[:, 3] >= 125) & ~np.all(pixels[:, :3] > 250, axis=1)
+    if keep.any():
+        pixels = pixels[keep]
+
+    # Histogram of quantized colors
+    quantized = (pixels[:, :3] >> (8 - SIGBITS)).astype(np.intp)
+    histo = np.bincount((quantized[:, 0] << (2 * SIGBITS)) | (quantized[:, 1] << SIGBITS) | quantized[:, 2],
+                        minlength=1 << (3 * SIGBITS)).reshape((1 << SIGBITS,) * 3)
+
+    # Modified median cut: first by population, then by population times volume
+    low, high = quantized.min(axis=0), quantized.max(axis=0)
+    boxes = [(int(low[0]), int(high[0]), int(low[1]), int(high[1]), int(low[2]), int(high[2]))]
+    split_boxes(histo, boxes, 0.75 * PALETTE_SIZE, lambda b: box_count(histo, b))
+    boxes = sorted(boxes, key=lambda b: box_count(histo, b))[::-1]
+    split_boxes(histo, boxes, PALETTE_SIZE - len(boxes), lambda b: box_count(histo, b) * box_volume(b))
+
+    # The dominant color is the average of the largest box
+    box = max(reversed(boxes), key=lambda b: box_count(histo, b) * box_volume(b))
+    r1, r2, g1, g2, b1, b2 = box
+    sub = histo[r1:r2 + 1, g1:g2 + 1, b1:b2 + 1]
+    mult = 1 << (8 - SIGBITS)
+    total = sub.sum()
+    if not total:
+        return tuple(int(mult * (box[2 * a] + box[2 * a + 1] + 1) / 2) for a in range(3))
+    index = np.indices(sub.shape)
+    return tuple(int(((index[a] + box[2 * a] + 0.5) * mult * sub).sum() / total) for a in range(3))
+
+# Proportional size of an image scaled to fit inside the target: to the target width if the image
+# is wider than the target's aspect ratio, otherwise to the target height
+def fit_size(width, height, target_width, target_height):
     aspect_ratio = width / height
+    if aspect_ratio >= target_width / target_height:
+        return target_width, max(1, int(target_width / aspect_ratio))
+    return max(1, int(target_height * aspect_ratio)), target_height
+
+# Decode planner: shrink the source by the largest factor that still leaves it above new_size,
+# the size it will finally be resized to. JPEGs are decoded straight at 1/2, 1/4 or 1/8 scale
+# through draft(), which only works before the pixels are loaded. PNGs not yet loaded are reduced
+# a strip at a time as they are read (see strip_decode.py), so the full-size image is never held;
+# other formats are decoded whole and then reduced.
+def plan_decode(img, new_size):
+    scale = min(img.size[0] // max(new_size[0], 1), img.size[1] // max(new_size[1], 1))
+    if scale < 2:
+        return img
+
+    if img.format == 'JPEG':
+        img.draft(None, new_size)
+        return img
+
+    if can_stream(img):
+        return strip_reduce(img, scale)
+    return reducible(img).reduce(scale)
 
+# Proportional resizing with padding
+# new_size is worked out on the source dimensions, since a reduced decode rounds them up. Callers
+# that already ran plan_decode pass it in; otherwise the source is planned here when reduced_decode.
+# backend picks the resampler (see resampling.BACKENDS); 'auto' uses the tuned choice for the scale.
+def resize_with_padding(img, target_width, target_height, dominant_color, new_size=None, reduced_decode=True,
+                        backend=DEFAULT_BACKEND):
     # Proportional scaling
-    if width > height:
-        new_width = target_width
-        new_height = int(target_width / aspect_ratio)
-    else:
-        new_height = target_height
-        new_width = int(target_height * aspect_ratio)
+    if new_size is None:
+        new_size = fit_size(img.size[0], img.size[1], target_width, target_height)
+        if reduced_decode:
+            img = plan_decode(img, new_size)
+    new_width, new_height = new_size
 
     # Resize the image
-    img_resized = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
+    with resample(img, (new_width, new_height), backend) as img_resized:
+        return pad_to_target(img_resized, target_width, target_height, dominant_color)
+
+# Center an already resized image on a target-sized canvas of the fill color
+def pad_to_target(img_resized, target_width, target_height, dominant_color):
+    new_width, new_height = img_resized.size
 
     # Create a new image with target dimensions and background color
     new_img = Image.new("RGB", (target_width, target_height), dominant_color)
@@ -42,31 +181,313 @@ def resize_with_padding(img, target_width, target_height, dominant_color):
 
     return new_img
 
+# Long side of the map the smart crop scores windows on
+SALIENCY_SIZE = 128
+
+# Windows scoring within this fraction of the best are treated as ties, and the most central wins
+CROP_TIE_TOLERANCE = 0.01
+
+# Cheap saliency map at SALIENCY_SIZE: luminance edges plus each pixel's color distance from the
+# image's mean color, each normalized to a mean of 1
+def saliency_map(img, size=SALIENCY_SIZE):
+    scale = size / max(img.size)
+    small_size = (max(1, round(img.size[0] * scale)), max(1, round(img.size[1] * scale)))
+    small = (img if img.mode == 'RGB' else img.convert('RGB')).resize(small_size, Image.Resampling.BILINEAR, reducing_gap=3.0)
+    pixels = np.asarray(small, dtype=np.float32)
+
+    gray = pixels @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+    edges = np.zeros_like(gray)
+    edges[:, 1:-1] += np.abs(gray[:, 2:] - gray[:, :-2])
+    edges[1:-1, :] += np.abs(gray[2:, :] - gray[:-2, :])
+    contrast = np.sqrt(((pixels - pixels.mean(axis=(0, 1))) ** 2).sum(axis=2))
+    return edges / (edges.mean() + 1e-6) + contrast / (contrast.mean() + 1e-6)
+
+# Best crop window of a width / height aspect ratio on a saliency map. Every window position is
+# scored at once from the integral image (four lookups per window).
+# Returns the window's left, top, width and height in map pixels.
+def best_window(saliency, aspect):
+    height, width = saliency.shape
+    window_width, window_height = min(width, max(1, round(height * aspect))), min(height, max(1, round(width / aspect)))
+
+    integral = np.zeros((height + 1, width + 1))
+    integral[1:, 1:] = saliency.cumsum(axis=0).cumsum(axis=1)
+    scores = (integral[window_height:, window_width:] - integral[:-window_height, window_width:]
+              - integral[window_height:, :-window_width] + integral[:-window_height, :-window_width])
+
+    # Among near-ties, prefer the window closest to the center
+    tops, lefts = np.nonzero(scores >= scores.max() * (1 - CROP_TIE_TOLERANCE))
+    distance = np.abs(lefts - (width - window_width) / 2) + np.abs(tops - (height - window_height) / 2)
+    best = distance.argmin()
+    return lefts[best], tops[best], window_width, window_height
+
+# Crop box at the target's aspect ratio covering the most salient part of the image, in
+# image coordinates (fractional, for Image.resize's box argument)
+def smart_crop_box(img, target_width, target_height):
+    width, height = img.size
+    aspect = target_width / target_height
+    crop_width, crop_height = min(width, height * aspect), min(height, width / aspect)
+
+    saliency = saliency_map(img)
+    left, top, window_width, window_height = best_window(saliency, aspect)
+    scale_x, scale_y = width / saliency.shape[1], height / saliency.shape[0]
+    center_x, center_y = (left + window_width / 2) * scale_x, (top + window_height / 2) * scale_y
+    x = min(max(center_x - crop_width / 2, 0), width - crop_width)
+    y = min(max(center_y - crop_height / 2, 0), height - crop_height)
+    return x, y, x + crop_width, y + crop_height
+
+# Size the whole source would be scaled to if its crop at the target's aspect ratio is
+# resized to the target, which is the size a reduced decode has to stay above
+def crop_decode_size(width, height, target_width, target_height):
+    aspect = target_width / target_height
+    crop_width, crop_height = min(width, height * aspect), min(height, width / aspect)
+    return math.ceil(target_width * width / crop_width), math.ceil(target_height * height / crop_height)
+
+# Smart crop: fill the target with the most salient window at its aspect ratio instead of padding
+def smart_crop(img, target_width, target_height, reduced_decode=True):
+    if reduced_decode:
+        img = plan_decode(img, crop_decode_size(img.size[0], img.size[1], target_width, target_height))
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+    box = smart_crop_box(img, target_width, target_height)
+    return img.resize((target_width, target_height), Image.Resampling.LANCZOS, box=box)
+
+# Open a file for resizing to the target, decoding at reduced scale when it is much larger
+# Returns the decoded image and the size it will be resized to
+def decode_for_target(img_path, target_width=1080, target_height=1350):
+    img = Image.open(img_path)
+    new_size = fit_size(img.size[0], img.size[1], target_width, target_height)
+    decoded = plan_decode(img, new_size)
+    decoded.load()
+    if decoded is not img:
+        img.close()
+    return decoded, new_size
+
+# Open a file for smart cropping to the target, decoding at reduced scale when it is much larger
+def decode_for_crop(img_path, target_width=1080, target_height=1350):
+    img = Image.open(img_path)
+    decoded = plan_decode(img, crop_decode_size(img.size[0], img.size[1], target_width, target_height))
+    decoded.load()
+    if decoded is not img:
+        img.close()
+    return decoded
+
+# Header-only estimate of process_image_file's peak memory on one file, in bytes (see scheduler.py).
+# Files are costed at the reduced size plan_decode will decode them at: JPEGs at their draft scale,
+# PNGs read in strips at the reduced size plus one strip; other formats are decoded at full size.
+def estimate_job_memory(img_path, target_width=1080, target_height=1350, method='padding'):
+    strips = 0
+    with Image.open(img_path) as img:
+        width, height = img.size
+        mode = img.mode
+        if method == 'crop':
+            decode_size = crop_decode_size(width, height, target_width, target_height)
+        else:
+            decode_size = fit_size(width, height, target_width, target_height)
+        scale = min(width // max(decode_size[0], 1), height // max(decode_size[1], 1))
+        if img.format == 'JPEG':
+            factor = 1 << (max(min(scale, 8), 1).bit_length() - 1)
+            width, height = -(-width // factor), -(-height // factor)
+        elif scale >= 2 and can_stream(img):
+            strips = strip_memory(img, scale)
+            width, height = -(-width // scale), -(-height // scale)
+    return int(PEAK_FACTOR * decoded_bytes(width, height, mode)) + strips + JOB_OVERHEAD
+
+# Pick the fill color and resize with padding, for an image from decode_for_target
+def pad_decoded(decoded, target_width=1080, target_height=1350):
+    img, new_size = decoded
+
+    # Get the dominant color from the decoded image
+    dominant_color = get_dominant_color(img)
+
+    # Resize the image with padding
+    return resize_with_padding(img, target_width, target_height, dominant_color, new_size=new_size)
+
+# Ways of fitting a photo to the target: padding with the dominant color, or a smart crop
+RESIZE_MODES = ('padding', 'crop')
+
+# Fail early on an unknown resize mode
+def check_mode(method):
+    if method not in RESIZE_MODES:
+        raise ValueError(f"Unknown resize method {method!r}; choose from {', '.join(RESIZE_MODES)}")
+
+# Work unit for one file: decode, pick the fill color, resize with padding and save.
+# With method='crop' the photo is smart cropped to the target instead of padded.
+# Returns the encoder's choices for the file and, when tracing is on, its trace record
+def process_image_file(img_path, output_path, target_width=1080, target_height=1350, profile='default', max_bytes=None,
+                       method='padding', backend=DEFAULT_BACKEND):
+    record = start_trace(img_path)
+
+    # The decoded image and the resized one are closed as soon as they are done with, so a worker
+    # never holds more than one file's buffers
+    if method == 'crop':
+        with stage(record, 'decode'):
+            img = decode_for_crop(img_path, target_width, target_height)
+        with img, stage(record, 'resize'):
+            img_resized = smart_crop(img, target_width, target_height, reduced_decode=False)
+        with img_resized, stage(record, 'encode'):
+            encoded = save_encoded(img_resized, output_path, profile, max_bytes)
+        return dict(encoded, Trace=record)
+
+    with stage(record, 'decode'):
+        img, new_size = decode_for_target(img_path, target_width, target_height)
+
+    with img:
+        # Get the dominant color from the decoded image
+        with stage(record, 'dominant_color'):
+            dominant_color = get_dominant_color(img)
+
+        # Resize the image with padding
+        with stage(record, 'resize'):
+            img_resized = resize_with_padding(img, target_width, target_height, dominant_color, new_size=new_size,
+                                              backend=backend)
+
+    # Save the processed image
+    with img_resized, stage(record, 'encode'):
+        encoded = save_encoded(img_resized, output_path, profile, max_bytes)
+
+    return dict(encoded, Trace=record)
+
+# Instagram aspect ratios: rendition name -> target width and height
+INSTAGRAM_RENDITIONS = {
+    'portrait': (1080, 1350),
+    'square': (1080, 1080),
+    'landscape': (1080, 566),
+    'story': (1080, 1920),
+}
+
+# Build several padded renditions from one decode. The source is decoded once at the reduced
+# scale the largest rendition allows and downscaled once to that rendition's size; every other
+# rendition is resampled from that shared intermediate. The fill color is computed only once.
+# Returns rendition name -> image.
+def render_renditions(img, renditions=INSTAGRAM_RENDITIONS, record=None):
+    new_sizes = {name: fit_size(img.size[0], img.size[1], width, height) for name, (width, height) in renditions.items()}
+    largest = max(new_sizes.values(), key=lambda size: size[0] * size[1])
+
+    with stage(record, 'decode'):
+        decoded = plan_decode(img, largest)
+        decoded.load()
+
+    with stage(record, 'dominant_color'):
+        dominant_color = get_dominant_color(decoded)
+
+    with stage(record, 'resize'):
+        intermediate = decoded.resize(largest, Image.Resampling.LANCZOS)
+        if decoded is not img:
+            decoded.close()
+        scaled = {largest: intermediate}
+        rendered = {}
+        for name, (width, height) in renditions.items():
+            new_size = new_sizes[name]
+            if new_size not in scaled:
+                scaled[new_size] = intermediate.resize(new_size, Image.Resampling.LANCZOS)
+            rendered[name] = pad_to_target(scaled[new_size], width, height, dominant_color)
+        for scaled_img in scaled.values():
+            scaled_img.close()
+    return rendered
+
+# Work unit writing every rendition of one file as <name>_<rendition><ext> next to output_path
+def renditions_file(img_path, output_path, renditions=INSTAGRAM_RENDITIONS, profile='default', max_bytes=None):
+    record = start_trace(img_path)
+    with Image.open(img_path) as img:
+        rendered = render_renditions(img, renditions, record)
+
+    stem, extension = os.path.splitext(output_path)
+    encoded = {}
+    with stage(record, 'encode'):
+        for name, img in rendered.items():
+            with img:
+                encoded[name] = save_encoded(img, f"{stem}_{name}{extension}", profile, max_bytes)
+    fields = {field: {name: info[field] for name, info in encoded.items()}
+              for field in ('Output', 'Quality', 'Bytes', 'Trials', 'Within Budget')}
+    return dict(fields, Trace=record)
+
+# Parameters that decide the output of process_images, used as part of the incremental manifest key
+def resize_params(target_width=1080, target_height=1350, profile='default', max_bytes=None, method='padding',
+                  backend=DEFAULT_BACKEND):
+    if method == 'crop':
+        fit = {'method': 'smart_crop', 'saliency': f"edges+contrast:{SALIENCY_SIZE}"}
+    else:
+        fit = {'method': 'resize_with_padding', 'fill': f"dominant_color:mmcq:sample_size={DOMINANT_SAMPLE_SIZE}"}
+        if backend == 'auto':
+            tuning = load_tuning() or {'Ranges': []}
+            fit['resample'] = ['auto'] + [entry['Backend'] for entry in tuning['Ranges']]
+        elif backend != DEFAULT_BACKEND:
+            fit['resample'] = backend
+    return dict(fit, target=[target_width, target_height],
+                encoder={'profile': profile, 'settings': ENCODER_PROFILES[profile], 'max_bytes': max_bytes})
+
 # Main function to process all images in the input directory
-def process_images(input_dir, output_dir):
-    # Ensure the output directory is cleared
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
-
-    # Define the target width and height
-    target_width = 1080  # e.g., Instagram's width limit
-    target_height = 1350  # e.g., Instagram’s 4:5 aspect ratio height
-
-    for file_name in os.listdir(input_dir):
-        if file_name.endswith(('.jpg', '.jpeg', '.png')):
-            img_path = os.path.join(input_dir, file_name)
-            img = Image.open(img_path)
-            
-            # Get the dominant color from the image
-            dominant_color = get_dominant_color(img_path)
-            
-            # Resize the image with padding
-            img_resized = resize_with_padding(img, target_width, target_height, dominant_color)
-            
-            # Save the processed image
-            output_path = os.path.join(output_dir, file_name)
-            img_resized.save(output_path)
-            print(f"Processed and saved: {output_path}")
+# Files are spread over `workers` processes (all cores by default); returns one result dict per file.
+# With incremental=True, files unchanged since the last run with the same parameters are skipped.
+# With a trace_path, per-image stage timings are appended there as JSONL.
+# profile picks the encoder settings (see encoders.ENCODER_PROFILES); with max_bytes each output is
+# searched down to fit the budget, and the chosen quality and size are reported per file.
+# method is 'padding' (dominant color fill) or 'crop' (saliency smart crop).
+# backend picks the resampler for padding; with 'auto' and no saved tuning, the backends are first
+# tuned on a sample of input_dir (see resampling.autotune), which must then be a folder.
+# With a memory_budget (MB), files are admitted to the workers by their estimated peak memory
+# (estimate_job_memory) so large images landing together cannot exhaust RAM; a stats dict, if given,
+# receives the batch's peak resident memory (see scheduler.run_budgeted).
+# With dedupe='reuse', near-duplicates of an earlier photo (perceptual hash, see phash.py) get a copy
+# of its output instead of being processed; with dedupe='report' they are only reported.
+def process_images(input_dir, output_dir, workers=None, incremental=False, trace_path=None,
+                   profile='default', max_bytes=None, method='padding', target_width=1080, target_height=1350,
+                   backend=DEFAULT_BACKEND, memory_budget=None, stats=None, dedupe=None):
+    get_profile(profile)
+    check_mode(method)
+    if backend == 'auto' and load_tuning() is None:
+        from archive_io import is_archive
+        if is_archive(input_dir):
+            raise ValueError("Tuning the backends needs a folder, not an archive; "
+                             "tune on a folder first (python resampling.py FOLDER)")
+        autotune(input_dir)
+    manifest_path = os.path.join(output_dir, MANIFEST_NAME) if incremental else None
+    work_fn = partial(process_image_file, target_width=target_width, target_height=target_height,
+                      profile=profile, max_bytes=max_bytes, method=method, backend=backend)
+    params = resize_params(target_width, target_height, profile, max_bytes, method, backend)
+    estimate = partial(estimate_job_memory, target_width=target_width, target_height=target_height, method=method)
+    return run_batch(input_dir, output_dir, work_fn, workers=workers, manifest_path=manifest_path,
+                     params=params, trace_path=trace_path, memory_budget=memory_budget, estimate=estimate, stats=stats,
+                     dedupe=dedupe)
+
+# Write every rendition (Instagram portrait, square, landscape and story by default) of each
+# image in one pass, decoding each source once. Options are the same as process_images.
+def process_images_renditions(input_dir, output_dir, renditions=INSTAGRAM_RENDITIONS, workers=None,
+                              incremental=False, trace_path=None, profile='default', max_bytes=None,
+                              memory_budget=None, stats=None, dedupe=None):
+    get_profile(profile)
+    manifest_path = os.path.join(output_dir, MANIFEST_NAME) if incremental else None
+    params = dict(resize_params(profile=profile, max_bytes=max_bytes),
+                  target={name: list(size) for name, size in renditions.items()})
+    work_fn = partial(renditions_file, renditions=renditions, profile=profile, max_bytes=max_bytes)
+    # Every rendition is at most the widest target wide and the tallest target tall
+    estimate = partial(estimate_job_memory, target_width=max(width for width, _ in renditions.values()),
+                       target_height=max(height for _, height in renditions.values()))
+    return run_batch(input_dir, output_dir, work_fn, workers=workers, manifest_path=manifest_path,
+                     params=params, trace_path=trace_path, memory_budget=memory_budget, estimate=estimate, stats=stats,
+                     dedupe=dedupe)
+
+# Streaming version of process_images: reading, resizing and encoding overlap on separate threads
+# with bounded queues in between. Yields one result dict per file as it completes.
+def stream_process_images(input_dir, output_dir, target_width=1080, target_height=1350,
+                          profile='default', max_bytes=None, method='padding', **stage_options):
+    get_profile(profile)
+    check_mode(method)
+    if method == 'crop':
+        return stream_images(input_dir, output_dir,
+                             lambda img: smart_crop(img, target_width, target_height, reduced_decode=False),
+                             read=lambda img_path: decode_for_crop(img_path, target_width, target_height),
+                             save=lambda img, output_path: save_encoded(img, output_path, profile, max_bytes),
+                             **stage_options)
+    return stream_images(input_dir, output_dir,
+                         lambda decoded: pad_decoded(decoded, target_width, target_height),
+                         read=lambda img_path: decode_for_target(img_path, target_width, target_height),
+                         save=lambda img, output_path: save_encoded(img, output_path, profile, max_bytes),
+                         **stage_options)
 
 if __name__ == "__main__":
-    process_images(input_dir, output_dir)
+    # Define the directories
+    input_dir = "/Users/jameswinslow/Documents/Projects/DataScience/IGPhotoResizer/Images"
+    output_dir = "/Users/jameswinslow/Documents/Projects/DataScience/IGPhotoResizer/output"
+
+    report_results(process_images(input_dir, output_dir, incremental=True), "Resize")
@@ -0,0 +1,101 @@
+import os
+import time
+import uuid
+from urllib.parse import quote
+
+# Results are kept as Parquet files in a Hive-style folder tree, one folder per session and method:
+#   STORE/Session=<session>/Method=<method>/part-<id>.parquet
+# A session is one evaluation (one run of a script or main.py command); every append adds a new
+# file, so earlier sessions are never rewritten. pyarrow is only imported when a store is used.
+PARTITION_KEYS = ('Session', 'Method')
+
+# A new session name: the start time, plus a random suffix so concurrent sessions never collide
+def new_session():
+    return time.strftime('%Y%m%d-%H%M%S') + '-' + uuid.uuid4().hex[:6]
+
+# Folder of one session/method partition. Values are URI-encoded, as pyarrow decodes them on read.
+def partition_dir(store_dir, session, method):
+    return os.path.join(store_dir, *(f"{key}={quote(str(value), safe='')}"
+                                     for key, value in zip(PARTITION_KEYS, (session, method))))
+
+# Write a table into a partition as a new file. It is written under a hidden name and renamed
+# into place, so readers (which skip hidden files) never see half a file.
+def write_part(table, directory):
+    import pyarrow.parquet as pq
+
+    os.makedirs(directory, exist_ok=True)
+    file_name = f"part-{uuid.uuid4().hex}.parquet"
+    partial_path = os.path.join(directory, '.' + file_name)
+    pq.write_table(table, partial_path)
+    os.replace(partial_path, os.path.join(directory, file_name))
+    return os.path.join(directory, file_name)
+
+# Append result rows (dicts) for one session and method. Session and Method are taken from the
+# folder names on read, so any 'Method' key in the rows is dropped. Returns the file written.
+def append_results(store_dir, rows, session, method):
+    import pyarrow as pa
+
+    rows = [{key: value for key, value in row.items() if key not in PARTITION_KEYS} for row in rows]
+    if not rows:
+        return None
+    return write_part(pa.Table.from_pylist(rows), partition_dir(store_dir, session, method))
+
+# The store as a pyarrow dataset, memory-mapping the files it reads
+def open_store(store_dir):
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    from pyarrow.fs import LocalFileSystem
+
+    partitioning = ds.partitioning(pa.schema([(key, pa.string()) for key in PARTITION_KEYS]), flavor='hive')
+    return ds.dataset(store_dir, format='parquet', partitioning=partitioning,
+                      filesystem=LocalFileSystem(use_mmap=True))
+
+# Read results into a DataFrame. Only the requested columns are read, and the method/session
+# filters prune whole partitions before any file is opened. `where` takes any further pyarrow
+# expression, e.g. pyarrow.dataset.field('SSIM') < 0.9, which is pushed down to the row groups.
+def read_results(store_dir, columns=None, methods=None, sessions=None, where=None):
+    import pyarrow.dataset as ds
+
+    conditions = []
+    if methods is not None:
+        conditions.append(ds.field('Method').isin(list(methods)))
+    if sessions is not None:
+        conditions.append(ds.field('Session').isin(list(sessions)))
+    if where is not None:
+        conditions.append(where)
+    expression = None
+    for condition in conditions:
+        expression = condition if expression is None else expression & condition
+
+    return open_store(store_dir).to_table(columns=columns, filter=expression).to_pandas()
+
+# Sessions in the store, oldest first
+def list_sessions(store_dir):
+    prefix = PARTITION_KEYS[0] + '='
+    if not os.path.isdir(store_dir):
+        return []
+    return sorted(name[len(prefix):] for name in os.listdir(store_dir) if name.startswith(prefix))
+
+# Merge the files of every partition into one, so a store with many small appends reads faster.
+# The merged file is in place before the old ones are removed.
+def compact(store_dir):
+    import pyarrow.dataset as ds
+
+    for directory, _, file_names in os.walk(store_dir):
+        parts = sorted(name for name in file_names if name.startswith('part-') and name.endswith('.parquet'))
+        if len(parts) < 2:
+            continue
+        paths = [os.path.join(directory, name) for name in parts]
+        write_part(ds.dataset(paths, format='parquet').to_table(), directory)
+        for path in paths:
+            os.remove(path)
+
+# Import a results CSV (with a Method column) into the store as one session, named after the file
+def import_csv(csv_file, store_dir, session=None):
+    import pandas as pd
+
+    df = pd.read_csv(csv_file)
+    session = session or os.path.splitext(os.path.basename(csv_file))[0]
+    for method, rows in df.groupby('Method', sort=False):
+        append_results(store_dir, rows.to_dict('records'), session, method)
+    return session
@@ -0,0 +1,177 @@
+import ctypes
+import ctypes.util
+import glob
+import os
+import sys
+import threading
+import time
+from bisect import bisect_right
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from PIL import Image
+from batch import run_job
+
+MB = 1 << 20
+
+# Peak memory of a resize as a multiple of the decoded image: the decode itself plus a converted
+# or reduced copy alive at the same time
+PEAK_FACTOR = 2.0
+
+# Memory every job needs whatever the image size: the output canvas, encoder buffers and the like
+JOB_OVERHEAD = 16 * MB
+
+# Resident memory of an idle worker process (interpreter, Pillow, numpy), set aside from the budget
+WORKER_OVERHEAD = 64 * MB
+
+# Seconds between samples of the batch's resident memory
+RSS_INTERVAL = 0.02
+
+# Bytes per pixel as Pillow holds an image decoded for resizing. Multi-band images take four bytes
+# per pixel whatever their band count; palette images are converted to RGB before resizing.
+def bytes_per_pixel(mode):
+    if mode in ('1', 'L'):
+        return 1
+    if mode.startswith('I;16'):
+        return 2
+    return 4
+
+# Decoded size of an image in bytes, from its dimensions and mode
+def decoded_bytes(width, height, mode):
+    return width * height * bytes_per_pixel(mode)
+
+# Peak memory estimate for resizing one file, in bytes, from its header alone (nothing is decoded):
+# a full-size decode. Work units that decode at reduced size have their own, tighter estimate.
+def estimate_memory(img_path):
+    with Image.open(img_path) as img:
+        width, height = img.size
+        mode = img.mode
+    return int(PEAK_FACTOR * decoded_bytes(width, height, mode)) + JOB_OVERHEAD
+
+# Hand freed memory back to the system. Large decodes leave free pages in the C heap that glibc
+# would otherwise keep, so a worker's footprint would stay at its largest image.
+libc = None
+def release_memory():
+    global libc
+    if not sys.platform.startswith('linux'):
+        return
+    if libc is None:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'))
+    if hasattr(libc, 'malloc_trim'):
+        libc.malloc_trim(0)
+
+# run_job, then release what the job freed before the worker takes the next one
+def run_released_job(job):
+    try:
+        return run_job(job)
+    finally:
+        release_memory()
+
+# Resident memory of a process in bytes, or None where /proc is not available
+def process_rss(pid):
+    try:
+        with open(f'/proc/{pid}/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+# Resident memory of this process and all its child processes (the pool's workers)
+def batch_rss():
+    pid = os.getpid()
+    total = process_rss(pid)
+    if total is None:
+        return None
+    for children_path in glob.glob(f'/proc/{pid}/task/*/children'):
+        try:
+            with open(children_path) as f:
+                children = f.read().split()
+        except OSError:
+            continue
+        for child in children:
+            total += process_rss(child) or 0
+    return total
+
+# Sample batch_rss every `interval` seconds until `stop` is set, keeping the highest in peak['RSS']
+def sample_rss(stop, peak, interval=RSS_INTERVAL):
+    while True:
+        rss = batch_rss()
+        if rss is not None:
+            peak['RSS'] = max(peak.get('RSS', 0), rss)
+        if stop.wait(interval):
+            return
+
+# Run jobs on a process pool without their estimated memory ever adding up to more than
+# memory_budget (MB, including WORKER_OVERHEAD per worker). Each job's peak is estimated from its
+# image header with estimate(img_path); a job is admitted once its estimate fits in what is left.
+# Among the waiting jobs the largest that fits goes first, which keeps the budget well packed on
+# mixed sizes; a job bigger than the whole budget runs once nothing else is in flight.
+# Returns one result per job, in job order, each with its 'Memory Estimate' (MB). When a stats dict
+# is given it is filled with the batch's peak resident memory and admission figures.
+def run_budgeted(jobs, memory_budget, workers=None, estimate=estimate_memory, stats=None):
+    start = time.perf_counter()
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = max(1, min(workers, len(jobs)))
+    available = max(memory_budget * MB - workers * WORKER_OVERHEAD, 0)
+
+    estimates = []
+    for job in jobs:
+        try:
+            estimates.append(estimate(job[2]))
+        except Exception:
+            # Unreadable header: the job will fail fast in run_job and report why
+            estimates.append(JOB_OVERHEAD)
+
+    # Waiting jobs, smallest estimate first, so the largest that fits is found by bisection
+    pending = sorted(range(len(jobs)), key=lambda i: estimates[i])
+    pending_sizes = [estimates[i] for i in pending]
+
+    results = [None] * len(jobs)
+    in_flight = {}
+    used = 0
+    peak_used = 0
+    max_concurrent = 0
+    peak = {}
+    stop = threading.Event()
+    sampler = threading.Thread(target=sample_rss, args=(stop, peak), daemon=True)
+    sampler.start()
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            while pending or in_flight:
+                while pending and len(in_flight) < workers:
+                    k = bisect_right(pending_sizes, available - used) - 1
+                    if k < 0:
+                        if in_flight:
+                            break
+                        k = len(pending) - 1
+                    index = pending.pop(k)
+                    used += pending_sizes.pop(k)
+                    in_flight[executor.submit(run_released_job, jobs[index])] = index
+                peak_used = max(peak_used, used)
+                max_concurrent = max(max_concurrent, len(in_flight))
+
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index = in_flight.pop(future)
+                    used -= estimates[index]
+                    results[index] = dict(future.result(), **{'Memory Estimate': estimates[index] / MB})
+    finally:
+        stop.set()
+        sampler.join()
+
+    if stats is not None:
+        stats.update({
+            'Jobs': len(jobs),
+            'Workers': workers,
+            'Budget (MB)': memory_budget,
+            'Peak Estimate (MB)': (peak_used + workers * WORKER_OVERHEAD) / MB,
+            'Peak RSS (MB)': peak['RSS'] / MB if 'RSS' in peak else None,
+            'Max Concurrent': max_concurrent,
+            'Seconds': time.perf_counter() - start,
+        })
+    return results
+
+# Print the figures run_budgeted collected for a batch
+def report_memory(stats):
+    peak_rss = f"{stats['Peak RSS (MB)']:.0f}MB" if stats['Peak RSS (MB)'] is not None else "unknown"
+    print(f"Memory: peak RSS {peak_rss} of a {stats['Budget (MB)']:.0f}MB budget "
+          f"(estimated {stats['Peak Estimate (MB)']:.0f}MB), up to {stats['Max Concurrent']} of "
+          f"{stats['Workers']} workers busy, {stats['Jobs']} jobs in {stats['Seconds']:.1f}s")
@@ -0,0 +1,184 @@
+import math
+import numpy as np
+from PIL import Image
+
+# Target aspect ratio (width / height) for Instagram portrait posts
+PORTRAIT_ASPECT = 4 / 5
+
+# Vertical seams removed per pass before the energy and cumulative cost are refreshed
+SEAMS_PER_PASS = 8
+
+# Width the coarse pass carves at; wider images are carved in blocks and refined at full size
+COARSE_SIZE = 512
+
+# Luminance as float32, the channel the energy is computed on
+def to_gray(pixels):
+    return pixels[..., :3].astype(np.float32) @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+# Gradient magnitude energy: absolute central differences across and down, edges replicated
+def energy_map(gray):
+    padded = np.pad(gray, 1, mode='edge')
+    return (np.abs(padded[1:-1, 2:] - padded[1:-1, :-2])
+            + np.abs(padded[2:, 1:-1] - padded[:-2, 1:-1]))
+
+# The same energy at selected pixels only, for refreshing the area around removed seams
+def pixel_energy(gray, rows, cols):
+    height, width = gray.shape
+    left, right = np.maximum(cols - 1, 0), np.minimum(cols + 1, width - 1)
+    up, down = np.maximum(rows - 1, 0), np.minimum(rows + 1, height - 1)
+    return np.abs(gray[rows, right] - gray[rows, left]) + np.abs(gray[down, cols] - gray[up, cols])
+
+# Dynamic programming over the rows: cost[i, j] is the cheapest seam from the top ending at
+# (i, j), and offsets[i, j] the step (-1, 0 or +1) that seam took from the row above.
+# Each row is one vectorized minimum over all columns; the steps are recovered afterwards
+# for the whole image at once.
+def cumulative_energy(energy):
+    height, width = energy.shape
+    cost = energy.astype(np.float32)
+    padded = np.full(width + 2, np.inf, dtype=np.float32)
+    left, middle, right = padded[:-2], padded[1:-1], padded[2:]
+    best = np.empty(width, dtype=np.float32)
+    for i in range(1, height):
+        middle[:] = cost[i - 1]
+        np.minimum(left, middle, out=best)
+        np.minimum(best, right, out=best)
+        cost[i] += best
+
+    # Ties go left, then straight up
+    above = np.pad(cost[:-1], ((0, 0), (1, 1)), constant_values=np.inf)
+    left, middle, right = above[:, :-2], above[:, 1:-1], above[:, 2:]
+    offsets = np.zeros((height, width), dtype=np.int8)
+    offsets[1:] = np.where(left <= np.minimum(middle, right), -1, np.where(middle <= right, 0, 1))
+    return cost, offsets
+
+# Up to `count` vertical seams that share no pixel, cheapest first. Each candidate is traced
+# back from one of the cheapest bottom pixels; where its best step runs into a seam already
+# taken it steps to the cheapest free neighbour instead (optimal seams often merge on the way
+# up), and it is dropped if none is free.
+# Returns a (height, seams) array of columns, sorted within each row.
+def find_seams(cost, offsets, count):
+    height, width = cost.shape
+    taken = bytearray(height * width)
+    seams = []
+    for start in np.argsort(cost[-1], kind='stable')[:min(width, count * 4)].tolist():
+        if not math.isfinite(cost[-1, start]):
+            break
+        path = [0] * height
+        col = start
+        for i in range(height - 1, -1, -1):
+            if taken[i * width + col]:
+                break
+            path[i] = col
+            if i:
+                parent = col + int(offsets[i, col])
+                above = (i - 1) * width
+                if taken[above + parent]:
+                    parent, lowest = -1, math.inf
+                    for c in (col - 1, col, col + 1):
+                        if 0 <= c < width and not taken[above + c] and cost[i - 1, c] < lowest:
+                            parent, lowest = c, cost[i - 1, c]
+                    if parent < 0:
+                        break
+                col = parent
+        else:
+            for i, c in enumerate(path):
+                taken[i * width + c] = 1
+            seams.append(path)
+            if len(seams) == count:
+                break
+    return np.sort(np.array(seams, dtype=np.intp).T, axis=1)
+
+# Drop the seam pixels from each array (all shaped like the image in their first two axes)
+def remove_seams(arrays, seams):
+    height, width = arrays[0].shape[:2]
+    keep = np.ones((height, width), dtype=bool)
+    keep[np.arange(height)[:, None], seams] = False
+    cols = np.nonzero(keep)[1].reshape(height, width - seams.shape[1])
+    rows = np.arange(height)[:, None]
+    return [array[rows, cols] for array in arrays]
+
+# Refresh the energy only where the removal changed a pixel's neighbours: the columns around
+# each seam in its own row and the rows above and below
+def update_energy(energy, gray, seams):
+    height, width = energy.shape
+    # Column each seam leaves its gap at once the seams to its left are gone
+    gaps = seams - np.arange(seams.shape[1])
+    dirty = np.zeros((height, width), dtype=bool)
+    cols = np.clip(gaps[:, :, None] + np.arange(-2, 2), 0, width - 1)
+    dirty[np.arange(height)[:, None, None], cols] = True
+    dirty[1:] |= dirty[:-1].copy()
+    dirty[:-1] |= dirty[1:].copy()
+
+    rows, cols = np.nonzero(dirty)
+    energy[rows, cols] = pixel_energy(gray, rows, cols)
+    return energy
+
+# Remove `count` vertical seams from an RGB array, SEAMS_PER_PASS at a time, updating the energy
+# incrementally between passes. Columns marked in `protected` are never removed.
+# Returns the carved pixels and, for each kept pixel, the column it came from.
+def carve_columns(pixels, count, seams_per_pass=SEAMS_PER_PASS, protected=None):
+    height, width = pixels.shape[:2]
+    gray = to_gray(pixels)
+    energy = energy_map(gray)
+    source_cols = np.broadcast_to(np.arange(width, dtype=np.int32), (height, width)).copy()
+
+    while count > 0:
+        if protected is not None:
+            energy[protected] = np.inf
+        cost, offsets = cumulative_energy(energy)
+        seams = find_seams(cost, offsets, min(count, seams_per_pass))
+        if protected is not None:
+            protected, = remove_seams([protected], seams)
+        pixels, gray, energy, source_cols = remove_seams([pixels, gray, energy, source_cols], seams)
+        energy = update_energy(energy, gray, seams)
+        count -= seams.shape[1]
+    return pixels, source_cols
+
+# Carve an RGB array to target_width. Wide images are first carved at reduced resolution:
+# the image is averaged in blocks so it is at most COARSE_SIZE wide, whole blocks are carved
+# out there, and the removal is expanded back to full size. The few seams left over (under
+# one block wide) are carved at full resolution.
+def carve_width(pixels, target_width, coarse_size=COARSE_SIZE, seams_per_pass=SEAMS_PER_PASS):
+    height, width = pixels.shape[:2]
+    count = width - target_width
+    if count <= 0:
+        return pixels
+
+    block = -(-width // coarse_size)
+    if block >= 2 and count >= block:
+        coarse_height, coarse_width = -(-height // block), -(-width // block)
+        padded = np.pad(pixels, ((0, coarse_height * block - height), (0, coarse_width * block - width), (0, 0)), mode='edge')
+        coarse = padded.reshape(coarse_height, block, coarse_width, block, -1).mean(axis=(1, 3)).astype(np.float32)
+
+        # A partial last block cannot be removed whole, so it is protected
+        protected = np.zeros((coarse_height, coarse_width), dtype=bool)
+        if width % block:
+            protected[:, -1] = True
+        _, source_cols = carve_columns(coarse, count // block, seams_per_pass, protected)
+
+        keep = np.zeros((coarse_height, coarse_width), dtype=bool)
+        keep[np.arange(coarse_height)[:, None], source_cols] = True
+        keep = np.repeat(np.repeat(keep, block, axis=0), block, axis=1)[:height, :width]
+        pixels = pixels[keep].reshape(height, width - count // block * block, -1)
+        count -= count // block * block
+
+    if count:
+        pixels, _ = carve_columns(pixels, count, seams_per_pass)
+    return pixels
+
+# Carve an RGB array to a width / height aspect ratio, removing vertical seams from images that
+# are too wide and horizontal seams (by carving the transpose) from images that are too tall
+def carve_to_aspect(pixels, aspect=PORTRAIT_ASPECT, coarse_size=COARSE_SIZE, seams_per_pass=SEAMS_PER_PASS):
+    height, width = pixels.shape[:2]
+    if width > round(height * aspect):
+        return carve_width(pixels, round(height * aspect), coarse_size, seams_per_pass)
+    if height > round(width / aspect):
+        carved = carve_width(pixels.transpose(1, 0, 2), round(width / aspect), coarse_size, seams_per_pass)
+        return np.ascontiguousarray(carved.transpose(1, 0, 2))
+    return pixels
+
+# Content-aware resize of an RGB array: seam carve to the target's aspect ratio, then scale
+# to the target size, so the scaling itself never distorts the image
+def seam_carve_resize(pixels, target_width, target_height, coarse_size=COARSE_SIZE):
+    carved = carve_to_aspect(np.asarray(pixels), target_width / target_height, coarse_size)
+    return np.asarray(Image.fromarray(carved).resize((target_width, target_height), Image.Resampling.LANCZOS))
@@ -0,0 +1,349 @@
+import argparse
+import hashlib
+import http.client
+import io
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs, urlencode
+import numpy as np
+from PIL import Image, UnidentifiedImageError
+from batch import list_images
+from encoders import ENCODER_PROFILES, encode_image, encode_to_size, get_profile
+from manifest import params_hash
+from process_images import RESIZE_METHODS, decode_image
+from resize import decode_for_target, pad_decoded, decode_for_crop, smart_crop
+
+# Methods served: 'padding' and 'crop' are resize.py's (sized by width and height), the others
+# are the process_images methods under their registry names
+SERVICE_METHODS = {
+    'padding': None,
+    'crop': None,
+    'simple': 'Simple Resize',
+    'padding-white': 'Padding Resize',
+    'content-aware': 'Content-Aware Resize',
+}
+
+# Default in-memory result cache budget
+CACHE_BYTES = 256 << 20
+
+# Largest accepted upload
+MAX_BODY = 64 << 20
+
+# Chunk size for reading request bodies and writing responses
+CHUNK_SIZE = 64 << 10
+
+# Largest target side accepted
+MAX_SIDE = 8192
+
+# MIME type of each encoded format
+CONTENT_TYPES = {'JPEG': 'image/jpeg', 'PNG': 'image/png', 'WEBP': 'image/webp', 'AVIF': 'image/avif'}
+
+# Resize parameters from a query string, validated. Raises ValueError on anything unusable.
+def parse_params(query):
+    values = {name: items[-1] for name, items in parse_qs(query).items()}
+    params = {
+        'method': values.get('method', 'padding'),
+        'width': int(values.get('width', 1080)),
+        'height': int(values.get('height', 1350)),
+        'profile': values.get('profile', 'default'),
+        'max_bytes': int(values['max_bytes']) if 'max_bytes' in values else None,
+    }
+    if params['method'] not in SERVICE_METHODS:
+        raise ValueError(f"Unknown method {params['method']!r}; choose from {', '.join(SERVICE_METHODS)}")
+    if not (0 < params['width'] <= MAX_SIDE and 0 < params['height'] <= MAX_SIDE):
+        raise ValueError(f"width and height must be between 1 and {MAX_SIDE}")
+    profile = get_profile(params['profile'])
+    if params['max_bytes'] is not None and (profile is None or 'quality' not in profile):
+        raise ValueError("max_bytes needs an encoder profile with a quality setting")
+    return params
+
+# Resize and encode one uploaded image. Runs on the worker pool.
+# Returns the encoded bytes, their MIME type and the quality the encoder used.
+def render(data, params):
+    source = io.BytesIO(data)
+    width, height = params['width'], params['height']
+    if params['method'] == 'padding':
+        decoded = decode_for_target(source, width, height)
+        source_format = decoded[0].format
+        img = pad_decoded(decoded, width, height)
+    elif params['method'] == 'crop':
+        decoded = decode_for_crop(source, width, height)
+        source_format = decoded.format
+        img = smart_crop(decoded, width, height, reduced_decode=False)
+    else:
+        resize_function, input_kind, _ = RESIZE_METHODS[SERVICE_METHODS[params['method']]]
+        decoded, pixels = decode_image(source, need_array=input_kind == 'array', load=input_kind != 'source')
+        source_format = decoded.format
+        img = resize_function(pixels if input_kind == 'array' else decoded)
+        if isinstance(img, np.ndarray):
+            img = Image.fromarray(img)
+
+    profile = ENCODER_PROFILES[params['profile']]
+    if profile is None:
+        # Default profile: keep PNG sources as PNG, everything else as JPEG
+        profile = {'format': 'PNG' if source_format == 'PNG' else 'JPEG'}
+    if params['max_bytes'] is None:
+        body, quality = encode_image(img, profile), profile.get('quality')
+    else:
+        body, quality, _ = encode_to_size(img, profile, params['max_bytes'])
+    return body, CONTENT_TYPES[profile['format']], quality
+
+# An LRU cache of rendered results bounded by the total size of their bodies
+def make_cache(budget=CACHE_BYTES):
+    return {'entries': OrderedDict(), 'bytes': 0, 'budget': budget, 'hits': 0, 'misses': 0,
+            'lock': threading.Lock()}
+
+# Look a result up, marking it most recently used
+def cache_get(cache, key):
+    with cache['lock']:
+        value = cache['entries'].get(key)
+        if value is None:
+            cache['misses'] += 1
+            return None
+        cache['entries'].move_to_end(key)
+        cache['hits'] += 1
+        return value
+
+# Store a result, evicting the least recently used ones until the cache is within budget.
+# A result larger than the whole budget is not kept.
+def cache_put(cache, key, value):
+    size = len(value[0])
+    if size > cache['budget']:
+        return
+    with cache['lock']:
+        if key in cache['entries']:
+            cache['bytes'] -= len(cache['entries'].pop(key)[0])
+        cache['entries'][key] = value
+        cache['bytes'] += size
+        while cache['bytes'] > cache['budget']:
+            _, evicted = cache['entries'].popitem(last=False)
+            cache['bytes'] -= len(evicted[0])
+
+# Cache counters for the /stats endpoint
+def cache_stats(cache):
+    with cache['lock']:
+        return {'Entries': len(cache['entries']), 'Bytes': cache['bytes'], 'Budget': cache['budget'],
+                'Hits': cache['hits'], 'Misses': cache['misses']}
+
+# The parameters that decide a method's output: only padding and crop are sized, so the other
+# methods leave width and height out and share a result whatever size was asked for
+def output_params(params):
+    if SERVICE_METHODS[params['method']] is None:
+        return params
+    return {name: value for name, value in params.items() if name not in ('width', 'height')}
+
+# Rendered result for a request: from the cache, from an identical request already in flight,
+# or from the worker pool. Returns the result and whether it came from the cache.
+def get_result(server, data, digest, params):
+    key = (digest, params_hash(output_params(params)))
+    cached = cache_get(server.cache, key)
+    if cached is not None:
+        return cached, True
+
+    with server.pending_lock:
+        future = server.pending.get(key)
+        if future is None:
+            future = server.executor.submit(render, data, params)
+            server.pending[key] = future
+            owner = True
+        else:
+            owner = False
+    try:
+        result = future.result()
+        if owner:
+            cache_put(server.cache, key, result)
+    finally:
+        if owner:
+            with server.pending_lock:
+                server.pending.pop(key, None)
+    return result, False
+
+# HTTP front end:
+#   POST /resize?method=&width=&height=&profile=&max_bytes=  body: image bytes  ->  resized image
+#   GET /stats  ->  cache counters as JSON
+class ResizeHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        if url.path != '/resize':
+            return self.send_error(404)
+        try:
+            params = parse_params(url.query)
+        except ValueError as e:
+            return self.send_error(400, str(e))
+
+        try:
+            data, digest = self.read_body()
+        except ValueError as e:
+            return self.send_error(413 if 'large' in str(e) else 400, str(e))
+
+        try:
+            (body, content_type, quality), hit = get_result(self.server, data, digest, params)
+        except Image.DecompressionBombError as e:
+            return self.send_error(413, f"{type(e).__name__}: {e}")
+        except (UnidentifiedImageError, OSError, ValueError) as e:
+            return self.send_error(400, f"{type(e).__name__}: {e}")
+        except Exception as e:
+            # Anything else is a bug, but the client still gets a response
+            self.log_error("resize failed: %s: %s", type(e).__name__, e)
+            return self.send_error(500, f"{type(e).__name__}: {e}")
+
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('X-Cache', 'hit' if hit else 'miss')
+        if quality is not None:
+            self.send_header('X-Quality', str(quality))
+        if params['max_bytes'] is not None:
+            self.send_header('X-Within-Budget', 'true' if len(body) <= params['max_bytes'] else 'false')
+        self.end_headers()
+        view = memoryview(body)
+        for start in range(0, len(body), CHUNK_SIZE):
+            self.wfile.write(view[start:start + CHUNK_SIZE])
+
+    def do_GET(self):
+        if urlsplit(self.path).path != '/stats':
+            return self.send_error(404)
+        body = json.dumps(cache_stats(self.server.cache)).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    # Read the upload in chunks, hashing as it arrives. Handles both Content-Length and
+    # chunked transfer encoding. Returns the bytes and their SHA-256.
+    def read_body(self):
+        digest = hashlib.sha256()
+        chunks = []
+        total = 0
+
+        def add(chunk):
+            nonlocal total
+            total += len(chunk)
+            if total > MAX_BODY:
+                raise ValueError(f"Upload too large (limit {MAX_BODY} bytes)")
+            digest.update(chunk)
+            chunks.append(chunk)
+
+        if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            while True:
+                size = int(self.rfile.readline().split(b';')[0], 16)
+                if size == 0:
+                    self.rfile.readline()
+                    break
+                add(self.rfile.read(size))
+                self.rfile.readline()
+        else:
+            remaining = int(self.headers.get('Content-Length', 0))
+            if remaining > MAX_BODY:
+                raise ValueError(f"Upload too large (limit {MAX_BODY} bytes)")
+            while remaining:
+                chunk = self.rfile.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    raise ValueError("Upload ended early")
+                add(chunk)
+                remaining -= len(chunk)
+        if not chunks:
+            raise ValueError("Empty upload")
+        return b''.join(chunks), digest.hexdigest()
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+# Build a resize server; call serve_forever() on it (or use run_server)
+def make_server(host='127.0.0.1', port=8080, workers=None, cache_bytes=CACHE_BYTES, quiet=False):
+    server = ThreadingHTTPServer((host, port), ResizeHandler)
+    server.daemon_threads = True
+    server.executor = ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1)
+    server.cache = make_cache(cache_bytes)
+    server.pending = {}
+    server.pending_lock = threading.Lock()
+    server.quiet = quiet
+    return server
+
+# Serve until interrupted
+def run_server(host='127.0.0.1', port=8080, workers=None, cache_bytes=CACHE_BYTES):
+    server = make_server(host, port, workers, cache_bytes)
+    print(f"Resize service on http://{host}:{server.server_address[1]}/resize")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.executor.shutdown()
+
+# POST one image and return the response status, cache header and latency in seconds
+def post_image(host, port, data, params):
+    start = time.perf_counter()
+    connection = http.client.HTTPConnection(host, port)
+    try:
+        connection.request('POST', '/resize?' + urlencode(params), body=data,
+                           headers={'Content-Type': 'application/octet-stream'})
+        response = connection.getresponse()
+        response.read()
+        return response.status, response.getheader('X-Cache'), time.perf_counter() - start
+    finally:
+        connection.close()
+
+# Local load generator: send `requests` uploads drawn round-robin from the images in input_dir,
+# `concurrency` at a time, to a server (one is started on a free port if no port is given).
+# The first pass over the images misses the cache and later ones hit it, so latency is
+# reported separately for each. Returns throughput and latency percentiles in milliseconds.
+def load_test(input_dir, requests=200, concurrency=8, params=None, host='127.0.0.1', port=None, workers=None):
+    params = params or {'method': 'padding', 'width': 1080, 'height': 1350}
+    images = []
+    for file_name in list_images(input_dir):
+        with open(os.path.join(input_dir, file_name), 'rb') as f:
+            images.append(f.read())
+
+    server = None
+    if port is None:
+        server = make_server(host, 0, workers, quiet=True)
+        port = server.server_address[1]
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    try:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            responses = list(executor.map(lambda i: post_image(host, port, images[i % len(images)], params),
+                                          range(requests)))
+        elapsed = time.perf_counter() - start
+    finally:
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+            server.executor.shutdown()
+
+    summary = {'Requests': requests, 'Concurrency': concurrency, 'Seconds': elapsed,
+               'Throughput (req/s)': requests / elapsed,
+               'Errors': sum(status != 200 for status, _, _ in responses)}
+    for kind in ('miss', 'hit'):
+        latencies = [latency * 1000 for status, cache, latency in responses if status == 200 and cache == kind]
+        if latencies:
+            summary[kind] = {'Count': len(latencies), **{f"p{p}": float(np.percentile(latencies, p)) for p in (50, 95, 99)}}
+    return summary
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local HTTP resize service")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--cache-mb', type=int, default=CACHE_BYTES >> 20)
+    parser.add_argument('--load-test', metavar='INPUT_DIR', help="run the load generator against a local server instead")
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=8)
+    args = parser.parse_args()
+
+    if args.load_test:
+        print(json.dumps(load_test(args.load_test, args.requests, args.concurrency, workers=args.workers), indent=2))
+    else:
+        run_server(args.host, args.port, args.workers, args.cache_mb << 20)
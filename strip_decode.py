@@ -0,0 +1,184 @@
+import struct
+import zlib
+from io import BytesIO
+from PIL import Image
+
+# Huge images are downscaled a strip of rows at a time: each strip is decoded, box-reduced and
+# pasted into the reduced image, so the full-resolution image never exists in memory. Pillow only
+# decodes whole images, so non-interlaced PNGs are read here directly: the compressed data is
+# inflated as it is read and each strip's rows are unfiltered by Pillow as a small PNG of their own.
+# JPEGs need none of this, as libjpeg decodes them straight at 1/2, 1/4 or 1/8 scale (draft()).
+
+# Compressed bytes read from the file, and inflated bytes produced, at a time
+READ_BLOCK = 1 << 16
+INFLATE_BLOCK = 1 << 20
+
+# Size of one strip of decoded rows. A strip is always a whole number of reduction boxes tall,
+# so a very wide image at a large reduction can have bigger strips.
+STRIP_BYTES = 4 << 20
+
+# Peak working memory of a strip as a multiple of its size: the filtered rows, their small PNG,
+# the unfiltered bytes, the strip image and its converted copy
+STRIP_PEAK_FACTOR = 6
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+# PNG color type -> samples per pixel
+PNG_CHANNELS = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}
+
+# 8-bit color type with the given bytes per pixel (gray, gray + alpha, RGB, RGBA). A strip is
+# unfiltered as this type, which returns its rows as plain bytes whatever the real pixel format.
+BYTE_COLOR_TYPES = {1: 0, 2: 4, 3: 2, 4: 6}
+
+# Width, height, bit depth, color type and interlace method from a PNG's IHDR, or None for a file
+# that is not a PNG
+def png_header(fp):
+    fp.seek(0)
+    data = fp.read(33)
+    if len(data) < 33 or data[:8] != PNG_SIGNATURE or data[12:16] != b'IHDR':
+        return None
+    width, height, bit_depth, color_type, _, _, interlace = struct.unpack('>IIBBBBB', data[16:29])
+    return {'Width': width, 'Height': height, 'Bit Depth': bit_depth, 'Color Type': color_type,
+            'Interlace': interlace}
+
+# Bytes per complete pixel, the distance PNG filters look back (at least one byte)
+def filter_bytes(header):
+    return max(1, PNG_CHANNELS[header['Color Type']] * header['Bit Depth'] // 8)
+
+# Bytes in one unfiltered row
+def row_bytes(header):
+    return (header['Width'] * PNG_CHANNELS[header['Color Type']] * header['Bit Depth'] + 7) // 8
+
+# Whether an opened image can be read in strips: a PNG not yet decoded, not interlaced (Adam7
+# rows cannot be finished one strip at a time), and not 16-bit RGB or RGBA (no 8-bit color type
+# has six or eight bytes per pixel to unfilter them as)
+def can_stream(img):
+    if img.format != 'PNG' or not img.tile or getattr(img, 'fp', None) is None:
+        return False
+    header = png_header(img.fp)
+    return (header is not None and header['Color Type'] in PNG_CHANNELS and not header['Interlace']
+            and filter_bytes(header) in BYTE_COLOR_TYPES)
+
+# Mode an image is reduced in: reduce() cannot average palette indices or 1-bit pixels, and has
+# no 16-bit integer modes (those are widened to 32-bit 'I', which keeps every value)
+def reducible(img):
+    if img.mode in ('P', '1'):
+        return img.convert('L' if img.mode == '1' else 'RGBA' if 'transparency' in img.info else 'RGB')
+    if img.mode.startswith('I;16'):
+        return img.convert('I')
+    return img
+
+# Compressed image data of a PNG, READ_BLOCK bytes at a time across its IDAT chunks
+def idat_blocks(fp):
+    fp.seek(len(PNG_SIGNATURE))
+    while True:
+        chunk = fp.read(8)
+        if len(chunk) < 8:
+            raise ValueError("PNG ends before its IEND chunk")
+        length, kind = struct.unpack('>I4s', chunk)
+        if kind == b'IEND':
+            return
+        if kind != b'IDAT':
+            fp.seek(length + 4, 1)
+            continue
+        while length:
+            block = fp.read(min(length, READ_BLOCK))
+            if not block:
+                raise ValueError("PNG ends inside an IDAT chunk")
+            length -= len(block)
+            yield block
+        fp.seek(4, 1)
+
+# Filtered rows of a PNG (a filter byte then the row), inflated at most INFLATE_BLOCK at a time
+def inflated_blocks(fp):
+    inflater = zlib.decompressobj()
+    for block in idat_blocks(fp):
+        while block:
+            data = inflater.decompress(block, INFLATE_BLOCK)
+            block = inflater.unconsumed_tail
+            if data:
+                yield data
+    data = inflater.flush()
+    if data:
+        yield data
+
+# One chunk of a PNG file
+def png_chunk(kind, data):
+    return b''.join([struct.pack('>I', len(data)), kind, data, struct.pack('>I', zlib.crc32(data, zlib.crc32(kind)))])
+
+# Unfilter a strip of filtered rows. The Up, Average and Paeth filters refer to the row above, so
+# the last unfiltered row of the previous strip goes first, unfiltered (filter byte 0). Pillow
+# undoes the filters on a PNG of just these rows, stored uncompressed, with an 8-bit color type
+# of the same bytes per pixel; its pixels are then the rows' bytes.
+def unfilter_strip(filtered, previous, header):
+    bpp, stride = filter_bytes(header), row_bytes(header)
+    if previous is not None:
+        filtered = b''.join([b'\x00', previous, filtered])
+    rows = len(filtered) // (stride + 1)
+    ihdr = struct.pack('>IIBBBBB', stride // bpp, rows, 8, BYTE_COLOR_TYPES[bpp], 0, 0, 0)
+    png = b''.join([PNG_SIGNATURE, png_chunk(b'IHDR', ihdr), png_chunk(b'IDAT', zlib.compress(filtered, 0)),
+                    png_chunk(b'IEND', b'')])
+    with Image.open(BytesIO(png)) as strip:
+        data = strip.tobytes()
+    return data[stride:] if previous is not None else data
+
+# Strips of an opened PNG (see can_stream), `rows` rows at a time (the last may be shorter), as
+# images in the PNG's own mode. Yields the top row of each strip and the strip.
+def png_strips(img, rows):
+    header = png_header(img.fp)
+    stride = row_bytes(header)
+    rawmode = img.tile[0][3]
+    if isinstance(rawmode, tuple):
+        rawmode = rawmode[0]
+    # The palette as read from the header (getpalette() would decode the whole image)
+    palette = img.palette if img.mode == 'P' else None
+
+    pending = bytearray()
+    previous = None
+    top = 0
+    blocks = inflated_blocks(img.fp)
+    while top < header['Height']:
+        count = min(rows, header['Height'] - top)
+        while len(pending) < count * (stride + 1):
+            block = next(blocks, None)
+            if block is None:
+                raise ValueError("PNG image data ends early")
+            pending += block
+        data = unfilter_strip(bytes(pending[:count * (stride + 1)]), previous, header)
+        del pending[:count * (stride + 1)]
+        previous = data[-stride:]
+
+        strip = Image.frombytes(img.mode, (header['Width'], count), data, 'raw', rawmode)
+        if palette is not None:
+            strip.putpalette(palette.palette, palette.rawmode or palette.mode)
+            if 'transparency' in img.info:
+                strip.info['transparency'] = img.info['transparency']
+        yield top, strip
+        top += count
+
+# Rows per strip of an opened PNG reduced by `factor`: about STRIP_BYTES of decoded rows,
+# and a whole number of reduction boxes
+def strip_rows(img, factor, strip_bytes=STRIP_BYTES):
+    stride = row_bytes(png_header(img.fp))
+    return max(1, strip_bytes // (stride * factor)) * factor
+
+# Peak memory of strip_reduce's strips, in bytes, for an image reduced by `factor`
+def strip_memory(img, factor, strip_bytes=STRIP_BYTES):
+    return STRIP_PEAK_FACTOR * strip_rows(img, factor, strip_bytes) * row_bytes(png_header(img.fp))
+
+# Reduce an opened PNG (see can_stream) by an integer factor, as img.reduce(factor) would, one
+# strip at a time. Returns the reduced image, in reducible() mode; img itself is left undecoded.
+def strip_reduce(img, factor, strip_bytes=STRIP_BYTES):
+    width, height = img.size
+    reduced = None
+    for top, strip in png_strips(img, strip_rows(img, factor, strip_bytes)):
+        with strip:
+            converted = reducible(strip)
+            small = converted.reduce(factor)
+            if converted is not strip:
+                converted.close()
+        with small:
+            if reduced is None:
+                reduced = Image.new(small.mode, (-(-width // factor), -(-height // factor)))
+            reduced.paste(small, (0, top // factor))
+    return reduced
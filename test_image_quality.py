@@ -1,68 +1,130 @@
 import time
-import pandas as pd
+import hashlib
+from collections import OrderedDict
 from PIL import Image, ImageOps
 import os
 import numpy as np
-from skimage.metrics import structural_similarity as ssim
-from process_images import process_images_simple, process_images_padding, process_images_content_aware  # Import various methods
 
-# Directories
-frozen_test_dir = "/Users/jameswinslow/Documents/Projects/DataScience/IGPhotoResizer/frozen_test_images"
-test_output_dir = "/Users/jameswinslow/Documents/Projects/DataScience/IGPhotoResizer/test_output"
+# Scores kept for unchanged outputs (a few dozen bytes each)
+SCORE_CACHE_SIZE = 65536
 
-# Ensure directories exist
-if not os.path.exists(frozen_test_dir):
-    os.makedirs(frozen_test_dir)
+# Scores already computed, keyed by original path and modification time and the hash of the
+# processed file's bytes, least recently used first
+score_cache = OrderedDict()
 
-if not os.path.exists(test_output_dir):
-    os.makedirs(test_output_dir)
+# Grayscale array of an original image, decoded for each score: references are full resolution,
+# so holding them between runs would cost gigabytes on a large set
+def load_reference(original_img_path):
+    with Image.open(original_img_path) as original_img:
+        return np.array(ImageOps.grayscale(original_img))
 
 # Function to calculate SSIM and MSE
 def calculate_metrics(original_img_path, processed_img_path):
-    original_img = Image.open(original_img_path)
-    processed_img = Image.open(processed_img_path)
+    with Image.open(processed_img_path) as processed_img:
+        return compute_metrics(load_reference(original_img_path), processed_img)
+
+# Batch work unit scoring one output (see batch.run_job): the original is the job's image path
+def score_file(original_img_path, processed_img_path):
+    ssim_value, mse_value = calculate_metrics(original_img_path, processed_img_path)
+    return {'SSIM': ssim_value, 'MSE': mse_value}
+
+# SSIM and MSE of a processed image against a grayscale reference array, without any caching
+def compute_metrics(original_array, processed_img):
+    from skimage.metrics import structural_similarity as ssim
 
     # Resize processed image to match original dimensions
-    processed_img_resized = processed_img.resize(original_img.size)
+    processed_img_resized = processed_img.resize((original_array.shape[1], original_array.shape[0]))
 
     # Convert to grayscale for SSIM
-    original_gray = ImageOps.grayscale(original_img)
-    processed_gray = ImageOps.grayscale(processed_img_resized)
-
-    original_array = np.array(original_gray)
-    processed_array = np.array(processed_gray)
+    processed_array = np.array(ImageOps.grayscale(processed_img_resized))
 
-    # Calculate SSIM and MSE
+    # Calculate SSIM and MSE (in float, so the uint8 difference cannot wrap around)
     ssim_value = ssim(original_array, processed_array)
-    mse_value = np.mean((original_array - processed_array) ** 2)
+    mse_value = np.mean(np.square(original_array.astype(np.float64) - processed_array))
 
     return ssim_value, mse_value
 
+# Score (original path, processed path) pairs on the batch process pool (see batch.run_jobs)
+# Outputs are deterministic, so an unchanged processed file reuses its earlier score from
+# score_cache without decoding anything. Pairs whose processed image is missing are left out;
+# returns (original file name, (SSIM, MSE)) pairs.
+def score_images(pairs, workers=None):
+    from batch import run_jobs
+    pairs = [pair for pair in pairs if os.path.exists(pair[1])]
+    keys = []
+    for original_img_path, processed_img_path in pairs:
+        with open(processed_img_path, 'rb') as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+        keys.append((original_img_path, os.stat(original_img_path).st_mtime_ns, digest))
+
+    misses = [position for position, key in enumerate(keys) if key not in score_cache]
+    jobs = [(score_file, os.path.basename(pairs[position][0]), *pairs[position]) for position in misses]
+    for position, result in zip(misses, run_jobs(jobs, workers)):
+        if not result['Success']:
+            raise RuntimeError(f"Could not score {pairs[position][1]}: {result['Error']}")
+        score_cache[keys[position]] = (result['SSIM'], result['MSE'])
+
+    scores = []
+    for pair, key in zip(pairs, keys):
+        score_cache.move_to_end(key)
+        scores.append((os.path.basename(pair[0]), score_cache[key]))
+    while len(score_cache) > SCORE_CACHE_SIZE:
+        score_cache.popitem(last=False)
+    return scores
+
 # Function to evaluate different methods and aggregate results
-def evaluate_images(method, process_method, n_runs=5):
+# process_method(input_dir, output_dir) is run n_runs times and every output scored against its original
+# With a store_dir, each run's scores are appended to that results store (see results_store.py) as
+# soon as they are computed, under `session` (a new one if not given).
+# With dedupe ('reuse' or 'report', see phash.py), process_method is also given dedupe, and
+# near-duplicate images are not scored: they reuse their original's score, or are left out.
+def evaluate_images(method, process_method, input_dir, output_dir, n_runs=5, store_dir=None, session=None,
+                    dedupe=None):
+    if store_dir:
+        from results_store import append_results, new_session
+        session = session or new_session()
     results = []
-    
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+
+    # Near-duplicates by file name -> their original's file name
+    duplicates = {}
+    if dedupe:
+        from batch import list_images
+        from phash import check_dedupe, find_duplicates
+        check_dedupe(dedupe)
+        file_names = list_images(input_dir)
+        found = find_duplicates([os.path.join(input_dir, file_name) for file_name in file_names])
+        duplicates = {file_names[position]: file_names[original] for position, (original, _) in found.items()}
+        print(f"{len(duplicates)} near-duplicates in {input_dir}: "
+              + ('scores reused' if dedupe == 'reuse' else 'left out'))
+
     for i in range(n_runs):
         print(f"Starting run {i + 1} for {method}...")
         start_time = time.time()  # Start timing
 
         # Run the selected resizing method
-        process_method(frozen_test_dir, test_output_dir)
-
-        # Evaluate each image in the frozen test folder
-        for file_name in os.listdir(frozen_test_dir):
-            original_img_path = os.path.join(frozen_test_dir, file_name)
-            processed_img_path = os.path.join(test_output_dir, file_name)
-
-            if os.path.exists(processed_img_path):
-                ssim_value, mse_value = calculate_metrics(original_img_path, processed_img_path)
-                results.append({
-                    'Run': i + 1,
-                    'Method': method,
-                    'Image': file_name,
-                    'SSIM': ssim_value,
-                    'MSE': mse_value
-                })
+        if dedupe:
+            process_method(input_dir, output_dir, dedupe=dedupe)
+        else:
+            process_method(input_dir, output_dir)
+
+        # Evaluate each image in the input folder
+        pairs = [(os.path.join(input_dir, file_name), os.path.join(output_dir, file_name))
+                 for file_name in sorted(os.listdir(input_dir)) if file_name not in duplicates]
+        scores = dict(score_images(pairs))
+        if dedupe == 'reuse':
+            scores.update({file_name: scores[original] for file_name, original in duplicates.items() if original in scores})
+        run_results = [{
+            'Run': i + 1,
+            'Method': method,
+            'Image': file_name,
+            'SSIM': ssim_value,
+            'MSE': mse_value
+        } for file_name, (ssim_value, mse_value) in sorted(scores.items())]
+        results.extend(run_results)
+        if store_dir:
+            append_results(store_dir, run_results, session, method)
 
         end_time = time.time()  # End timing
         runtime = end_time - start_time
@@ -70,23 +132,63 @@ def evaluate_images(method, process_method, n_runs=5):
 
     return results
 
+# Compare the reduced-scale decode path of resize_with_padding against a full-resolution decode
+# Reports the SSIM between the two outputs and the speedup for each image
+def compare_decode_paths(input_dir, target_width=1080, target_height=1350):
+    import pandas as pd
+    from skimage.metrics import structural_similarity as ssim
+    from resize import resize_with_padding
+
+    comparisons = []
+    for file_name in sorted(os.listdir(input_dir)):
+        if not file_name.endswith(('.jpg', '.jpeg', '.png')):
+            continue
+        img_path = os.path.join(input_dir, file_name)
+
+        start_time = time.perf_counter()
+        full = resize_with_padding(Image.open(img_path), target_width, target_height, (0, 0, 0), reduced_decode=False)
+        full_time = time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        reduced = resize_with_padding(Image.open(img_path), target_width, target_height, (0, 0, 0))
+        reduced_time = time.perf_counter() - start_time
+
+        comparisons.append({
+            'Image': file_name,
+            'SSIM': ssim(np.array(ImageOps.grayscale(full)), np.array(ImageOps.grayscale(reduced))),
+            'Full Decode (s)': full_time,
+            'Reduced Decode (s)': reduced_time,
+            'Speedup': full_time / reduced_time
+        })
+
+    if comparisons:
+        comparison_df = pd.DataFrame(comparisons)
+        print(f"Reduced decode: mean SSIM {comparison_df['SSIM'].mean():.4f} "
+              f"(min {comparison_df['SSIM'].min():.4f}), mean speedup {comparison_df['Speedup'].mean():.2f}x")
+    return comparisons
+
 if __name__ == "__main__":
-    all_results = []
+    from process_images import process_images_simple, process_images_padding, process_images_content_aware  # Import various methods
+    from results_store import new_session
+
+    # Directories
+    frozen_test_dir = "/Users/jameswinslow/Documents/Projects/DataScience/IGPhotoResizer/frozen_test_images"
+    test_output_dir = "/Users/jameswinslow/Documents/Projects/DataScience/IGPhotoResizer/test_output"
+
+    # Every evaluation is appended to the results store as a new session
+    results_store_dir = os.path.join(os.path.dirname(__file__), "results_store")
+    session = new_session()
 
     # Run evaluation for simple resizing method
-    all_results.extend(evaluate_images("Simple Resize", process_images_simple, n_runs=5))
+    evaluate_images("Simple Resize", process_images_simple, frozen_test_dir, test_output_dir, n_runs=5,
+                    store_dir=results_store_dir, session=session)
 
     # Run evaluation for padding resizing method
-    all_results.extend(evaluate_images("Padding Resize", process_images_padding, n_runs=5))
+    evaluate_images("Padding Resize", process_images_padding, frozen_test_dir, test_output_dir, n_runs=5,
+                    store_dir=results_store_dir, session=session)
 
     # Run evaluation for content-aware resizing method
-    all_results.extend(evaluate_images("Content-Aware Resize", process_images_content_aware, n_runs=5))
-
-    # Convert results to DataFrame
-    results_df = pd.DataFrame(all_results)
-
-    # Save results to CSV
-    results_csv_path = os.path.join(os.path.dirname(__file__), "resizing_comparison_results.csv")
-    results_df.to_csv(results_csv_path, index=False)
+    evaluate_images("Content-Aware Resize", process_images_content_aware, frozen_test_dir, test_output_dir, n_runs=5,
+                    store_dir=results_store_dir, session=session)
 
-    print(f"All results saved to {results_csv_path}")
+    print(f"All results saved to {results_store_dir} (session {session})")
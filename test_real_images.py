@@ -1,12 +1,12 @@
-import pandas as pd
 from PIL import Image
 import cv2
 import os
 from skimage.metrics import structural_similarity as ssim
 import numpy as np
-
-# Unified results DataFrame
-results = pd.DataFrame(columns=['File', 'Method', 'SSIM', 'MSE'])
+from pipeline import stream_images, read_image
+from tracing import enable_tracing, tracing_enabled, start_trace, stage, record_traces
+from seam_carving import carve_to_aspect
+from results_store import append_results, new_session
 
 # Calculate metrics function
 def calculate_metrics(img1, img2):
@@ -27,37 +27,69 @@ def calculate_metrics(img1, img2):
 
     return ssim_value, mse_value
 
-# Resizing functions that append results to a single DataFrame
-def process_images(input_dir, output_dir, method_name, resize_function):
+# Resize every image with one method and return the scores, one dict per file
+# Files stream through stream_images, so reading and saving overlap with the resize and scoring.
+# With a trace_path, per-image stage timings are appended there as JSONL. With a store_dir, the
+# scores are appended to that results store (see results_store.py) under `session`.
+def process_images(input_dir, output_dir, method_name, resize_function, trace_path=None, store_dir=None, session=None):
     ensure_output_dir(output_dir)
-    global results  # Using global results DataFrame to collect all results
-    all_results = []  # Accumulate results in a list before concatenating
-
-    for file_name in os.listdir(input_dir):
-        if file_name.endswith(('.jpg', '.jpeg', '.png')):
-            img_path = os.path.join(input_dir, file_name)
-            img_original = Image.open(img_path)
-            img_resized = resize_function(img_original)  # Call method-specific resize function
+    all_results = []
+    trace_records = []
+    was_enabled = tracing_enabled()
+    if trace_path:
+        enable_tracing()
+
+    # Decode, starting the trace record that travels with the image through the stages
+    def read_original(img_path):
+        record = start_trace(img_path)
+        with stage(record, 'decode'):
+            img_original = read_image(img_path)
+        return img_original, record
+
+    # Resize, then calculate metrics by comparing the original image to the resized image
+    # The original is closed once scored, and the resized image once saved, so only the images
+    # in the pipeline's bounded queues are ever held
+    def resize_and_score(decoded):
+        img_original, record = decoded
+        with img_original:
+            with stage(record, 'resize'):
+                img_resized = resize_function(img_original)  # Call method-specific resize function
+            with stage(record, 'metrics'):
+                ssim_value, mse_value = calculate_metrics(img_original, img_resized)
+        return img_resized, record, {'SSIM': ssim_value, 'MSE': mse_value}
+
+    # Save resized image (optional) and pass the metrics on to the results
+    def save_resized(result, output_path):
+        img_resized, record, metrics = result
+        with img_resized, stage(record, 'encode'):
+            img_resized.save(output_path)
+        return dict(metrics, Trace=record)
 
-            # Calculate metrics by comparing the original image to the resized image
-            ssim_value, mse_value = calculate_metrics(img_original, img_resized)
+    try:
+        for result in stream_images(input_dir, output_dir, resize_and_score, read=read_original, save=save_resized):
+            if not result['Success']:
+                print(f"{method_name} resize failed for: {result['File']} ({result['Error']})")
+                continue
+            if result['Trace'] is not None:
+                trace_records.append(result['Trace'])
 
             # Append to the results list
             all_results.append({
-                'File': file_name,
+                'File': result['File'],
                 'Method': method_name,
-                'SSIM': ssim_value,
-                'MSE': mse_value
+                'SSIM': result['SSIM'],
+                'MSE': result['MSE']
             })
 
-            # Save resized image (optional)
-            output_path = os.path.join(output_dir, file_name)
-            img_resized.save(output_path)
+            print(f"{method_name} resize completed for: {result['File']}")
+    finally:
+        enable_tracing(was_enabled)
+    if trace_path:
+        record_traces(trace_records, trace_path)
 
-            print(f"{method_name} resize completed for: {file_name}")
-
-    # Concatenate the results list into the global results DataFrame
-    results = pd.concat([results, pd.DataFrame(all_results)], ignore_index=True)
+    if store_dir:
+        append_results(store_dir, all_results, session, method_name)
+    return all_results
 
 # Example resize functions
 def simple_resize(img):
@@ -74,8 +106,8 @@ def padding_resize(img):
     return new_img.resize((800, 800), Image.Resampling.LANCZOS)  # Resizing to fixed size for comparison
 
 def content_aware_resize(img):
-    # Content-aware resizing using OpenCV
-    img_np = np.array(img)
+    # Seam carve to a 4:5 portrait, then scale down by 50% using OpenCV
+    img_np = carve_to_aspect(np.array(img.convert('RGB')))
     target_width = int(img_np.shape[1] * 0.5)  # Scale down width by 50%
     new_size = (target_width, int(img_np.shape[0] * (target_width / img_np.shape[1])))
     img_resized = cv2.resize(img_np, new_size, interpolation=cv2.INTER_AREA)
@@ -91,15 +123,16 @@ def main():
     input_dir = '/Users/jameswinslow/Documents/Projects/DataScience/IGPhotoResizer/frozen_real_images'
     output_dir = '/Users/jameswinslow/Documents/Projects/DataScience/IGPhotoResizer/resized_images'
 
+    # Results of every method are appended to the store as one new session
+    store_dir = os.path.join(output_dir, 'results_store_real_images')
+    session = new_session()
+
     # Process with all resizing methods
-    process_images(input_dir, output_dir, 'Simple Resize', simple_resize)
-    process_images(input_dir, output_dir, 'Padding Resize', padding_resize)
-    process_images(input_dir, output_dir, 'Content-Aware Resize', content_aware_resize)
-
-    # Save the results to CSV
-    results_file = os.path.join(output_dir, 'resizing_comparison_results_real_images.csv')
-    results.to_csv(results_file, index=False)
-    print(f"All results saved to {results_file}")
+    process_images(input_dir, output_dir, 'Simple Resize', simple_resize, store_dir=store_dir, session=session)
+    process_images(input_dir, output_dir, 'Padding Resize', padding_resize, store_dir=store_dir, session=session)
+    process_images(input_dir, output_dir, 'Content-Aware Resize', content_aware_resize, store_dir=store_dir, session=session)
+
+    print(f"All results saved to {store_dir} (session {session})")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,102 @@
+import json
+import os
+import time
+from collections import deque
+from contextlib import contextmanager, nullcontext
+import numpy as np
+from PIL import Image
+
+# Environment switch for tracing, so process pool workers inherit it from the parent
+TRACE_ENV = 'IGRESIZER_TRACE'
+
+# Shared no-op context handed out for every stage while tracing is off
+NULL_STAGE = nullcontext()
+
+# Turn tracing on or off for this process and any worker started after it
+def enable_tracing(enabled=True):
+    if enabled:
+        os.environ[TRACE_ENV] = '1'
+    else:
+        os.environ.pop(TRACE_ENV, None)
+
+# Whether tracing is on
+def tracing_enabled():
+    return os.environ.get(TRACE_ENV) == '1'
+
+# Start a trace record for one image, or return None when tracing is off.
+# The input dimensions come from the header only, so no pixels are decoded here. img_path may
+# also be an archive member read into memory (a BytesIO named after the member, see archive_io.py).
+def start_trace(img_path):
+    if not tracing_enabled():
+        return None
+    with Image.open(img_path) as img:
+        width, height = img.size
+    in_memory = hasattr(img_path, 'getbuffer')
+    return {
+        'File': os.path.basename(img_path.name if in_memory else img_path),
+        'Width': width,
+        'Height': height,
+        'Bytes': img_path.getbuffer().nbytes if in_memory else os.path.getsize(img_path),
+        'Stages': {},
+    }
+
+# Time a stage of an image's processing; a no-op when record is None
+def stage(record, name):
+    if record is None:
+        return NULL_STAGE
+    return timed_stage(record, name)
+
+# Wall and CPU time of a stage, in milliseconds. CPU time is per thread, which keeps it
+# meaningful when stages run on the streaming pipeline's threads.
+@contextmanager
+def timed_stage(record, name):
+    wall, cpu = time.perf_counter(), time.thread_time()
+    try:
+        yield
+    finally:
+        timings = record['Stages'].setdefault(name, {'Wall': 0.0, 'CPU': 0.0})
+        timings['Wall'] += (time.perf_counter() - wall) * 1000
+        timings['CPU'] += (time.thread_time() - cpu) * 1000
+
+# Append trace records to a JSONL file
+def write_traces(records, trace_path):
+    with open(trace_path, 'a') as f:
+        for record in records:
+            record = dict(record, Total=sum(timings['Wall'] for timings in record['Stages'].values()))
+            f.write(json.dumps(record) + '\n')
+
+# Read back the last `window` records of a JSONL trace file
+def read_traces(trace_path, window=10000):
+    with open(trace_path) as f:
+        lines = deque(f, maxlen=window)
+    return [json.loads(line) for line in lines if line.strip()]
+
+# Rolling summary over recent records: p50/p95/p99 wall and CPU time per stage and
+# the slowest files by total wall time
+def summarize_traces(records, slowest=10):
+    stages = {}
+    for record in records:
+        for name, timings in record['Stages'].items():
+            stages.setdefault(name, {'Wall': [], 'CPU': []})
+            stages[name]['Wall'].append(timings['Wall'])
+            stages[name]['CPU'].append(timings['CPU'])
+
+    summary = {'Images': len(records), 'Stages': {}}
+    for name, timings in stages.items():
+        summary['Stages'][name] = {
+            f"{kind} p{p}": float(np.percentile(values, p))
+            for kind, values in timings.items() for p in (50, 95, 99)
+        }
+
+    by_total = sorted(records, key=lambda record: record['Total'], reverse=True)[:slowest]
+    summary['Slowest'] = [{'File': record['File'], 'Total': record['Total'], 'Width': record['Width'],
+                           'Height': record['Height'], 'Bytes': record['Bytes']} for record in by_total]
+    return summary
+
+# Append a batch's records to the trace file and rewrite the rolling summary next to it
+def record_traces(records, trace_path, window=10000, slowest=10):
+    write_traces(records, trace_path)
+    summary = summarize_traces(read_traces(trace_path, window), slowest)
+    with open(os.path.splitext(trace_path)[0] + '.summary.json', 'w') as f:
+        json.dump(summary, f, indent=2)
+    return summary
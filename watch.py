@@ -0,0 +1,295 @@
+import argparse
+import asyncio
+import ctypes
+import ctypes.util
+import os
+import shutil
+import signal
+import struct
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import numpy as np
+from batch import IMAGE_EXTENSIONS, list_images, run_job
+from encoders import ENCODER_PROFILES, EXTENSIONS, get_profile
+from resize import process_image_file, check_mode
+
+# inotify flags (from <sys/inotify.h>): a file closed after writing, a file moved into the folder,
+# and the kernel's event queue overflowing
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_Q_OVERFLOW = 0x00004000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+# Fixed part of an inotify event: watch descriptor, mask, cookie and name length
+EVENT_HEADER = struct.Struct('iIII')
+
+# Seconds between directory scans when polling
+POLL_INTERVAL = 1.0
+
+# A polled file counts as completely written once its size and mtime hold still this long
+SETTLE_TIME = 0.25
+
+# Outputs are written under this prefix and renamed into place, so readers never see half a file
+PARTIAL_PREFIX = '.partial-'
+
+# Start an inotify watch on a directory. Returns the inotify file descriptor, or None where
+# inotify is not available (not Linux, or no free watches), in which case the caller polls.
+def open_inotify(input_dir):
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+    except (OSError, AttributeError):
+        return None
+    if fd < 0:
+        return None
+    if libc.inotify_add_watch(fd, os.fsencode(input_dir), IN_CLOSE_WRITE | IN_MOVED_TO) < 0:
+        os.close(fd)
+        return None
+    return fd
+
+# Read whatever events are waiting on an inotify descriptor as (mask, file name) pairs
+def read_events(fd):
+    try:
+        data = os.read(fd, 64 * 1024)
+    except BlockingIOError:
+        return []
+    events = []
+    offset = 0
+    while offset + EVENT_HEADER.size <= len(data):
+        _, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+        offset += EVENT_HEADER.size
+        events.append((mask, os.fsdecode(data[offset:offset + length].rstrip(b'\0'))))
+        offset += length
+    return events
+
+# Run a work unit against a hidden partial output, then rename the result into place.
+# A failed run leaves nothing behind in the output directory.
+def atomic_output(work_fn, img_path, output_path):
+    directory, file_name = os.path.split(output_path)
+    partial_path = os.path.join(directory, PARTIAL_PREFIX + file_name)
+    try:
+        extra = work_fn(img_path, partial_path) or {}
+    except Exception:
+        # An encoder profile may have changed the extension of the partial file
+        stem = os.path.splitext(PARTIAL_PREFIX + file_name)[0]
+        for name in os.listdir(directory):
+            if os.path.splitext(name)[0] == stem:
+                os.remove(os.path.join(directory, name))
+        raise
+
+    written = extra.get('Output', partial_path)
+    final_path = os.path.join(directory, os.path.basename(written)[len(PARTIAL_PREFIX):])
+    os.replace(written, final_path)
+    return dict(extra, Output=final_path)
+
+# Name the output of a source file gets under an encoder profile
+def output_name(file_name, profile='default'):
+    settings = ENCODER_PROFILES[profile]
+    if settings is None:
+        return file_name
+    return os.path.splitext(file_name)[0] + EXTENSIONS[settings['format']]
+
+# Wait until a file's size and mtime stop changing. Returns its final stat, or None if it went away.
+async def settled(img_path, settle_time=SETTLE_TIME):
+    previous = None
+    while True:
+        try:
+            stat = os.stat(img_path)
+        except FileNotFoundError:
+            return None
+        current = (stat.st_size, stat.st_mtime_ns)
+        if current == previous:
+            return stat
+        previous = current
+        await asyncio.sleep(settle_time)
+
+# Watch input_dir and resize every new or modified image into output_dir with resize.process_image_file,
+# until `stop` is set. Files are found with inotify on Linux (a close after writing or a move into the
+# folder) and by polling every poll_interval seconds elsewhere; polled files are only picked up once
+# they have settled. Images already in the folder without an up-to-date output are caught up first.
+# Files go through an asyncio queue to `workers` coroutines, each with at most one file in flight on
+# a shared process pool, and outputs are renamed into place once complete.
+# Every result gets a 'Latency': seconds from the file landing in input_dir (its ctime) to its output
+# being in place. on_result, if given, is called with each result. Returns all results once stopped.
+async def watch(input_dir, output_dir, workers=None, profile='default', max_bytes=None, method='padding',
+                poll_interval=POLL_INTERVAL, settle_time=SETTLE_TIME, use_inotify=True, stop=None, on_result=None):
+    get_profile(profile)
+    check_mode(method)
+    os.makedirs(output_dir, exist_ok=True)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    stop = stop or asyncio.Event()
+
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    queued, active, rerun = set(), set(), set()
+    results = []
+    work_fn = partial(atomic_output, partial(process_image_file, profile=profile, max_bytes=max_bytes, method=method))
+
+    # Queue a file once; one that changes while it is being processed runs again afterwards
+    def enqueue(file_name, trusted):
+        if not file_name.endswith(IMAGE_EXTENSIONS) or file_name.startswith('.'):
+            return
+        if file_name in active:
+            rerun.add(file_name)
+        elif file_name not in queued:
+            queued.add(file_name)
+            queue.put_nowait((file_name, trusted))
+
+    # Scan the folder, queueing files that are new or changed since the last scan
+    seen = {}
+    def scan(catch_up=False):
+        with os.scandir(input_dir) as entries:
+            for entry in entries:
+                if not entry.is_file() or not entry.name.endswith(IMAGE_EXTENSIONS):
+                    continue
+                stat = entry.stat()
+                state = (stat.st_size, stat.st_mtime_ns)
+                if seen.get(entry.name) == state:
+                    continue
+                seen[entry.name] = state
+                if catch_up:
+                    output_path = os.path.join(output_dir, output_name(entry.name, profile))
+                    if os.path.exists(output_path) and os.stat(output_path).st_mtime_ns >= stat.st_mtime_ns:
+                        continue
+                enqueue(entry.name, False)
+
+    async def poll():
+        while True:
+            await asyncio.sleep(poll_interval)
+            scan()
+
+    async def worker(executor):
+        while True:
+            file_name, trusted = await queue.get()
+            queued.discard(file_name)
+            active.add(file_name)
+            try:
+                img_path = os.path.join(input_dir, file_name)
+                stat = os.stat(img_path) if trusted and os.path.exists(img_path) else await settled(img_path, settle_time)
+                if stat is None:
+                    continue
+                job = (work_fn, file_name, img_path, os.path.join(output_dir, file_name))
+                result = await loop.run_in_executor(executor, run_job, job)
+                result['Latency'] = time.time() - stat.st_ctime
+                results.append(result)
+                if on_result:
+                    on_result(result)
+            finally:
+                active.discard(file_name)
+                if file_name in rerun:
+                    rerun.discard(file_name)
+                    enqueue(file_name, False)
+                queue.task_done()
+
+    # Events on the inotify descriptor are handled straight from the event loop
+    def on_events():
+        for mask, file_name in read_events(fd):
+            if mask & IN_Q_OVERFLOW:
+                scan()
+            else:
+                enqueue(file_name, True)
+
+    fd = open_inotify(input_dir) if use_inotify else None
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        tasks = [asyncio.create_task(worker(executor)) for _ in range(workers)]
+        if fd is None:
+            tasks.append(asyncio.create_task(poll()))
+        else:
+            loop.add_reader(fd, on_events)
+        scan(catch_up=True)
+
+        try:
+            await stop.wait()
+        finally:
+            if fd is not None:
+                loop.remove_reader(fd)
+                os.close(fd)
+            # Finish the files already queued, then shut the workers down
+            await queue.join()
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+    return results
+
+# Print one line per watched file as it completes
+def print_result(result):
+    if result['Success']:
+        print(f"{result['File']} -> {result['Output']} ({result['Latency']:.2f}s)")
+    else:
+        print(f"Failed {result['File']}: {result['Error']}")
+
+# Drop-to-output latency percentiles over watch results, in seconds
+def latency_summary(results):
+    latencies = [result['Latency'] for result in results if result['Success']]
+    if not latencies:
+        return {'Files': 0}
+    return {
+        'Files': len(latencies),
+        'p50': float(np.percentile(latencies, 50)),
+        'p95': float(np.percentile(latencies, 95)),
+        'Max': max(latencies),
+    }
+
+# Watch until interrupted (Ctrl-C or SIGTERM), then print the latency summary
+def run_watch(input_dir, output_dir, **options):
+    async def main():
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, stop.set)
+        print(f"Watching {input_dir} -> {output_dir}")
+        return await watch(input_dir, output_dir, stop=stop, on_result=print_result, **options)
+
+    results = asyncio.run(main())
+    print(f"Latency: {latency_summary(results)}")
+    return results
+
+# Local test: copy `count` images from source_dir into a temporary watched folder, one every
+# `interval` seconds, and report drop-to-output latency once every output is in place
+def watch_test(source_dir, count=20, interval=0.5, workers=2, use_inotify=True, **options):
+    async def main():
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            input_dir, output_dir = os.path.join(tmp_dir, 'input'), os.path.join(tmp_dir, 'output')
+            os.makedirs(input_dir)
+            stop = asyncio.Event()
+            done = []
+            watcher = asyncio.create_task(watch(input_dir, output_dir, workers=workers, use_inotify=use_inotify,
+                                                stop=stop, on_result=done.append, **options))
+
+            file_names = list_images(source_dir)[:count]
+            for file_name in file_names:
+                await asyncio.to_thread(shutil.copy, os.path.join(source_dir, file_name), input_dir)
+                await asyncio.sleep(interval)
+            while len(done) < len(file_names) and not watcher.done():
+                await asyncio.sleep(0.05)
+
+            stop.set()
+            return await watcher
+
+    results = asyncio.run(main())
+    summary = latency_summary(results)
+    print(f"Watch test ({'inotify' if use_inotify else 'polling'}, {workers} workers, one file every {interval}s): "
+          f"{summary}")
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Resize images as they are dropped into a folder")
+    parser.add_argument('input_dir')
+    parser.add_argument('output_dir')
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--profile', default='default', choices=list(ENCODER_PROFILES))
+    parser.add_argument('--max-bytes', type=int)
+    parser.add_argument('--method', default='padding')
+    parser.add_argument('--poll', action='store_true', help="poll the folder instead of using inotify")
+    parser.add_argument('--poll-interval', type=float, default=POLL_INTERVAL)
+    args = parser.parse_args()
+
+    run_watch(args.input_dir, args.output_dir, workers=args.workers, profile=args.profile, max_bytes=args.max_bytes,
+              method=args.method, poll_interval=args.poll_interval, use_inotify=not args.poll)